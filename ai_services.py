@@ -1,21 +1,58 @@
 # ai_services.py
-import base64
+import asyncio
 import logging
-from typing import Optional, Tuple
+import random
+import time
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+import httpx  # Installed with google-genai, which uses it for transport
 
 # Use the google-genai library (google-generativeai is deprecated)
 from google import genai
-from google.genai import types as genai_types
-from PIL import Image
+from google.genai import errors as genai_errors, types as genai_types
 
+import aicache
+import aitelemetry
 import config
+import fakegenai
 import models
+import storage
+import styleref
 
 log = logging.getLogger(__name__)
 
 # --- Gemini Client Initialization ---
-client: Optional[genai.Client] = None  # Explicitly type hint
-if not config.GEMINI_API_KEY:
+
+
+def _fake_client() -> fakegenai.FakeClient:
+    """The offline backend, configured from config.FAKE_AI_*."""
+    return fakegenai.FakeClient(
+        text_latency=fakegenai.Latency(config.FAKE_AI_TEXT_LATENCY),
+        image_latency=fakegenai.Latency(config.FAKE_AI_IMAGE_LATENCY),
+        chunk_latency=fakegenai.Latency(config.FAKE_AI_CHUNK_LATENCY),
+        error_rate=config.FAKE_AI_ERROR_RATE,
+        error_codes=[
+            code if code == fakegenai.TIMEOUT else int(code)
+            for code in (c.strip().lower() for c in config.FAKE_AI_ERROR_CODES.split(","))
+            if code
+        ],
+        block_rate=config.FAKE_AI_BLOCK_RATE,
+        block_reasons=[r.strip() for r in config.FAKE_AI_BLOCK_REASONS.split(",") if r.strip()],
+        image_size=config.FAKE_AI_IMAGE_SIZE,
+        seed=int(config.FAKE_AI_SEED) if config.FAKE_AI_SEED else None,
+    )
+
+
+# genai.Client, or a FakeClient (same interface) with AI_BACKEND=fake
+client: Optional[Union[genai.Client, fakegenai.FakeClient]] = None
+if config.AI_BACKEND == "fake":
+    client = _fake_client()
+    log.warning(f"Using the fake AI backend, no Gemini calls will be made: {client!r}")
+elif config.AI_BACKEND != "gemini":
+    log.critical(f"Unknown AI_BACKEND '{config.AI_BACKEND}' (use 'gemini' or 'fake').")
+elif not config.GEMINI_API_KEY:
     log.critical("Gemini API Key not found in environment variables. AI services will fail.")
 else:
     try:
@@ -28,22 +65,267 @@ else:
         log.critical(f"Failed to initialize google-genai Client: {e}", exc_info=True)
         client = None
 
+# Decoded, downscaled and encoded once; reloaded only when the file changes
+style_reference = styleref.StyleReference(
+    config.STYLE_IMAGE_PATH, max_side=config.STYLE_IMAGE_MAX_SIDE
+)
 
-# --- AI Service Functions ---
 
+# --- AI Gateway ---
 
-async def generate_ai_description(
-    request_data: models.GenerateDescriptionRequest,
-) -> Tuple[str, Optional[str]]:
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RATE_LIMITED_MESSAGE = "AI service rate limit reached. Please try again in a minute."
+
+
+class AIServiceBusy(Exception):
+    """Raised when the gateway's wait queue is full; the caller should retry later."""
+
+
+def error_status(message: str) -> int:
+    """The HTTP status for an AI service error message: 400 blocked, 429 rate-limited, 500."""
+    if "blocked" in message.lower():
+        return 400  # Bad request due to content
+    if message == RATE_LIMITED_MESSAGE:
+        return 429  # Upstream limit, after retries
+    return 500  # Internal AI service error
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    return isinstance(error, genai_errors.APIError) and error.code == 429
+
+
+def error_outcome(error: BaseException) -> str:
+    """Telemetry outcome class of a failed call: rate_limited, timeout or error."""
+    if is_rate_limited(error):
+        return "rate_limited"
+    if isinstance(error, (TimeoutError, httpx.TimeoutException)) or (
+        isinstance(error, genai_errors.APIError) and error.code == 504
+    ):
+        return "timeout"
+    return "error"
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for rate limits (429), transient server errors (5xx) and network failures."""
+    if isinstance(error, genai_errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (ConnectionError, TimeoutError, httpx.TransportError))
+
+
+class _Flight:
+    """One upstream call, the telemetry of the caller that started it, and its waiters."""
+
+    __slots__ = ("task", "call", "waiters")
+
+    def __init__(self, task: "asyncio.Task[Any]", call: Optional[aitelemetry.AICall]):
+        self.task = task
+        self.call = call
+        self.waiters = 0
+
+
+def _record_flight(call: aitelemetry.AICall, task: "asyncio.Task[Any]") -> None:
     """
-    Generates an AI character description using Gemini (google-genai style).
-    Returns (status, description_or_error_message).
+    Done callback of a flight whose starting caller left: records the upstream call's
+    own outcome (the response is not classified further, as no caller is left to read it).
     """
-    if not client:  # Check if the client object was initialized
-        return "error", "AI Service not initialized (API key missing or configuration failed)."
+    if task.cancelled():
+        call.outcome = "cancelled"
+    elif task.exception() is not None:
+        error = task.exception()
+        call.outcome, call.error = error_outcome(error), type(error).__name__
+    else:
+        call.outcome, call.error = "success", None
+        call.add_response(task.result())
+    aitelemetry.finish(call)
 
-    log.info(f"Generating AI description for character: {request_data.name or 'Unnamed'}")
 
+class AIGateway:
+    """
+    Admission control for upstream AI calls (per worker process). At most
+    `max_concurrent` calls run at once and at most `max_queued` more wait for a slot;
+    beyond that, `call()` raises AIServiceBusy immediately. Concurrent calls with
+    the same key share one upstream call (single-flight). Retryable failures are
+    retried up to `max_retries` times with full-jitter exponential backoff, keeping
+    the slot so a rate-limited burst does not grow.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_queued: int,
+        max_retries: int,
+        retry_base_seconds: float,
+        retry_max_seconds: float,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self._semaphore: Optional[asyncio.Semaphore] = None  # Created on first use, in the loop
+        self._admitted = 0  # Upstream calls running or waiting for a slot
+        self._flights: Dict[str, _Flight] = {}
+
+    @property
+    def admitted(self) -> int:
+        return self._admitted
+
+    def backoff(self, attempt: int) -> float:
+        """Seconds to sleep before retry `attempt` (0-based): uniform in [0, base * 2**attempt]."""
+        return random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2**attempt))
+
+    def _admit(self, label: str, call: Optional[aitelemetry.AICall] = None) -> None:
+        """Counts a new upstream call in, or raises AIServiceBusy if the queue is full."""
+        if self._admitted >= self.max_concurrent + self.max_queued:
+            log.warning(f"{label} rejected: {self._admitted} AI calls already admitted.")
+            if call is not None:
+                call.outcome = "busy"
+            raise AIServiceBusy("The AI service is busy. Please try again shortly.")
+        self._admitted += 1
+
+    @asynccontextmanager
+    async def _held_slot(self, call: Optional[aitelemetry.AICall] = None) -> AsyncIterator[None]:
+        """Waits for a concurrency slot for an admitted call; counts it out on exit."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        waiting = time.monotonic()
+        try:
+            async with self._semaphore:
+                if call is not None:
+                    call.queue_seconds += time.monotonic() - waiting
+                yield
+        finally:
+            self._admitted -= 1
+
+    @asynccontextmanager
+    async def slot(
+        self, label: str = "AI call", call: Optional[aitelemetry.AICall] = None
+    ) -> AsyncIterator[None]:
+        """
+        Admission and a concurrency slot for a call the caller drives itself (a stream).
+        Raises AIServiceBusy on entry if the queue is full; no single-flight or retries.
+        """
+        self._admit(label, call)
+        async with self._held_slot(call):
+            yield
+
+    async def _run(
+        self,
+        make_call: Callable[[], Awaitable[Any]],
+        label: str,
+        call: Optional[aitelemetry.AICall],
+    ) -> Any:
+        async with self._held_slot(call):
+            attempt = 0
+            while True:
+                started = time.monotonic()
+                try:
+                    return await make_call()
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        raise
+                    delay = self.backoff(attempt)
+                    attempt += 1
+                    log.warning(
+                        f"{label} failed ({type(e).__name__}: {e}); "
+                        f"retry {attempt}/{self.max_retries} in {delay:.1f}s."
+                    )
+                    if call is not None:
+                        call.retry_wait_seconds += delay
+                finally:
+                    if call is not None:
+                        call.attempts += 1
+                        call.upstream_seconds += time.monotonic() - started
+                await asyncio.sleep(delay)  # After the attempt's upstream time is counted
+
+    async def call(
+        self,
+        key: Optional[str],
+        make_call: Callable[[], Awaitable[Any]],
+        label: str = "AI call",
+        call: Optional[aitelemetry.AICall] = None,
+    ) -> Any:
+        """
+        Runs `make_call()` (a coroutine factory, invoked once per attempt) under the
+        gateway's limits and returns its result. Callers passing the same non-None key
+        while a call is in flight await that call instead. The upstream call is
+        cancelled only when every caller awaiting it has been cancelled. `call` receives
+        queue wait, attempts and upstream time (or is marked shared or busy). If the caller
+        that started the upstream call is cancelled first, the flight records `call` when
+        it ends, so its full timing and outcome are not lost.
+        """
+        flight = self._flights.get(key) if key is not None else None
+        if flight is None:
+            self._admit(label, call)
+            flight = _Flight(asyncio.ensure_future(self._run(make_call, label, call)), call)
+            if key is not None:
+                self._flights[key] = flight
+                flight.task.add_done_callback(lambda _t: self._flights.pop(key, None))
+        else:
+            log.info(f"{label} joined an identical call already in flight.")
+            if call is not None:
+                call.shared = True
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done():
+                if flight.waiters == 1:
+                    flight.task.cancel()  # Nobody else wants the result
+                if call is not None and call is flight.call:
+                    # The upstream call is still running (or unwinding): record it when done
+                    call.hand_off()
+                    flight.task.add_done_callback(partial(_record_flight, call))
+            raise
+        finally:
+            flight.waiters -= 1
+
+
+gateway = AIGateway(
+    max_concurrent=config.AI_MAX_CONCURRENT,
+    max_queued=config.AI_MAX_QUEUED,
+    max_retries=config.AI_MAX_RETRIES,
+    retry_base_seconds=config.AI_RETRY_BASE_SECONDS,
+    retry_max_seconds=config.AI_RETRY_MAX_SECONDS,
+)
+
+
+# --- AI Service Functions ---
+
+
+DESCRIPTION_MODEL = "gemini-2.5-flash"  # Text model for descriptions (plain and streamed)
+IMAGE_MODEL = "gemini-2.0-flash-exp"  # Use the required model for image generation
+# Bump whenever the description prompt changes, so cached descriptions are not reused
+DESCRIPTION_PROMPT_VERSION = 1
+
+
+def description_cache_key(request_data: models.GenerateDescriptionRequest) -> str:
+    """Cache key of a description request: its normalized content plus the prompt version."""
+    return aicache.cache_key(
+        DESCRIPTION_PROMPT_VERSION,
+        (request_data.name or "").strip(),
+        request_data.character_type.value,
+        (request_data.base_animal_species or "").strip().casefold(),
+        request_data.attributes.model_dump(),
+        sorted(m.name for m in request_data.physical_mutations),
+        sorted(m.name for m in request_data.mental_mutations),
+    )
+
+
+async def _cached_description(
+    request_data: models.GenerateDescriptionRequest, cache_key: str
+) -> Optional[str]:
+    """The cached description for a request, unless it asks to bypass the cache."""
+    if request_data.bypass_cache:
+        return None
+    return aicache.description_cache.get_memory(cache_key) or await storage.run_io(
+        aicache.description_cache.get, cache_key
+    )
+
+
+def build_description_prompt(request_data: models.GenerateDescriptionRequest) -> str:
+    """The full description prompt for a character (template version DESCRIPTION_PROMPT_VERSION)."""
     # --- Construct Prompt ---
     prompt_parts = [
         "Generate a vivid and engaging character description for a Gamma World RPG character based on the provided details. Focus on physical appearance, demeanor, notable skills suggested by attribute scores, and any striking features or behaviors resulting from mutations. Integrate the context of the Gamma World setting (post-apocalyptic, mutated). Aim for approximately 2-4 paragraphs and only respond with the description.",
@@ -94,60 +376,198 @@ async def generate_ai_description(
             f"\n### World Setting (Gamma World Backstory):\n{config.BACKSTORY_CONTEXT_DATA}",
         ]
     )
-    constructed_prompt_string = "\n".join(prompt_parts)
+    return "\n".join(prompt_parts)
+
+
+async def generate_ai_description(
+    request_data: models.GenerateDescriptionRequest,
+) -> Tuple[str, Optional[str]]:
+    """
+    Generates an AI character description using Gemini (google-genai style), answering
+    from the description cache unless request_data.bypass_cache is set.
+    Returns (status, description_or_error_message).
+    """
+    cache_key = description_cache_key(request_data)
+    cached = await _cached_description(request_data, cache_key)
+    if cached is not None:
+        log.info(f"AI description for {request_data.name or 'Unnamed'} served from cache.")
+        return "success", cached
+
+    if not client:  # Check if the client object was initialized
+        return "error", "AI Service not initialized (API key missing or configuration failed)."
+
+    log.info(f"Generating AI description for character: {request_data.name or 'Unnamed'}")
+    constructed_prompt_string = build_description_prompt(request_data)
     log.debug(f"Constructed Description Prompt (start):\n{constructed_prompt_string[:600]}...")
 
     # --- Call Gemini API (Original Style) ---
-    try:
-        log.info("Sending description request to Gemini via client.aio.models...")
-        # Use the client object and the original call structure
-        response = await client.aio.models.generate_content(
-            model="gemini-2.5-flash",  # model name for text generation, try gemini-2.5-flash
-            contents=[constructed_prompt_string],
-            # No generation_config needed for text typically
-        )
-
-        # --- Process Response (Original Style) ---
-        if not response.candidates:
-            block_reason = "Unknown"
-            safety_ratings = "N/A"
-            try:
-                if response.prompt_feedback:
-                    block_reason = response.prompt_feedback.block_reason or "Not specified"
-                    safety_ratings = str(
-                        response.prompt_feedback.safety_ratings or "N/A"
-                    )  # Convert ratings to string
-            except Exception:
-                pass
-            log.error(
-                f"Gemini description response blocked. Reason: {block_reason}, Safety Ratings: {safety_ratings}"
+    with aitelemetry.record("description", DESCRIPTION_MODEL) as call:
+        call.add_prompt([constructed_prompt_string])
+        try:
+            log.info("Sending description request to Gemini via client.aio.models...")
+            # Through the gateway: identical concurrent requests share this call
+            response = await gateway.call(
+                cache_key,
+                lambda: client.aio.models.generate_content(
+                    model=DESCRIPTION_MODEL,
+                    contents=[constructed_prompt_string],
+                    # No generation_config needed for text typically
+                ),
+                label="Description request",
+                call=call,
             )
+            call.add_response(response)
+
+            # --- Process Response (Original Style) ---
+            if not response.candidates:
+                block_reason = "Unknown"
+                safety_ratings = "N/A"
+                try:
+                    if response.prompt_feedback:
+                        block_reason = response.prompt_feedback.block_reason or "Not specified"
+                        safety_ratings = str(
+                            response.prompt_feedback.safety_ratings or "N/A"
+                        )  # Convert ratings to string
+                except Exception:
+                    pass
+                log.error(
+                    f"Gemini description response blocked. Reason: {block_reason}, Safety Ratings: {safety_ratings}"
+                )
+                call.outcome, call.error = "blocked", str(block_reason)
+                return (
+                    "error",
+                    f"AI generation failed: Response blocked (Reason: {block_reason}). Please adjust character details or try again.",
+                )
+
+            # Access text safely via response.text
+            generated_text = response.text.strip()
+            log.info("AI description generated successfully.")
+            call.outcome = "success"
+            await storage.run_io(aicache.description_cache.put, cache_key, generated_text)
+            return "success", generated_text
+
+        except AIServiceBusy:
+            raise  # Mapped to 503 by the route
+        except Exception as e:
+            log.error(f"Error during description generation call: {e}", exc_info=True)
+            call.outcome, call.error = error_outcome(e), type(e).__name__
+            if is_rate_limited(e):
+                return "error", RATE_LIMITED_MESSAGE
+            # Provide a generic but informative error message
             return (
                 "error",
-                f"AI generation failed: Response blocked (Reason: {block_reason}). Please adjust character details or try again.",
+                f"AI generation failed due to an error: {type(e).__name__}. Please check logs.",
             )
 
-        # Access text safely via response.text
-        generated_text = response.text
-        log.info("AI description generated successfully.")
-        return "success", generated_text.strip()
 
-    # Use generic Exception handling as specific google-genai errors aren't known/imported
-    except Exception as e:
-        log.error(f"Error during description generation call: {e}", exc_info=True)
-        # Provide a generic but informative error message
-        return (
-            "error",
-            f"AI generation failed due to an error: {type(e).__name__}. Please check logs.",
-        )
+def _block_reason(response: Any) -> str:
+    """The prompt_feedback block reason of a response without candidates."""
+    try:
+        if response.prompt_feedback:
+            return str(response.prompt_feedback.block_reason or "Not specified")
+    except Exception:
+        pass
+    return "Unknown"
+
+
+async def stream_ai_description(
+    request_data: models.GenerateDescriptionRequest,
+) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Streams a description as ("chunk", text) events, then ("done", full_text) or
+    ("error", message). A cached description arrives as a single chunk. Raises
+    AIServiceBusy before the first event if the gateway is full. Failures before the
+    first chunk are retried like gateway calls. Closing or cancelling the generator
+    (the client went away) closes the upstream stream; completed text is cached.
+    """
+    cache_key = description_cache_key(request_data)
+    cached = await _cached_description(request_data, cache_key)
+    if cached is not None:
+        log.info(f"AI description for {request_data.name or 'Unnamed'} served from cache.")
+        yield "chunk", cached
+        yield "done", cached
+        return
+    if not client:
+        yield "error", "AI Service not initialized (API key missing or configuration failed)."
+        return
+
+    log.info(f"Streaming AI description for character: {request_data.name or 'Unnamed'}")
+    prompt = build_description_prompt(request_data)
+    parts: List[str] = []
+    with aitelemetry.record("description_stream", DESCRIPTION_MODEL) as call:
+        call.add_prompt([prompt])
+        async with gateway.slot("Description stream", call=call):
+            attempt = 0
+            while True:
+                stream = None
+                started = time.monotonic()
+                call.attempts += 1
+                try:
+                    stream = await client.aio.models.generate_content_stream(
+                        model=DESCRIPTION_MODEL, contents=[prompt]
+                    )
+                    async for chunk in stream:
+                        call.add_response(chunk)
+                        if not chunk.candidates:
+                            if parts:
+                                continue  # e.g. a trailing usage-only chunk
+                            reason = _block_reason(chunk)
+                            log.error(f"Gemini description stream blocked. Reason: {reason}")
+                            call.outcome, call.error = "blocked", reason
+                            yield (
+                                "error",
+                                f"AI generation failed: Response blocked (Reason: {reason}). Please adjust character details or try again.",
+                            )
+                            return
+                        if chunk.text:
+                            if not parts:
+                                call.first_chunk_seconds = time.monotonic() - started
+                            parts.append(chunk.text)
+                            yield "chunk", chunk.text
+                    break
+                except Exception as e:
+                    if parts or attempt >= gateway.max_retries or not is_retryable(e):
+                        log.error(f"Error during description stream: {e}", exc_info=True)
+                        call.outcome, call.error = error_outcome(e), type(e).__name__
+                        if is_rate_limited(e):
+                            yield "error", RATE_LIMITED_MESSAGE
+                        else:
+                            yield (
+                                "error",
+                                f"AI generation failed due to an error: {type(e).__name__}. Please check logs.",
+                            )
+                        return
+                    delay = gateway.backoff(attempt)
+                    attempt += 1
+                    log.warning(
+                        f"Description stream failed ({type(e).__name__}: {e}); "
+                        f"retry {attempt}/{gateway.max_retries} in {delay:.1f}s."
+                    )
+                    call.retry_wait_seconds += delay
+                finally:
+                    call.upstream_seconds += time.monotonic() - started
+                    if stream is not None and hasattr(stream, "aclose"):
+                        await stream.aclose()  # Ends the upstream HTTP stream if we stopped early
+                await asyncio.sleep(delay)  # Only reached to retry; not upstream time
+
+        generated_text = "".join(parts).strip()
+        if not generated_text:
+            call.error = "No text in response"
+            yield "error", "AI generation failed: No text received from the model."
+            return
+        log.info("AI description streamed successfully.")
+        call.outcome = "success"
+        await storage.run_io(aicache.description_cache.put, cache_key, generated_text)
+        yield "done", generated_text
 
 
 async def generate_ai_image(
     request_data: models.GenerateImageRequest,
-) -> Tuple[str, Optional[str], Optional[str]]:
+) -> Tuple[str, Union[bytes, str], Optional[str]]:
     """
     Generates a character image using Gemini based on a description (google-genai style).
-    Returns (status, base64_image_or_error_message, mime_type).
+    Returns (status, image_bytes_or_error_message, mime_type); callers hold the bytes
+    in imagestore rather than shipping them around as base64.
     """
     if not client:  # Check if the client object was initialized
         return (
@@ -167,105 +587,109 @@ async def generate_ai_image(
     )
     log.debug(f"Image Generation Prompt (start): {prompt[:200]}...")
 
-    # Load reference image
-    style_image = None
-    try:
-        if config.STYLE_IMAGE_PATH.exists():
-            style_image = Image.open(config.STYLE_IMAGE_PATH)
-            log.info(f"Loaded style image from {config.STYLE_IMAGE_PATH}")
-        else:
-            log.warning(
-                f"Style image not found at {config.STYLE_IMAGE_PATH}. Proceeding without style reference."
-            )
-    except Exception as e:
-        log.warning(
-            f"Could not load style image '{config.STYLE_IMAGE_PATH}': {e}. Proceeding without it."
-        )
+    # Shared, pre-encoded reference (a stat() per request; re-encoded only if the file changed)
+    style_image = await storage.run_io(style_reference.part)
 
     # --- Call Gemini Image Generation API ---
-    try:
-        log.info("Sending image generation request to Gemini via client.aio.models...")
-        contents = [prompt]
-        if style_image:
-            contents.append(style_image)
-        else:
-            contents.append("no attached image")  # Match original logic
-
-        # Use the client object and the original call structure
-        response = await client.aio.models.generate_content(
-            model="gemini-2.0-flash-exp",  # Use the required model for image generation
-            contents=contents,
-            config=genai_types.GenerateContentConfig(
-                response_modalities=["TEXT", "IMAGE"]  # Must have both modalities
-            ),
-        )
+    with aitelemetry.record("image", IMAGE_MODEL) as call:
+        try:
+            log.info("Sending image generation request to Gemini via client.aio.models...")
+            contents = [prompt]
+            if style_image:
+                contents.append(style_image)
+            else:
+                contents.append("no attached image")  # Match original logic
+            call.add_prompt(contents)
 
-        # --- Process Response ---
-        if not response.candidates:
-            block_reason = "Unknown"
-            safety_ratings = "N/A"
-            try:
-                if response.prompt_feedback:
-                    block_reason = response.prompt_feedback.block_reason or "Not specified"
-                    safety_ratings = str(
-                        response.prompt_feedback.safety_ratings or "N/A"
-                    )  # Convert ratings to string
-            except Exception:
-                pass
-            log.error(
-                f"Gemini image response blocked. Reason: {block_reason}, Safety Ratings: {safety_ratings}"
-            )
-            return (
-                "error",
-                f"AI image generation failed: Response blocked (Reason: {block_reason}).",
-                None,
+            # Through the gateway: identical concurrent requests share this call
+            response = await gateway.call(
+                aicache.cache_key("image", request_data.description),
+                lambda: client.aio.models.generate_content(
+                    model=IMAGE_MODEL,
+                    contents=contents,
+                    config=genai_types.GenerateContentConfig(
+                        response_modalities=["TEXT", "IMAGE"]  # Must have both modalities
+                    ),
+                ),
+                label="Image request",
+                call=call,
             )
+            call.add_response(response)
 
-        # Find the image part by checking part.inline_data
-        image_part = None
-        text_response = ""
-        for part in response.candidates[0].content.parts:
-            # Check specifically for inline_data
-            if (
-                hasattr(part, "inline_data")
-                and part.inline_data is not None
-                and part.inline_data.data
-            ):
-                image_part = part.inline_data  # Store the inline_data object
-                break
-            elif hasattr(part, "text"):
-                text_response += part.text + " "
-
-        if image_part:  # Check if inline_data object was found
-            mime_type = image_part.mime_type
-            image_bytes = image_part.data
-
-            # Encode the raw bytes as base64
-            base64_image = base64.b64encode(image_bytes).decode("utf-8")
-            log.info(
-                f"AI image generated successfully (MIME type: {mime_type}, Size: {len(image_bytes)} bytes)."
-            )
-            return "success", base64_image, mime_type
-        else:
-            # Check if there was text instead
-            if text_response.strip():
-                log.error(f"Gemini returned text instead of image: {text_response.strip()}")
+            # --- Process Response ---
+            if not response.candidates:
+                block_reason = "Unknown"
+                safety_ratings = "N/A"
+                try:
+                    if response.prompt_feedback:
+                        block_reason = response.prompt_feedback.block_reason or "Not specified"
+                        safety_ratings = str(
+                            response.prompt_feedback.safety_ratings or "N/A"
+                        )  # Convert ratings to string
+                except Exception:
+                    pass
+                log.error(
+                    f"Gemini image response blocked. Reason: {block_reason}, Safety Ratings: {safety_ratings}"
+                )
+                call.outcome, call.error = "blocked", str(block_reason)
                 return (
                     "error",
-                    f"AI model returned text instead of an image: {text_response.strip()}",
+                    f"AI image generation failed: Response blocked (Reason: {block_reason}).",
                     None,
                 )
-            else:
-                log.error(
-                    "Gemini response did not contain image data in expected inline_data format."
+
+            # Find the image part by checking part.inline_data
+            image_part = None
+            text_response = ""
+            for part in response.candidates[0].content.parts:
+                # Check specifically for inline_data
+                if (
+                    hasattr(part, "inline_data")
+                    and part.inline_data is not None
+                    and part.inline_data.data
+                ):
+                    image_part = part.inline_data  # Store the inline_data object
+                    break
+                elif hasattr(part, "text"):
+                    text_response += part.text + " "
+
+            if image_part:  # Check if inline_data object was found
+                mime_type = image_part.mime_type
+                image_bytes = image_part.data
+                log.info(
+                    f"AI image generated successfully (MIME type: {mime_type}, Size: {len(image_bytes)} bytes)."
                 )
-                return "error", "AI generation failed: No image data received from the model.", None
+                call.outcome = "success"
+                return "success", image_bytes, mime_type
+            else:
+                call.error = "No image in response"
+                # Check if there was text instead
+                if text_response.strip():
+                    log.error(f"Gemini returned text instead of image: {text_response.strip()}")
+                    return (
+                        "error",
+                        f"AI model returned text instead of an image: {text_response.strip()}",
+                        None,
+                    )
+                else:
+                    log.error(
+                        "Gemini response did not contain image data in expected inline_data format."
+                    )
+                    return (
+                        "error",
+                        "AI generation failed: No image data received from the model.",
+                        None,
+                    )
 
-    # Use generic Exception handling
-    except Exception as e:
-        log.error(f"Error during image generation call: {e}", exc_info=True)
-        return (
-            "error",
-            f"AI image generation failed due to an error: {type(e).__name__}. Please check logs.",
-            None,
-        )
+        except AIServiceBusy:
+            raise  # Mapped to 503 by the route
+        except Exception as e:
+            log.error(f"Error during image generation call: {e}", exc_info=True)
+            call.outcome, call.error = error_outcome(e), type(e).__name__
+            if is_rate_limited(e):
+                return "error", RATE_LIMITED_MESSAGE, None
+            return (
+                "error",
+                f"AI image generation failed due to an error: {type(e).__name__}. Please check logs.",
+                None,
+            )
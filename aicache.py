@@ -0,0 +1,161 @@
+# aicache.py
+"""
+Two-tier cache for AI results: an in-memory LRU in front of a SQLite store.
+
+Entries expire after a TTL and each tier is bounded (least recently used entries are
+evicted first). The SQLite file is shared by all worker processes and survives
+restarts; every disk operation opens its own short-lived connection, so the blocking
+methods can be called from any thread (run them via storage.run_io).
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+import config
+
+log = logging.getLogger(__name__)
+
+
+def cache_key(*parts: Any) -> str:
+    """Stable sha256 key of JSON-serialisable parts (dict keys sorted)."""
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class TwoTierCache:
+    """String values by key, with per-tier size limits and a shared TTL."""
+
+    def __init__(
+        self,
+        table: str,
+        path: Path,
+        memory_entries: int,
+        disk_entries: int,
+        ttl_seconds: float,
+    ):
+        self.table = table  # Trusted identifier (module constant), not user input
+        self.path = path
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl_seconds = ttl_seconds
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = (
+            OrderedDict()
+        )  # key -> (created, value)
+        self._lock = threading.Lock()  # The memory tier is shared by the loop and I/O threads
+        self._initialised = False
+
+    # --- Memory Tier (event-loop safe) ---
+
+    def get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is None:
+                return None
+            created, value = cached
+            if time.time() - created > self.ttl_seconds:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _remember(self, key: str, value: str, created: float) -> None:
+        with self._lock:
+            self._memory[key] = (created, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    # --- Disk Tier (blocking) ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialised:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=10)
+        if not self._initialised:
+            db.execute("PRAGMA journal_mode=WAL")  # Readers in other workers never block
+            db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, "
+                "accessed REAL NOT NULL)"
+            )
+            db.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed)"
+            )
+            db.commit()
+            self._initialised = True
+        return db
+
+    def get(self, key: str) -> Optional[str]:
+        """Memory first, then disk (promoting the hit into memory). Blocking on a miss."""
+        value = self.get_memory(key)
+        if value is not None:
+            return value
+        try:
+            with closing(self._connect()) as db:
+                row = db.execute(
+                    f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                value, created = row
+                now = time.time()
+                if now - created > self.ttl_seconds:
+                    db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    db.commit()
+                    return None
+                db.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+                db.commit()
+        except sqlite3.Error as e:
+            log.warning(f"AI cache read from {self.path} failed: {e}")
+            return None
+        self._remember(key, value, created)
+        return value
+
+    def put(self, key: str, value: str) -> None:
+        """Stores in both tiers and evicts expired and least recently used rows. Blocking."""
+        now = time.time()
+        self._remember(key, value, now)
+        try:
+            with closing(self._connect()) as db:
+                db.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, created, accessed) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                db.execute(f"DELETE FROM {self.table} WHERE created < ?", (now - self.ttl_seconds,))
+                db.execute(
+                    f"DELETE FROM {self.table} WHERE key NOT IN "
+                    f"(SELECT key FROM {self.table} ORDER BY accessed DESC LIMIT ?)",
+                    (self.disk_entries,),
+                )
+                db.commit()
+        except sqlite3.Error as e:
+            log.warning(f"AI cache write to {self.path} failed: {e}")  # Memory tier still has it
+
+    def clear(self) -> None:
+        """Empties both tiers. Blocking."""
+        with self._lock:
+            self._memory.clear()
+        try:
+            with closing(self._connect()) as db:
+                db.execute(f"DELETE FROM {self.table}")
+                db.commit()
+        except sqlite3.Error as e:
+            log.warning(f"AI cache clear of {self.path} failed: {e}")
+
+
+description_cache = TwoTierCache(
+    "descriptions",
+    config.AI_CACHE_FILE,
+    memory_entries=config.AI_CACHE_MEMORY_ENTRIES,
+    disk_entries=config.AI_CACHE_DISK_ENTRIES,
+    ttl_seconds=config.AI_CACHE_TTL_SECONDS,
+)
@@ -0,0 +1,322 @@
+# aitelemetry.py
+"""
+Telemetry for upstream AI model calls (per worker process).
+
+ai_services wraps every model call in `record()`, which yields an AICall to fill
+in: the gateway adds queue wait, attempts and upstream time, and the caller adds
+prompt size, the response's token counts, text and image sizes and the outcome.
+Finished calls feed cumulative counters (`metrics_text()`, Prometheus text format)
+and a rolling window of the last config.AI_TELEMETRY_MAX_CALLS calls within
+config.AI_TELEMETRY_WINDOW_SECONDS (`summary()`). Cache hits are not model calls
+and are not recorded; callers that joined an identical call in flight are only
+counted (`shared`), since the call they shared is recorded once. If the caller that
+started a shared call goes away first, its AICall is handed off to the gateway,
+which records it with `finish()` when the upstream call ends.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+import config
+import models
+
+log = logging.getLogger(__name__)
+
+# Upstream outcomes, plus "busy" (rejected by the gateway queue) and "cancelled"
+OUTCOMES = ("success", "blocked", "rate_limited", "timeout", "error", "busy", "cancelled")
+# Upper bounds (seconds) of the call duration histogram buckets
+DURATION_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+class AICall:
+    """What one model call did; filled in while it runs, then recorded."""
+
+    def __init__(self, operation: str, model: str):
+        self.operation = operation
+        self.model = model
+        self.started = time.time()
+        self._start = time.monotonic()
+        self.outcome: Optional[str] = None
+        self.error: Optional[str] = None  # Exception type or block reason
+        self.shared = False  # Joined an identical call in flight (not an upstream call itself)
+        self.attempts = 0
+        self.queue_seconds = 0.0  # Waiting for a gateway slot
+        self.upstream_seconds = 0.0  # Inside upstream requests, over all attempts
+        self.retry_wait_seconds = 0.0  # Backing off between attempts
+        self.first_chunk_seconds: Optional[float] = None  # Streams: request to first chunk
+        self.total_seconds = 0.0
+        self.prompt_bytes = 0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self.total_tokens = 0
+        self.response_bytes = 0  # Text
+        self.image_bytes = 0
+        self.mime_type: Optional[str] = None
+        self._handed_off = False
+
+    def hand_off(self) -> None:
+        """The call outlives the `record()` block that opened it; its holder calls finish()."""
+        self._handed_off = True
+
+    def add_prompt(self, contents: List[Any]) -> None:
+        """Counts the request's text and inline data (e.g. the style image)."""
+        for item in contents:
+            if isinstance(item, str):
+                self.prompt_bytes += len(item.encode("utf-8"))
+            else:
+                blob = getattr(item, "inline_data", None)
+                self.prompt_bytes += len(getattr(blob, "data", None) or b"")
+
+    def add_response(self, response: Any) -> None:
+        """
+        Counts a response (or stream chunk): text and image sizes, and token counts from
+        its usage metadata (streams repeat the running totals, so the last one wins).
+        """
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self.prompt_tokens = usage.prompt_token_count or self.prompt_tokens
+            self.response_tokens = usage.candidates_token_count or self.response_tokens
+            self.total_tokens = usage.total_token_count or self.total_tokens
+        for candidate in getattr(response, "candidates", None) or []:
+            content = getattr(candidate, "content", None)
+            for part in getattr(content, "parts", None) or []:
+                blob = getattr(part, "inline_data", None)
+                if blob is not None and blob.data:
+                    self.image_bytes += len(blob.data)
+                    self.mime_type = blob.mime_type
+                elif getattr(part, "text", None):
+                    self.response_bytes += len(part.text.encode("utf-8"))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {key: value for key, value in vars(self).items() if not key.startswith("_")}
+
+
+class Telemetry:
+    """Cumulative counters for metrics plus a bounded window of recent calls."""
+
+    def __init__(self, max_calls: int, window_seconds: int):
+        self.window_seconds = window_seconds
+        self.since = time.time()
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=max_calls)
+        self._calls: Counter = Counter()  # (operation, outcome) -> calls
+        self._shared: Counter = Counter()  # operation -> joined callers
+        self._sums: Dict[Tuple[str, str], float] = Counter()  # (operation, field) -> total
+        self._buckets: Counter = Counter()  # (operation, bucket index) -> calls
+        self._images: Counter = Counter()  # (operation, mime type) -> images
+
+    def add(self, call: AICall) -> None:
+        if call.shared:
+            self._shared[call.operation] += 1
+            return
+        op = call.operation
+        self._calls[op, call.outcome] += 1
+        for field in (
+            "attempts",
+            "queue_seconds",
+            "upstream_seconds",
+            "total_seconds",
+            "prompt_bytes",
+            "prompt_tokens",
+            "response_tokens",
+            "total_tokens",
+            "response_bytes",
+            "image_bytes",
+        ):
+            self._sums[op, field] += getattr(call, field)
+        bucket = next(
+            (i for i, bound in enumerate(DURATION_BUCKETS) if call.total_seconds <= bound),
+            len(DURATION_BUCKETS),
+        )
+        self._buckets[op, bucket] += 1
+        if call.mime_type:
+            self._images[op, call.mime_type] += 1
+        self._recent.append(call.as_dict())
+
+    # --- Rolling Summary ---
+
+    def summary(self) -> models.AITelemetrySummary:
+        cutoff = time.time() - self.window_seconds
+        recent = [call for call in self._recent if call["started"] >= cutoff]
+        by_operation: Dict[str, List[Dict[str, Any]]] = {}
+        for call in recent:
+            by_operation.setdefault(call["operation"], []).append(call)
+        failures = [call for call in recent if call["outcome"] != "success"]
+        return models.AITelemetrySummary(
+            window_seconds=self.window_seconds,
+            since=self.since,
+            calls=len(recent),
+            operations={op: _operation_summary(calls) for op, calls in by_operation.items()},
+            shared_calls=dict(self._shared),
+            recent_failures=[
+                models.AICallFailure(
+                    started=call["started"],
+                    operation=call["operation"],
+                    outcome=call["outcome"],
+                    error=call["error"],
+                    attempts=call["attempts"],
+                    total_seconds=round(call["total_seconds"], 3),
+                )
+                for call in failures[-10:]
+            ],
+        )
+
+    # --- Metrics (Prometheus text format) ---
+
+    def metrics_text(self, gauges: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+        """Cumulative counters and histograms, plus `gauges` (name -> (help, value))."""
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[Tuple[str, float]]):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{labels} {_number(value)}" for labels, value in samples)
+
+        operations = sorted({op for op, _ in self._calls} | set(self._shared))
+        metric(
+            "ai_calls_total",
+            "counter",
+            "Upstream AI model calls by outcome.",
+            [
+                (f'{{operation="{op}",outcome="{outcome}"}}', count)
+                for (op, outcome), count in sorted(self._calls.items())
+            ],
+        )
+        metric(
+            "ai_shared_calls_total",
+            "counter",
+            "Callers served by an identical call already in flight.",
+            [(f'{{operation="{op}"}}', self._shared[op]) for op in operations],
+        )
+        histogram: List[Tuple[str, float]] = []
+        for op in operations:
+            cumulative = 0
+            for i, bound in enumerate(DURATION_BUCKETS + (math.inf,)):
+                cumulative += self._buckets[op, i]
+                le = "+Inf" if bound == math.inf else _number(bound)
+                histogram.append((f'_bucket{{operation="{op}",le="{le}"}}', cumulative))
+            histogram.append((f'_sum{{operation="{op}"}}', self._sums[op, "total_seconds"]))
+            histogram.append((f'_count{{operation="{op}"}}', cumulative))
+        lines.append("# HELP ai_call_duration_seconds Wall time of AI calls, queueing included.")
+        lines.append("# TYPE ai_call_duration_seconds histogram")
+        lines.extend(f"ai_call_duration_seconds{suffix} {_number(v)}" for suffix, v in histogram)
+        for field, name, help_text in (
+            ("queue_seconds", "ai_queue_seconds_total", "Time spent waiting for a gateway slot."),
+            ("upstream_seconds", "ai_upstream_seconds_total", "Time spent in upstream requests."),
+            ("attempts", "ai_attempts_total", "Upstream requests made, retries included."),
+            ("prompt_bytes", "ai_prompt_bytes_total", "Request text and inline data sent."),
+            ("response_bytes", "ai_response_bytes_total", "Response text received."),
+            ("image_bytes", "ai_image_bytes_total", "Image data received."),
+        ):
+            metric(
+                name,
+                "counter",
+                help_text,
+                [(f'{{operation="{op}"}}', self._sums[op, field]) for op in operations],
+            )
+        metric(
+            "ai_tokens_total",
+            "counter",
+            "Tokens reported in response usage metadata.",
+            [
+                (f'{{operation="{op}",kind="{kind}"}}', self._sums[op, f"{kind}_tokens"])
+                for op in operations
+                for kind in ("prompt", "response")
+            ],
+        )
+        metric(
+            "ai_images_total",
+            "counter",
+            "Images received by MIME type.",
+            [
+                (f'{{operation="{op}",mime_type="{mime}"}}', count)
+                for (op, mime), count in sorted(self._images.items())
+            ],
+        )
+        for name, (help_text, value) in (gauges or {}).items():
+            metric(name, "gauge", help_text, [("", value)])
+        return "\n".join(lines) + "\n"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else f"{value:.6g}"
+
+
+def _latency(values: List[float]) -> models.LatencyStats:
+    """Nearest-rank percentiles of a list of durations."""
+    if not values:
+        return models.LatencyStats()
+    ordered = sorted(values)
+
+    def rank(q: float) -> float:
+        return round(ordered[max(0, math.ceil(q * len(ordered)) - 1)], 3)
+
+    return models.LatencyStats(p50=rank(0.5), p90=rank(0.9), p99=rank(0.99), max=rank(1.0))
+
+
+def _operation_summary(calls: List[Dict[str, Any]]) -> models.AIOperationSummary:
+    def total(field: str) -> int:
+        return sum(call[field] for call in calls)
+
+    first_chunks = [c["first_chunk_seconds"] for c in calls if c["first_chunk_seconds"] is not None]
+    return models.AIOperationSummary(
+        calls=len(calls),
+        outcomes=dict(Counter(call["outcome"] for call in calls)),
+        models=dict(Counter(call["model"] for call in calls)),
+        attempts=total("attempts"),
+        queue_seconds=_latency([call["queue_seconds"] for call in calls]),
+        upstream_seconds=_latency([call["upstream_seconds"] for call in calls]),
+        total_seconds=_latency([call["total_seconds"] for call in calls]),
+        first_chunk_seconds=_latency(first_chunks) if first_chunks else None,
+        prompt_bytes=total("prompt_bytes"),
+        response_bytes=total("response_bytes"),
+        image_bytes=total("image_bytes"),
+        prompt_tokens=total("prompt_tokens"),
+        response_tokens=total("response_tokens"),
+        total_tokens=total("total_tokens"),
+        mime_types=dict(Counter(call["mime_type"] for call in calls if call["mime_type"])),
+    )
+
+
+telemetry = Telemetry(config.AI_TELEMETRY_MAX_CALLS, config.AI_TELEMETRY_WINDOW_SECONDS)
+
+
+@contextmanager
+def record(operation: str, model: str) -> Iterator[AICall]:
+    """
+    Times a model call and records it on exit. The caller sets `outcome`; a block left
+    by cancellation (or a closed stream) is recorded as cancelled, any other exception
+    without an outcome as an error.
+    """
+    call = AICall(operation, model)
+    try:
+        yield call
+    except (asyncio.CancelledError, GeneratorExit):
+        if call.outcome is None:  # Not when a stream's consumer stops after its last event
+            call.outcome = "cancelled"
+        raise
+    except BaseException as e:
+        if call.outcome is None:
+            call.outcome, call.error = "error", type(e).__name__
+        raise
+    finally:
+        if not call._handed_off:
+            finish(call)
+
+
+def finish(call: AICall) -> None:
+    """Stamps a call's total time and records it (an unset outcome counts as an error)."""
+    call.total_seconds = time.monotonic() - call._start
+    if call.outcome is None:
+        call.outcome = "error"
+    telemetry.add(call)
+    if not call.shared:
+        log.debug(
+            f"AI call {call.operation}: {call.outcome} in {call.total_seconds:.2f}s "
+            f"(queue {call.queue_seconds:.2f}s, upstream {call.upstream_seconds:.2f}s, "
+            f"{call.attempts} attempts, {call.total_tokens} tokens)"
+        )
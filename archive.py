@@ -0,0 +1,280 @@
+# archive.py
+import asyncio
+import io
+import json
+import logging
+import os
+import re
+import tarfile
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+import charfile
+import config
+import imaging
+import models
+import paths
+import storage
+import utils
+
+log = logging.getLogger(__name__)
+
+# --- Constants ---
+ARCHIVE_CHUNK_SIZE = 64 * 1024  # Bytes per chunk when streaming file contents
+MAX_IMPORT_JSON_BYTES = 1024 * 1024  # Larger character files are rejected on import
+INDEX_ARCNAME = "index.json"
+MEMBER_RE = re.compile(r"^(?:\./)?(characters|images)/([^/]+)\.(json|png)$")
+
+# Archive layout (plain tar, PNGs are already compressed):
+# Member names are flat regardless of the on-disk shard layout (see paths.py).
+#   index.json                 - copy of characters/index.json (saved times, informational)
+#   images/<id>.png            - optional portrait, always BEFORE its JSON
+#   characters/<id>.json       - character data; its arrival commits the pair on import
+
+
+# --- Export ---
+
+
+def _library_members() -> Iterator[Tuple[str, Path]]:
+    """Yields (arcname, path) for every file in the library, in archive order."""
+    if config.INDEX_FILE.exists():
+        yield INDEX_ARCNAME, config.INDEX_FILE
+    for char_id, json_path in paths.iter_character_files():
+        image_path = paths.find_character_image(char_id)
+        if image_path is not None:
+            yield f"images/{char_id}.png", image_path
+        yield f"characters/{char_id}.json", json_path
+
+
+def iter_library_archive() -> Iterator[bytes]:
+    """
+    Streams the character library as an uncompressed tar archive.
+    Headers are built with TarInfo.tobuf() and file contents are read in
+    ARCHIVE_CHUNK_SIZE pieces, so memory use does not grow with library or file size.
+    """
+    for arcname, path in _library_members():
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            continue  # No image for this character, or deleted since the listing
+        with f:
+            st = os.fstat(f.fileno())
+            info = tarfile.TarInfo(arcname)
+            info.size = st.st_size
+            info.mtime = int(st.st_mtime)
+            info.mode = 0o644
+            yield info.tobuf(tarfile.PAX_FORMAT)
+
+            # Files are replaced by rename, never rewritten, so the open handle stays consistent
+            remaining = info.size
+            while remaining > 0:
+                chunk = f.read(min(ARCHIVE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise IOError(f"{path} was truncated during export")
+                remaining -= len(chunk)
+                yield chunk
+            padding = -info.size % tarfile.BLOCKSIZE
+            if padding:
+                yield tarfile.NUL * padding
+    yield tarfile.NUL * (2 * tarfile.BLOCKSIZE)  # End-of-archive marker
+    log.info("Library export stream completed.")
+
+
+# --- Import ---
+
+
+class AsyncStreamReader(io.RawIOBase):
+    """
+    Blocking, read-only file object over an async byte iterator (e.g. request.stream()).
+    Meant to be read from a worker thread; each read pulls one chunk from the event
+    loop, so only a single chunk is ever buffered.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes], loop: asyncio.AbstractEventLoop):
+        self._chunks = chunks
+        self._loop = loop
+        self._buffer = b""
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    async def _next_chunk(self) -> Optional[bytes]:
+        try:
+            return await anext(self._chunks)
+        except StopAsyncIteration:
+            return None
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            if self._eof:
+                return 0
+            chunk = asyncio.run_coroutine_threadsafe(self._next_chunk(), self._loop).result()
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer = chunk
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+def _read_member_chunks(fileobj, limit: int) -> Iterator[bytes]:
+    """Yields a tar member's data in chunks, raising ValueError past limit bytes."""
+    total = 0
+    while True:
+        chunk = fileobj.read(ARCHIVE_CHUNK_SIZE)
+        if not chunk:
+            return
+        total += len(chunk)
+        if total > limit:
+            raise ValueError(f"member exceeds {limit // 1024} KB limit")
+        yield chunk
+
+
+def import_library(
+    fileobj,
+    on_conflict: models.ImportConflictPolicy = models.ImportConflictPolicy.SKIP,
+) -> models.ImportLibraryResponse:
+    """
+    Ingests a tar (optionally gzip'd) library archive read sequentially from fileobj.
+    Every character JSON (either on-disk format) is validated against models.Character and committed together
+    with its image; the index is rebuilt once at the end. Blocking: run via storage.run_io.
+    """
+    report = models.ImportLibraryResponse()
+    saved_hints: Dict[str, int] = {}  # Final ID -> saved time from the archive's index.json
+    archive_saved: Dict[str, int] = {}  # Archive ID -> saved time
+    pending_images: Dict[str, Path] = {}  # Archive ID -> staged temp file awaiting its JSON
+
+    try:
+        with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                if member.name.removeprefix("./") == INDEX_ARCNAME:
+                    archive_saved = _read_archive_index(tar.extractfile(member))
+                    continue
+                match = MEMBER_RE.match(member.name)
+                if not match or not utils.is_valid_character_id(match.group(2)):
+                    report.skipped.append(member.name)
+                    continue
+                kind, char_id, ext = match.groups()
+                data_file = tar.extractfile(member)
+
+                if kind == "images" and ext == "png":
+                    old = pending_images.pop(char_id, None)
+                    if old:
+                        old.unlink(missing_ok=True)
+                    try:
+                        pending_images[char_id] = storage.stage_file(
+                            paths.character_image_path(char_id),
+                            _read_member_chunks(data_file, config.MAX_IMAGE_BYTES),
+                        )
+                    except ValueError as e:
+                        report.errors.append(f"{member.name}: {e}")
+                elif kind == "characters" and ext == "json":
+                    final_id = _import_character(
+                        char_id, data_file, pending_images.pop(char_id, None), on_conflict, report
+                    )
+                    if final_id and char_id in archive_saved:
+                        saved_hints[final_id] = archive_saved[char_id]
+                else:
+                    report.skipped.append(member.name)
+    finally:
+        for tmp_path in pending_images.values():  # Images whose JSON never arrived
+            tmp_path.unlink(missing_ok=True)
+        if report.imported:
+            storage.rebuild_index(saved_hints)
+
+    log.info(
+        f"Library import finished: {len(report.imported)} imported, "
+        f"{len(report.renamed)} renamed, {len(report.skipped)} skipped, {len(report.errors)} errors."
+    )
+    return report
+
+
+def _read_archive_index(fileobj) -> Dict[str, int]:
+    """Returns {id: saved} from an archive's index.json, ignoring anything malformed."""
+    try:
+        records = json.loads(b"".join(_read_member_chunks(fileobj, MAX_IMPORT_JSON_BYTES * 16)))
+    except (ValueError, UnicodeDecodeError):
+        log.warning("Archive index.json is unreadable; falling back to ID timestamps.")
+        return {}
+    if not isinstance(records, list):
+        return {}
+    return {
+        rec["id"]: rec["saved"]
+        for rec in records
+        if isinstance(rec, dict)
+        and isinstance(rec.get("id"), str)
+        and isinstance(rec.get("saved"), int)
+    }
+
+
+def _import_character(
+    char_id: str,
+    fileobj,
+    staged_image: Optional[Path],
+    on_conflict: models.ImportConflictPolicy,
+    report: models.ImportLibraryResponse,
+) -> Optional[str]:
+    """Validates and commits one character (and its staged image). Returns the final ID."""
+    try:
+        raw = b"".join(_read_member_chunks(fileobj, MAX_IMPORT_JSON_BYTES))
+        character = charfile.decode_character(raw)
+    except (ValueError, ValidationError) as e:
+        report.errors.append(f"characters/{char_id}.json: {e}")
+        if staged_image:
+            staged_image.unlink(missing_ok=True)
+        return None
+
+    final_id = char_id
+    existing_path = paths.find_character_json(char_id)
+    if existing_path is not None:
+        if on_conflict == models.ImportConflictPolicy.SKIP:
+            report.skipped.append(f"characters/{char_id}.json")
+            if staged_image:
+                staged_image.unlink(missing_ok=True)
+            return None
+        if on_conflict == models.ImportConflictPolicy.RENAME:
+            final_id = utils.new_character_id(character.name, utils.character_id_timestamp(char_id))
+            report.renamed[char_id] = final_id
+
+    char_path = paths.character_json_path(final_id)
+    img_path = paths.character_image_path(final_id)
+    char_json = charfile.encode_character(character)
+    overwrite = final_id == char_id and existing_path is not None
+
+    if overwrite:
+        # The old portrait's variants and manifest entry describe the old image; drop them
+        # before the new one lands so they are never served for it
+        for old_image in (img_path, paths.legacy_character_image_path(char_id)):
+            imaging.discard_variants(old_image)
+
+    staged: List[Tuple[Path, Path]] = []
+    try:
+        if staged_image:
+            staged.append((staged_image, img_path))
+        staged.append((storage.stage_file(char_path, [char_json.encode("utf-8")]), char_path))
+        storage.commit_staged(staged)
+    except OSError as e:
+        for tmp_path, _ in staged:
+            tmp_path.unlink(missing_ok=True)
+        report.errors.append(f"characters/{char_id}.json: could not write ({e})")
+        return None
+
+    if overwrite:
+        # Drop leftovers of the old copy (legacy flat files, or a portrait the new one lacks)
+        for stale in (
+            paths.legacy_character_json_path(char_id),
+            paths.legacy_character_image_path(char_id),
+        ):
+            if stale not in (char_path, img_path):
+                stale.unlink(missing_ok=True)
+        if not staged_image:
+            img_path.unlink(missing_ok=True)
+    report.imported.append(final_id)
+    return final_id
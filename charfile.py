@@ -0,0 +1,272 @@
+# charfile.py
+"""
+Compact on-disk format for saved characters.
+
+Format 2 (written by save/import) stores mutations as references into the mutation
+catalog (by name, with the catalog version recorded), the generation log as short
+structured events, and no whitespace. Format 1 files (the full model_dump_json
+output) are still read transparently. Run `uv run python charfile.py --migrate`
+to rewrite old files in place.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import config
+import models
+
+log = logging.getLogger(__name__)
+
+FORMAT_VERSION = 2
+
+# --- Generation Log Events ---
+# (code, template) pairs mirroring the messages core.py writes. A log line is stored as
+# [code, *args] only if re-formatting those args reproduces it exactly; anything else is
+# kept as the raw string, so the encoding is always lossless.
+LOG_TEMPLATES: List[Tuple[str, str]] = [
+    ("start", "Starting character generation for type: {}"),
+    (
+        "attrs",
+        "Rolled attributes ({}): MS={}, IN={}, DX={}, CH={}, CN={}, PS={}",
+    ),
+    ("psh_ch", "Applied PSH bonus: Charisma increased from {} to {}."),
+    ("hp", "Calculated starting Hit Points: {} (rolled {}d6)."),
+    ("count", "Rolled for number of mutations: {} Physical, {} Mental."),
+    (
+        "animal",
+        "Selected Mutated Animal ({}). NOTE: Referee adjudication needed for speech/manipulation capabilities.",
+    ),
+    ("final", "{} Slot {}: Finalized selection: {}"),
+    ("defect", "{} Slot {}: Assigned Defect: {}"),
+    ("slot", "{} Slot {} (Roll {}%): {}"),
+    ("m1", "Using Mutation Method 1: Random Roll."),
+    ("m2", "Using Mutation Method 2: Player Choice + Referee Defect Assignment."),
+    ("psh", "Character is Pure Strain Human. Skipping mutation phase."),
+    ("finalizing", "Finalizing mutation selections..."),
+]
+_LOG_FORMATS = dict(LOG_TEMPLATES)
+_LOG_PATTERNS = [
+    (code, re.compile("^" + "(.*?)".join(map(re.escape, template.split("{}"))) + "$", re.DOTALL))
+    for code, template in LOG_TEMPLATES
+]
+
+LogEvent = Union[str, List[Any]]
+
+
+def _compact_arg(value: str) -> Union[int, str]:
+    return int(value) if value.isdigit() and str(int(value)) == value else value
+
+
+def encode_log_line(line: str) -> LogEvent:
+    """Converts a generation log message into a structured event (or keeps it raw)."""
+    for code, pattern in _LOG_PATTERNS:
+        match = pattern.match(line)
+        if match:
+            args = [_compact_arg(a) for a in match.groups()]
+            if decode_log_event([code, *args]) == line:
+                return [code, *args]
+    return line
+
+
+def decode_log_event(event: LogEvent) -> str:
+    """Renders a structured log event back into its original message."""
+    if isinstance(event, str):
+        return event
+    code, *args = event
+    return _LOG_FORMATS[code].format(*args)
+
+
+# --- Mutation Catalog ---
+
+_catalog_cache: Dict[str, Any] = {"key": None, "version": "", "by_name": {}}
+
+
+def catalog_version(physical: List[Dict[str, Any]], mental: List[Dict[str, Any]]) -> str:
+    """Short content hash identifying a mutation catalog."""
+    payload = json.dumps([physical, mental], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def _catalog() -> Tuple[str, Dict[Tuple[str, str], Dict[str, Any]]]:
+    """Returns (version, {(mutation_type, name): mutation dict}) for the loaded catalog."""
+    key = (id(config.PHYSICAL_MUTATIONS_DATA), id(config.MENTAL_MUTATIONS_DATA))
+    if _catalog_cache["key"] != key:
+        by_name: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for mutation_type, pool in (
+            (models.MutationType.PHYSICAL, config.PHYSICAL_MUTATIONS_DATA),
+            (models.MutationType.MENTAL, config.MENTAL_MUTATIONS_DATA),
+        ):
+            for entry in pool:
+                if entry.get("number") is None:
+                    continue  # Special roll results ('Pick Any') are never assigned
+                try:
+                    mutation = models.Mutation(**entry).model_dump(mode="json", exclude_none=True)
+                except Exception:
+                    continue
+                by_name[(mutation_type.value, mutation["name"])] = mutation
+        _catalog_cache.update(
+            key=key,
+            version=catalog_version(config.PHYSICAL_MUTATIONS_DATA, config.MENTAL_MUTATIONS_DATA),
+            by_name=by_name,
+        )
+    return _catalog_cache["version"], _catalog_cache["by_name"]
+
+
+def _encode_mutations(
+    mutation_type: models.MutationType, mutations: List[Dict[str, Any]]
+) -> List[Union[str, Dict[str, Any]]]:
+    """Replaces catalog mutations with their name; anything non-standard stays inline."""
+    _, by_name = _catalog()
+    return [
+        mut["name"] if by_name.get((mutation_type.value, mut.get("name"))) == mut else mut
+        for mut in mutations
+    ]
+
+
+def _decode_mutations(
+    mutation_type: models.MutationType, refs: List[Union[str, Dict[str, Any]]], version: str
+) -> List[Dict[str, Any]]:
+    current_version, by_name = _catalog()
+    mutations = []
+    for ref in refs:
+        if isinstance(ref, dict):
+            mutations.append(ref)
+            continue
+        mutation = by_name.get((mutation_type.value, ref))
+        if mutation is None:
+            log.warning(
+                f"{mutation_type.value} mutation '{ref}' (catalog {version}) is not in the "
+                f"loaded catalog {current_version or '(not loaded)'}."
+            )
+            mutation = {
+                "name": ref,
+                "humanPercentage": "",
+                "animalPercentage": "",
+                "isDefect": False,
+                "description": "Mutation details unavailable (not found in the current mutation catalog).",
+            }
+        mutations.append(dict(mutation))
+    return mutations
+
+
+# --- Encode / Decode ---
+
+
+def encode_character(character: models.Character) -> str:
+    """Serializes a character to the compact format 2 JSON string."""
+    data = character.model_dump(mode="json", exclude_none=True)
+    version, _ = _catalog()
+    compact: Dict[str, Any] = {"format": FORMAT_VERSION, "catalog": version}
+    for key, value in data.items():
+        if key == "physical_mutations":
+            value = _encode_mutations(models.MutationType.PHYSICAL, value)
+        elif key == "mental_mutations":
+            value = _encode_mutations(models.MutationType.MENTAL, value)
+        elif key == "generation_log":
+            key, value = "log", [encode_log_line(line) for line in value]
+        compact[key] = value
+    return json.dumps(compact, ensure_ascii=False, separators=(",", ":"))
+
+
+def expand_character_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns saved character data in the full (format 1) shape, i.e. the same dict
+    model_dump() produces. Format 1 data is returned unchanged.
+    """
+    if data.get("format") != FORMAT_VERSION:
+        return data
+    version = data.get("catalog", "")
+    full: Dict[str, Any] = {}
+    for key, value in data.items():
+        if key in ("format", "catalog"):
+            continue
+        if key == "physical_mutations":
+            value = _decode_mutations(models.MutationType.PHYSICAL, value, version)
+        elif key == "mental_mutations":
+            value = _decode_mutations(models.MutationType.MENTAL, value, version)
+        elif key == "log":
+            key, value = "generation_log", [decode_log_event(event) for event in value]
+        full[key] = value
+    return full
+
+
+def decode_character(raw: Union[str, bytes]) -> models.Character:
+    """Parses and validates saved character JSON in either format."""
+    data = json.loads(raw)
+    if not isinstance(data, dict):
+        raise ValueError("Character data must be a JSON object.")
+    return models.Character.model_validate(expand_character_data(data))
+
+
+def load_character_data(path: Path) -> Dict[str, Any]:
+    """Reads a saved character file and returns it in the full dict shape."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"Character file {path} does not contain a JSON object.")
+    return expand_character_data(data)
+
+
+# --- Migration ---
+
+
+def migrate_file(path: Path, dry_run: bool = False) -> Optional[Tuple[int, int]]:
+    """
+    Rewrites one character file in format 2. Returns (old_size, new_size), or None
+    if the file was already compact.
+    """
+    import storage  # Local import: storage pulls in the I/O pool, not needed for decoding
+
+    raw = path.read_bytes()
+    data = json.loads(raw)
+    if isinstance(data, dict) and data.get("format") == FORMAT_VERSION:
+        return None
+    encoded = encode_character(decode_character(raw)).encode("utf-8")
+    if not dry_run:
+        storage.atomic_write_bytes(path, encoded)
+    return len(raw), len(encoded)
+
+
+def migrate_all(dry_run: bool = False) -> None:
+    """Rewrites every format 1 character file under config.CHAR_DIR."""
+    import paths
+    import utils
+
+    config.PHYSICAL_MUTATIONS_DATA = utils.load_mutations(config.PHYSICAL_MUTATIONS_FILE)
+    config.MENTAL_MUTATIONS_DATA = utils.load_mutations(config.MENTAL_MUTATIONS_FILE)
+    migrated = total_before = total_after = 0
+    for _, path in sorted(paths.iter_character_files()):
+        try:
+            sizes = migrate_file(path, dry_run=dry_run)
+        except Exception as e:
+            log.error(f"Could not migrate {path.name}: {e}")
+            continue
+        if sizes:
+            migrated += 1
+            total_before += sizes[0]
+            total_after += sizes[1]
+            log.info(
+                f"{'Would migrate' if dry_run else 'Migrated'} {path.name}: {sizes[0]} -> {sizes[1]} bytes"
+            )
+    log.info(
+        f"{migrated} file(s) {'to migrate' if dry_run else 'migrated'}: {total_before} -> {total_after} bytes."
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Saved character file tools.")
+    parser.add_argument(
+        "--migrate", action="store_true", help="Rewrite old character files in the compact format."
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Report sizes without writing.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    if args.migrate:
+        migrate_all(dry_run=args.dry_run)
+    else:
+        parser.print_help()
@@ -0,0 +1,418 @@
+# combat.py
+"""
+Monte Carlo combat simulator: a party of characters against a creature encounter.
+
+Simplified Gamma World melee, fought in simultaneous rounds until one side falls
+or max_rounds pass (a draw):
+- every living combatant attacks a random living opponent each round;
+- an attack hits on d20 + to-hit bonus >= 21 - target AC (a natural 20 always hits,
+  a natural 1 always misses);
+- characters: to-hit bonus from DX (+1 per point over 15, -1 per point under 6),
+  damage 1d6 plus PS bonus (same scale, minimum 1), AC from the request (10 = no armor);
+- creatures: to-hit bonus HD // 2, damage 1d6 per 3 hit dice, HP rolled per fight
+  as hit dice d6, group size rolled per fight from number appearing.
+
+Each (attacker, target AC) pair is compiled once into a table of "damage dealt by
+one attack" (0 = miss), so an attack is a single weighted draw. Fights run in chunks
+with seeds derived from the request seed, on a process pool (awaited, so no thread
+waits on it) or, with one worker, on storage's compute pool, and the same request
+always produces the same result whatever the worker count. Results are kept in a
+small LRU keyed by the combatants' stats, seed, fight count and options.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import accumulate
+from statistics import fmean, quantiles
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import charfile
+import config
+import creatures
+import dice
+import encounters
+import models
+import paths
+import storage
+import utils
+
+log = logging.getLogger(__name__)
+
+CHUNK_FIGHTS = 250  # Fights per work unit (and per derived seed)
+UNARMORED_AC = 10
+
+
+class Combatant(NamedTuple):
+    """One side's fighter (or, for creatures, one creature type) as the simulator sees it."""
+
+    name: str
+    armor_class: int
+    hit_points: str  # Dice expression: fixed for characters ('35'), rolled for creatures ('8d6')
+    to_hit: int
+    damage: str  # Dice expression before the floor of 1, e.g. '1d6+2'
+    count: str = "1"  # Individuals per fight (dice expression; creatures roll number appearing)
+
+
+class ChunkResult(NamedTuple):
+    party_wins: int
+    creature_wins: int
+    draws: int
+    rounds: int
+    hp_remaining: List[float]  # Fraction of the party's total HP left, per fight
+    survivors: List[int]  # Fights each party member survived
+    creatures_killed: int
+    creatures_met: int
+
+
+# --- Attack Tables ---
+
+
+def attribute_modifier(score: int) -> int:
+    """+1 per point over 15, -1 per point under 6 (DX to hit, PS to damage)."""
+    if score > 15:
+        return score - 15
+    if score < 6:
+        return score - 6
+    return 0
+
+
+@lru_cache(maxsize=1024)
+def attack_table(to_hit: int, target_ac: int, damage: str) -> Tuple[List[int], List[int]]:
+    """(damage values, cumulative weights) for one attack; 0 is a miss."""
+    needed = 21 - target_ac - to_hit
+    hits = sum(1 for roll in range(1, 21) if roll == 20 or (roll != 1 and roll >= needed))
+    damage_sampler = dice.compile_dice(damage)
+    weights: Dict[int, int] = {0: (20 - hits) * damage_sampler.cum_weights[-1]}
+    previous = 0
+    for value, cumulative in zip(damage_sampler.values, damage_sampler.cum_weights):
+        dealt = max(1, value)
+        weights[dealt] = weights.get(dealt, 0) + hits * (cumulative - previous)
+        previous = cumulative
+    values = sorted(weights)
+    return values, list(accumulate(weights[v] for v in values))
+
+
+# --- Simulation ---
+
+
+def simulate_chunk(
+    party: List[Combatant], foes: List[Combatant], seed: int, fights: int, max_rounds: int
+) -> ChunkResult:
+    """Runs `fights` independent fights with their own generator. Process-pool safe."""
+    rng = random.Random(seed)
+    choices = rng.choices
+    randrange = rng.randrange
+
+    party_hp = [int(member.hit_points) for member in party]
+    party_total = sum(party_hp)
+    # Every party member's attack table against every creature type, and vice versa
+    party_vs = [[attack_table(m.to_hit, f.armor_class, m.damage) for f in foes] for m in party]
+    foes_vs = [[attack_table(f.to_hit, m.armor_class, f.damage) for m in party] for f in foes]
+    count_samplers = [dice.compile_dice(f.count) for f in foes]
+    hp_samplers = [dice.compile_dice(f.hit_points) for f in foes]
+
+    party_wins = creature_wins = draws = rounds_total = killed = met = 0
+    hp_remaining: List[float] = []
+    survivors = [0] * len(party)
+
+    for _ in range(fights):
+        hp = list(party_hp)
+        foe_kind: List[int] = []
+        foe_hp: List[int] = []
+        for kind, (count_sampler, hp_sampler) in enumerate(zip(count_samplers, hp_samplers)):
+            n = count_sampler.roll(rng)
+            foe_kind.extend([kind] * n)
+            foe_hp.extend(hp_sampler.sample(rng, n))
+        met += len(foe_hp)
+
+        alive = [i for i, h in enumerate(hp) if h > 0]
+        foes_alive = [j for j, h in enumerate(foe_hp) if h > 0]
+        rounds = 0
+        while alive and foes_alive and rounds < max_rounds:
+            rounds += 1
+            for i in alive:
+                j = foes_alive[randrange(len(foes_alive))]
+                values, weights = party_vs[i][foe_kind[j]]
+                foe_hp[j] -= choices(values, cum_weights=weights)[0]
+            for j in foes_alive:
+                i = alive[randrange(len(alive))]
+                values, weights = foes_vs[foe_kind[j]][i]
+                hp[i] -= choices(values, cum_weights=weights)[0]
+            alive = [i for i in alive if hp[i] > 0]
+            foes_alive = [j for j in foes_alive if foe_hp[j] > 0]
+
+        rounds_total += rounds
+        killed += len(foe_hp) - len(foes_alive)
+        if not foes_alive and alive:
+            party_wins += 1
+        elif not alive and foes_alive:
+            creature_wins += 1
+        else:
+            draws += 1  # Round limit, or both sides fell in the same round
+        for i in alive:
+            survivors[i] += 1
+        hp_remaining.append(sum(max(h, 0) for h in hp) / party_total if party_total else 0.0)
+
+    return ChunkResult(
+        party_wins, creature_wins, draws, rounds_total, hp_remaining, survivors, killed, met
+    )
+
+
+# --- Combatants ---
+
+
+def character_combatant(character: models.Character, armor_class: int) -> Combatant:
+    attrs = character.attributes
+    damage_bonus = attribute_modifier(attrs.physical_strength)
+    return Combatant(
+        name=character.name or "Unnamed",
+        armor_class=armor_class,
+        hit_points=str(max(character.hit_points, 1)),
+        to_hit=attribute_modifier(attrs.dexterity),
+        damage=f"1d6{damage_bonus:+d}" if damage_bonus else "1d6",
+    )
+
+
+def _roll_attribute(rng: random.Random, method: models.AttributeRollMethod) -> int:
+    if method == models.AttributeRollMethod.STANDARD_3D6:
+        return dice.compile_dice("3d6").roll(rng)
+    return sum(sorted(rng.randint(1, 6) for _ in range(4))[1:])
+
+
+def generated_combatants(
+    count: int, method: models.AttributeRollMethod, armor_class: int, rng: random.Random
+) -> List[Combatant]:
+    """Rolls fresh characters' combat stats (attributes, HP = CN d6) from the seeded generator."""
+    party = []
+    for n in range(count):
+        scores = {name: _roll_attribute(rng, method) for name in models.Attributes.model_fields}
+        hit_points = dice.compile_dice(f"{scores['constitution']}d6").roll(rng)
+        character = models.Character(
+            name=f"Generated {n + 1}",
+            character_type=models.CharacterType.PSH,
+            attributes=models.Attributes(**scores),
+            hit_points=hit_points,
+        )
+        party.append(character_combatant(character, armor_class))
+    return party
+
+
+def creature_combatant(summary: models.CreatureSummary, roll_number_appearing: bool) -> Combatant:
+    appearing, hp_sampler = encounters.creature_samplers(summary)
+    hit_dice = utils.parse_stat_range(summary.hit_dice)
+    hd = hit_dice[0] if hit_dice else 1
+    return Combatant(
+        name=summary.name,
+        armor_class=(
+            summary.armor_class_min if summary.armor_class_min is not None else UNARMORED_AC
+        ),
+        hit_points=hp_sampler.expression if hp_sampler else "1d6",
+        to_hit=hd // 2,
+        damage=f"{max(1, hd // 3)}d6",
+        count=appearing.expression if roll_number_appearing else "1",
+    )
+
+
+def load_party(req: models.CombatSimulationRequest, rng: random.Random) -> List[Combatant]:
+    """Saved characters (by ID) plus generated ones. Blocking: reads character files."""
+    party = []
+    for char_id in req.character_ids:
+        char_file = paths.find_character_json(char_id)
+        if char_file is None:
+            raise ValueError(f"Character not found: {char_id}")
+        character = models.Character.model_validate(charfile.load_character_data(char_file))
+        party.append(character_combatant(character, req.party_armor_class))
+    party.extend(
+        generated_combatants(req.generate, req.attribute_method, req.party_armor_class, rng)
+    )
+    if not party:
+        raise ValueError("The party is empty: give character_ids and/or generate.")
+    return party
+
+
+# --- Worker Pool and Result Cache ---
+
+_pool: Optional[ProcessPoolExecutor] = None
+_results: "OrderedDict[tuple, models.CombatSimulationResponse]" = OrderedDict()
+_results_lock = threading.Lock()  # The LRU is reordered from the loop and pool threads
+
+
+def _workers() -> int:
+    return config.SIMULATION_WORKERS or os.cpu_count() or 1
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=_workers())
+    return _pool
+
+
+def shutdown() -> None:
+    """Stops the simulation process pool, if one was started."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+def _cached(key: tuple) -> Optional[models.CombatSimulationResponse]:
+    with _results_lock:
+        cached = _results.get(key)
+        if cached is not None:
+            _results.move_to_end(key)
+        return cached
+
+
+def _remember(key: tuple, response: models.CombatSimulationResponse) -> None:
+    with _results_lock:
+        _results[key] = response
+        _results.move_to_end(key)
+        while len(_results) > config.SIMULATION_CACHE_SIZE:
+            _results.popitem(last=False)
+
+
+def _run_inline(
+    party: List[Combatant],
+    foes: List[Combatant],
+    chunks: List[Tuple[int, int]],
+    max_rounds: int,
+) -> List[ChunkResult]:
+    return [simulate_chunk(party, foes, chunk_seed, n, max_rounds) for chunk_seed, n in chunks]
+
+
+async def _run_chunks(
+    party: List[Combatant], foes: List[Combatant], seed: int, fights: int, max_rounds: int
+) -> List[ChunkResult]:
+    seeder = random.Random(seed)
+    chunks = []
+    for start in range(0, fights, CHUNK_FIGHTS):
+        chunks.append((seeder.randrange(2**63), min(CHUNK_FIGHTS, fights - start)))
+    if _workers() > 1 and len(chunks) > 1:
+        pool = _get_pool()
+        return list(
+            await asyncio.gather(
+                *(
+                    asyncio.wrap_future(
+                        pool.submit(simulate_chunk, party, foes, chunk_seed, n, max_rounds)
+                    )
+                    for chunk_seed, n in chunks
+                )
+            )
+        )
+    return await storage.run_cpu(_run_inline, party, foes, chunks, max_rounds)
+
+
+def _hp_distribution(values: List[float]) -> models.HitPointDistribution:
+    if len(values) < 2:
+        value = values[0] if values else 0.0
+        return models.HitPointDistribution(
+            mean=value, p10=value, p25=value, p50=value, p75=value, p90=value
+        )
+    steps = quantiles(values, n=20, method="inclusive")  # Cut points at 5%, 10%, ... 95%
+    return models.HitPointDistribution(
+        mean=fmean(values),
+        p10=steps[1],
+        p25=steps[4],
+        p50=steps[9],
+        p75=steps[14],
+        p90=steps[17],
+    )
+
+
+def _prepare(
+    registry: creatures.CreatureRegistry, req: models.CombatSimulationRequest
+) -> Tuple[int, List[Combatant], List[Combatant]]:
+    """Validates a request; returns its seed, party and foes. Blocking: reads character files."""
+    if req.fights > config.MAX_SIMULATED_FIGHTS:
+        raise ValueError(f"At most {config.MAX_SIMULATED_FIGHTS} fights can be simulated.")
+    if not req.creatures:
+        raise ValueError("The encounter is empty: give at least one creature slug.")
+    by_slug = {s.slug: s for s in registry.summaries}
+    unknown = [slug for slug in req.creatures if slug not in by_slug]
+    if unknown:
+        raise ValueError(f"Unknown creature slug(s): {', '.join(unknown)}")
+
+    seed = req.seed if req.seed is not None else random.SystemRandom().randrange(2**32)
+    rng = random.Random(seed)
+    party = load_party(req, rng)
+    foes = [creature_combatant(by_slug[slug], req.roll_number_appearing) for slug in req.creatures]
+    return seed, party, foes
+
+
+def _summarize(
+    seed: int,
+    fights: int,
+    party: List[Combatant],
+    foes: List[Combatant],
+    results: List[ChunkResult],
+) -> models.CombatSimulationResponse:
+    """Builds the response from the chunk results (sorts every HP value: run off the loop)."""
+    hp_remaining = [value for chunk in results for value in chunk.hp_remaining]
+    survivors = [sum(chunk.survivors[i] for chunk in results) for i in range(len(party))]
+    met = sum(chunk.creatures_met for chunk in results)
+    return models.CombatSimulationResponse(
+        seed=seed,
+        fights=fights,
+        party=[
+            models.CombatantSummary(
+                name=m.name,
+                armor_class=m.armor_class,
+                hit_points=m.hit_points,
+                to_hit=m.to_hit,
+                damage=m.damage,
+                survival_rate=survivors[i] / fights,
+            )
+            for i, m in enumerate(party)
+        ],
+        creatures=[
+            models.CombatantSummary(
+                name=f.name,
+                armor_class=f.armor_class,
+                hit_points=f.hit_points,
+                to_hit=f.to_hit,
+                damage=f.damage,
+                count=f.count,
+            )
+            for f in foes
+        ],
+        party_win_rate=sum(c.party_wins for c in results) / fights,
+        creature_win_rate=sum(c.creature_wins for c in results) / fights,
+        draw_rate=sum(c.draws for c in results) / fights,
+        mean_rounds=sum(c.rounds for c in results) / fights,
+        mean_creatures=met / fights,
+        creature_kill_rate=sum(c.creatures_killed for c in results) / met if met else 0.0,
+        party_hp_remaining=_hp_distribution(hp_remaining),
+    )
+
+
+async def simulate(
+    registry: creatures.CreatureRegistry, req: models.CombatSimulationRequest
+) -> models.CombatSimulationResponse:
+    """
+    Runs (or recalls) a simulation. Raises ValueError for an invalid request. Character
+    files are read on the I/O pool; the fights and the summary never block the loop.
+    """
+    seed, party, foes = await storage.run_io(_prepare, registry, req)
+
+    # Keyed by what is simulated, not by IDs: a re-saved character is a different party
+    key = (tuple(party), tuple(foes), seed, req.fights, req.max_rounds)
+    cached = _cached(key)
+    if cached is not None:
+        log.info(f"Combat simulation served from cache (seed {seed}).")
+        return cached.model_copy(update={"cached": True})
+
+    results = await _run_chunks(party, foes, seed, req.fights, req.max_rounds)
+    response = await storage.run_cpu(_summarize, seed, req.fights, party, foes, results)
+    _remember(key, response)
+    log.info(
+        f"Simulated {req.fights} fights of {len(party)} characters vs {', '.join(req.creatures)}: "
+        f"party wins {response.party_win_rate:.1%} (seed {seed})."
+    )
+    return response
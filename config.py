@@ -11,8 +11,9 @@ load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent
 CHAR_DIR = BASE_DIR / "characters"
 IMAGE_DIR = BASE_DIR / "images"
+CHARACTER_IMAGE_DIR = IMAGE_DIR / "characters"  # Character portraits, kept apart from creature art
 TEMPLATE_DIR = BASE_DIR / "templates"
-STATIC_DIR = BASE_DIR  # Assuming static files are served from the root
+STATIC_DIR = BASE_DIR  # URL root: /static/<path> is STATIC_DIR/<path> (only images/ is mounted)
 
 # --- Data Files ---
 PHYSICAL_MUTATIONS_FILE = BASE_DIR / "Physical-Mutations.json"
@@ -20,6 +21,7 @@ MENTAL_MUTATIONS_FILE = BASE_DIR / "Mental-Mutations.json"
 ATTRIBUTES_FILE = BASE_DIR / "Attributes.json"
 BACKSTORY_FILE = BASE_DIR / "backstory.md"
 INDEX_FILE = CHAR_DIR / "index.json"
+INDEX_LOCK_FILE = CHAR_DIR / ".index.lock"  # Advisory lock shared by all worker processes
 CREATURES_FILE = BASE_DIR / "Creatures.json"
 
 # --- AI Configuration ---
@@ -27,17 +29,105 @@ CREATURES_FILE = BASE_DIR / "Creatures.json"
 # Set the GOOGLE_API_KEY environment variable before running the app.
 # Example: export GOOGLE_API_KEY='AIzaSy...'
 GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GEMINI_API_KEY:
+# "gemini" (the real API) or "fake" (fakegenai.FakeClient: offline, for load tests)
+AI_BACKEND = os.getenv("AI_BACKEND", "gemini").strip().lower()
+if not GEMINI_API_KEY and AI_BACKEND != "fake":
     # Provide a more informative startup error if the key is missing
     # Log this properly in main.py's startup if possible
     print("ERROR: GOOGLE_API_KEY environment variable not set.")
     # Depending on strictness, you might want to raise an exception here
     # raise ValueError("GOOGLE_API_KEY environment variable not set.")
 
+# --- Fake AI Backend (AI_BACKEND=fake) ---
+# Latency specs: "fixed:s", "uniform:lo,hi", "normal:mean,stdev" or "lognormal:median,sigma"
+FAKE_AI_TEXT_LATENCY = os.getenv("FAKE_AI_TEXT_LATENCY", "lognormal:1.5,0.4")  # To first chunk
+FAKE_AI_IMAGE_LATENCY = os.getenv("FAKE_AI_IMAGE_LATENCY", "lognormal:8,0.4")
+FAKE_AI_CHUNK_LATENCY = os.getenv("FAKE_AI_CHUNK_LATENCY", "uniform:0.03,0.12")  # Between chunks
+FAKE_AI_ERROR_RATE = float(os.getenv("FAKE_AI_ERROR_RATE", "0"))  # Share of calls that fail
+FAKE_AI_ERROR_CODES = os.getenv("FAKE_AI_ERROR_CODES", "429,503")  # HTTP codes and/or "timeout"
+FAKE_AI_BLOCK_RATE = float(os.getenv("FAKE_AI_BLOCK_RATE", "0"))  # Share answered as blocked
+FAKE_AI_BLOCK_REASONS = os.getenv("FAKE_AI_BLOCK_REASONS", "SAFETY,PROHIBITED_CONTENT")
+FAKE_AI_IMAGE_SIZE = int(os.getenv("FAKE_AI_IMAGE_SIZE", "1024"))  # Square, in px
+FAKE_AI_SEED = os.getenv("FAKE_AI_SEED")  # Set for reproducible latencies and failures
+
+# --- AI Gateway ---
+# Bounds on concurrent Gemini calls per worker process (see ai_services.AIGateway)
+AI_MAX_CONCURRENT = int(os.getenv("AI_MAX_CONCURRENT", "4"))  # Calls in flight at once
+AI_MAX_QUEUED = int(os.getenv("AI_MAX_QUEUED", "16"))  # Callers waiting for a slot; more get 503
+AI_MAX_RETRIES = 3  # Retries of rate-limited (429) and transient (5xx, network) failures
+AI_RETRY_BASE_SECONDS = 1.0  # Backoff before retry n is uniform in [0, base * 2**n], capped
+AI_RETRY_MAX_SECONDS = 20.0
+AI_BUSY_RETRY_AFTER_SECONDS = 5  # Retry-After sent with the 503 when the queue is full
+
+# --- AI Telemetry ---
+# Per-call latency, size and token records (see aitelemetry.py); per worker process
+AI_TELEMETRY_MAX_CALLS = int(os.getenv("AI_TELEMETRY_MAX_CALLS", "1000"))  # Rolling window size
+AI_TELEMETRY_WINDOW_SECONDS = int(os.getenv("AI_TELEMETRY_WINDOW_SECONDS", "3600"))
+
+# --- Image Jobs ---
+# Background image generation (see imagejobs.py); limits are per worker process
+IMAGE_JOB_CONCURRENCY = int(os.getenv("IMAGE_JOB_CONCURRENCY", "2"))  # Jobs generating at once
+IMAGE_JOB_MAX_PENDING = int(os.getenv("IMAGE_JOB_MAX_PENDING", "32"))  # Queued + running
+IMAGE_JOB_TTL_SECONDS = 15 * 60  # How long a finished job and its image stay retrievable
+IMAGE_JOB_MAX_FINISHED = 256  # Finished jobs kept (their images are held in imagestore)
+
+# --- Held Images ---
+# Generated images wait here (by handle) until a character is saved with them; keep it on
+# the same filesystem as CHARACTER_IMAGE_DIR so saving is a hard link, not a copy
+GENERATED_IMAGE_DIR = BASE_DIR / "cache" / "generated"
+GENERATED_IMAGE_TTL_SECONDS = 60 * 60
+GENERATED_IMAGE_MAX_BYTES = int(os.getenv("GENERATED_IMAGE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# --- AI Result Cache ---
+# Descriptions are cached by a hash of the normalized request and the prompt version
+AI_CACHE_FILE = BASE_DIR / "cache" / "ai-cache.sqlite3"
+AI_CACHE_MEMORY_ENTRIES = 256  # In-process LRU in front of the SQLite store
+AI_CACHE_DISK_ENTRIES = int(os.getenv("AI_CACHE_DISK_ENTRIES", "5000"))
+AI_CACHE_TTL_SECONDS = int(os.getenv("AI_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+
 # --- Image Generation ---
 STYLE_IMAGE_PATH = IMAGE_DIR / "evil-robot.png"  # Reference image for style transfer
+STYLE_IMAGE_MAX_SIDE = 768  # The reference is downscaled to this (px) and sent as JPEG
 MAX_IMAGE_BYTES = 2 * 1024 * 1024  # 2MB limit for uploaded/generated images
 
+# --- Image Variants ---
+# Downsized WebP copies served to browsers instead of the full-size PNGs (name -> max width px)
+IMAGE_VARIANT_WIDTHS = {"thumb": 320, "medium": 768}
+# Encoder quality per format (0-100); AVIF reaches WebP-80 fidelity at a lower setting
+IMAGE_VARIANT_QUALITY = {"webp": 80, "avif": 55}
+IMAGE_VARIANT_FORMATS = ("webp", "avif")  # Formats written by `imaging.py --optimize`
+IMAGE_MANIFEST_FILE = IMAGE_DIR / "manifest.json"  # Written by `imaging.py --optimize`
+
+# Watch images/ for changes made outside this process (other workers, the optimizer) and
+# keep the in-memory image index current. Needs the optional 'watchfiles' package.
+IMAGE_WATCH = os.getenv("IMAGE_WATCH", "0") == "1"
+
+# --- HTTP Caching ---
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"  # Content-hashed URLs
+STATIC_CACHE_CONTROL = "public, max-age=86400"  # Creature and site art under a plain URL
+# Portraits (and unversioned variants) can be replaced under the same URL by an import,
+# so browsers keep them but revalidate with the ETag (a 304 costs no image bytes)
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+HELD_IMAGE_CACHE_CONTROL = "private, max-age=3600, immutable"  # /generated/<handle> previews
+# Rendered, pre-compressed creature browser pages kept in memory (list page + one per creature)
+CREATURE_PAGE_CACHE_SIZE = 512
+CHARACTER_PAGE_CACHE_SIZE = 256  # Rendered character detail pages (least recently viewed evicted)
+
+# --- Storage ---
+STORAGE_IO_WORKERS = int(os.getenv("STORAGE_IO_WORKERS", "4"))  # Threads for blocking disk I/O
+# Threads for CPU-bound request work (encounter rolls, simulation summaries), kept apart
+# from the I/O pool so a burst of it cannot hold up saves
+COMPUTE_WORKERS = int(os.getenv("COMPUTE_WORKERS", "2"))
+# Hex digits of sha1(id) used for shard directories, e.g. characters/ab/<id>.json (0 = flat)
+STORAGE_SHARD_CHARS = int(os.getenv("STORAGE_SHARD_CHARS", "2"))
+
+# --- Encounters ---
+MAX_ENCOUNTERS_PER_REQUEST = 10000  # Upper bound on `count` for POST /api/encounters
+MAX_SIMULATED_FIGHTS = 20000  # Upper bound on `fights` for POST /api/simulate
+# Processes for combat simulation (0 = one per CPU; 1 = run in the server process)
+SIMULATION_WORKERS = int(os.getenv("SIMULATION_WORKERS", "0"))
+SIMULATION_CACHE_SIZE = 128  # Simulation results remembered (by combatants, seed, fights)
+
 # --- Character Generation ---
 MAX_REROLL_ATTEMPTS = 10  # Max attempts to find a unique mutation on reroll
 
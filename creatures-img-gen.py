@@ -1,8 +1,14 @@
+import argparse
+import asyncio
+import fnmatch
 import json
 import logging
 import os
+import shutil
 import subprocess
 import sys
+import tempfile
+import time
 from io import BytesIO
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
@@ -18,6 +24,9 @@ from PIL import Image
 from slugify import slugify as pyslugify  # Use pyslugify to avoid name collision
 from termcolor import colored, cprint
 
+import fakegenai  # Run from the repo root, like the paths below
+from styleref import StyleReference
+
 # Load environment variables from .env file if it exists
 load_dotenv()
 
@@ -27,6 +36,14 @@ IMAGES_DIR = Path("./images/")
 TEMP_IMAGE_PATH = Path("./_temp_creature_image.png")
 STYLE_IMAGE_PATH = Path("./images/bunnies.png")  # Style reference for AI
 GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")
+IMAGE_MODEL = "gemini-2.0-flash-exp-image-generation"
+# Must have both modalities
+IMAGE_CONFIG = genai_types.GenerateContentConfig(response_modalities=["TEXT", "IMAGE"])
+
+# --- Batch Mode ---
+STAGING_DIR = Path("./cache/creature-staging/")  # Generated images awaiting review
+MANIFEST_NAME = "manifest.json"  # Inside the staging directory
+DEFAULT_CONCURRENCY = 4
 
 # --- Logging Setup ---
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
@@ -46,6 +63,10 @@ else:
         log.critical(f"Failed to initialize google-genai Client: {e}", exc_info=True)
         client = None
 
+# Loaded, downscaled and encoded once for the whole run
+style_reference = StyleReference(STYLE_IMAGE_PATH)
+
+
 # --- Helper Functions ---
 
 
@@ -147,19 +168,10 @@ def cleanup_temp_file():
 # --- AI Image Generation (Adapted from ai_services.py) ---
 
 
-def generate_ai_image(creature_data: Dict[str, Any]) -> Tuple[str, Optional[bytes]]:
-    """
-    Generates a creature image using Gemini based on its data.
-    Returns (status: 'success'|'error', image_bytes_or_error_message).
-    """
-    if not client:
-        return "error", b"AI Service not initialized (API key missing or configuration failed)."
-
+def build_image_contents(creature_data: Dict[str, Any]) -> List[Any]:
+    """The prompt (plus the style reference, if present) for a creature's image."""
     creature_name = creature_data.get("name", "Unnamed Creature")
     creature_description = creature_data.get("description", "No description available.")
-    cprint(f"Generating AI image for: {creature_name}...", "cyan")
-
-    # --- Construct prompt & style reference ---
     prompt = (
         "Generate a single illustration (no text in the image) of the Gamma World RPG creature described below. "
         "Use the same style as the attached reference image (color palette, line-weight, overall feel, and general rendering mood) "
@@ -168,40 +180,20 @@ def generate_ai_image(creature_data: Dict[str, Any]) -> Tuple[str, Optional[byte
     )
     log.debug(f"Image Generation Prompt (start): {prompt[:300]}...")
 
-    # Load reference image
-    style_image = None
-    if STYLE_IMAGE_PATH.exists():
-        try:
-            style_image = Image.open(STYLE_IMAGE_PATH)
-            log.info(f"Loaded style image from {STYLE_IMAGE_PATH}")
-        except Exception as e:
-            cprint(
-                f"Warning: Could not load style image '{STYLE_IMAGE_PATH}': {e}. Proceeding without it.",
-                "yellow",
-            )
-    else:
-        cprint(
-            f"Warning: Style image not found at {STYLE_IMAGE_PATH}. Proceeding without style reference.",
-            "yellow",
-        )
+    contents: List[Any] = [prompt]
+    style_image = style_reference.part()  # Logs a warning if missing; proceeds without it
+    if style_image:
+        contents.append(style_image)
+    # No need for "no attached image" text if style_image is None for google-genai
+    return contents
 
-    # --- Call Gemini Image Generation API ---
-    try:
-        log.info("Sending image generation request to Gemini...")
-        contents = [prompt]
-        if style_image:
-            contents.append(style_image)
-        # No need for "no attached image" text if style_image is None for google-genai
-
-        response = client.models.generate_content(  # Use synchronous client here for simplicity
-            model="gemini-2.0-flash-exp-image-generation",
-            contents=contents,
-            config=genai_types.GenerateContentConfig(
-                response_modalities=["TEXT", "IMAGE"]  # Must have both modalities
-            ),
-        )
 
-        # --- Process Response ---
+def process_image_response(response: Any) -> Tuple[str, bytes]:
+    """
+    Extracts the image from a Gemini response, converted to PNG.
+    Returns (status: 'success'|'error', image_bytes_or_error_message).
+    """
+    try:
         if not response.candidates:
             block_reason = "Unknown"
             safety_ratings = "N/A"
@@ -241,7 +233,7 @@ def generate_ai_image(creature_data: Dict[str, Any]) -> Tuple[str, Optional[byte
             # Convert to PNG if necessary (Gemini might return JPEG or WEBP)
             if not mime_type.lower().endswith("png"):
                 try:
-                    cprint(f"Converting image from {mime_type} to PNG...", "yellow")
+                    log.info(f"Converting image from {mime_type} to PNG...")
                     img = Image.open(BytesIO(image_bytes))
                     buffer = BytesIO()
                     img.save(buffer, format="PNG")
@@ -272,6 +264,47 @@ def generate_ai_image(creature_data: Dict[str, Any]) -> Tuple[str, Optional[byte
         return "error", error_msg.encode("utf-8")
 
 
+def generate_ai_image(creature_data: Dict[str, Any]) -> Tuple[str, Optional[bytes]]:
+    """
+    Generates a creature image using Gemini based on its data.
+    Returns (status: 'success'|'error', image_bytes_or_error_message).
+    """
+    if not client:
+        return "error", b"AI Service not initialized (API key missing or configuration failed)."
+
+    cprint(f"Generating AI image for: {creature_data.get('name', 'Unnamed Creature')}...", "cyan")
+    try:
+        log.info("Sending image generation request to Gemini...")
+        response = client.models.generate_content(  # Use synchronous client here for simplicity
+            model=IMAGE_MODEL, contents=build_image_contents(creature_data), config=IMAGE_CONFIG
+        )
+    except Exception as e:
+        error_msg = (
+            f"AI image generation failed due to an unexpected error: {type(e).__name__}: {e}"
+        )
+        log.error(error_msg, exc_info=True)
+        return "error", error_msg.encode("utf-8")
+    return process_image_response(response)
+
+
+async def generate_ai_image_async(
+    gen_client: Any, creature_data: Dict[str, Any]
+) -> Tuple[str, bytes]:
+    """generate_ai_image() for batch mode: async client, PNG conversion off the event loop."""
+    try:
+        contents = await asyncio.to_thread(build_image_contents, creature_data)
+        response = await gen_client.aio.models.generate_content(
+            model=IMAGE_MODEL, contents=contents, config=IMAGE_CONFIG
+        )
+    except Exception as e:
+        error_msg = (
+            f"AI image generation failed due to an unexpected error: {type(e).__name__}: {e}"
+        )
+        log.error(f"{creature_data.get('name')}: {error_msg}")
+        return "error", error_msg.encode("utf-8")
+    return await asyncio.to_thread(process_image_response, response)
+
+
 # --- User Interaction ---
 
 
@@ -441,9 +474,290 @@ def main_loop():
         cprint("Script finished.", "blue")
 
 
+# --- Batch Mode ---
+# Generates images concurrently into STAGING_DIR without any prompts. The manifest
+# records every selected creature as pending, done (staged, awaiting review), failed,
+# accepted or rejected, so an interrupted run resumes where it stopped. --review then
+# moves accepted images into IMAGES_DIR.
+
+
+def load_manifest(path: Path) -> Dict[str, Any]:
+    """Loads the batch manifest, or returns an empty one."""
+    if not path.exists():
+        return {"items": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path: Path, manifest: Dict[str, Any]) -> None:
+    """Writes the manifest atomically (a crash leaves the previous version intact)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".manifest-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def select_creatures(
+    creatures: List[Dict[str, Any]],
+    items: Dict[str, Any],
+    patterns: List[str],
+    regenerate: bool,
+    retry_failed: bool,
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    The (slug, creature) pairs a batch run should generate: those matching a --only
+    pattern (name or slug, fnmatch-style) that the manifest hasn't finished with and
+    that have no image yet (or all of them with --regenerate).
+    """
+    selected = []
+    for creature in creatures:
+        name = creature["name"]
+        slug = slugify_name(name)
+        if patterns and not any(
+            fnmatch.fnmatch(name.lower(), pattern.lower()) or fnmatch.fnmatch(slug, pattern)
+            for pattern in patterns
+        ):
+            continue
+        state = items.get(slug, {}).get("state")
+        if state in ("done", "accepted", "rejected") or (state == "failed" and not retry_failed):
+            continue  # Finished in an earlier run
+        if state is None and not regenerate and check_existing_image(slug):
+            continue
+        selected.append((slug, creature))
+    return selected
+
+
+async def run_batch(
+    gen_client: Any,
+    creatures: List[Dict[str, Any]],
+    staging_dir: Path,
+    concurrency: int,
+    patterns: List[str],
+    regenerate: bool,
+    retry_failed: bool,
+) -> None:
+    """Generates the selected creatures' images into staging_dir, concurrency at a time."""
+    manifest_path = staging_dir / MANIFEST_NAME
+    manifest = load_manifest(manifest_path)
+    items: Dict[str, Any] = manifest["items"]
+    selected = select_creatures(creatures, items, patterns, regenerate, retry_failed)
+    if not selected:
+        cprint("Nothing to generate (see --only, --regenerate and --retry-failed).", "yellow")
+        return
+
+    for slug, creature in selected:
+        entry = items.setdefault(slug, {"name": creature["name"], "attempts": 0})
+        entry.update(state="pending", error=None)
+    save_manifest(manifest_path, manifest)
+    cprint(
+        f"Generating {len(selected)} images, {concurrency} at a time, into '{staging_dir}'...",
+        "blue",
+        attrs=["bold"],
+    )
+
+    semaphore = asyncio.Semaphore(concurrency)
+    completed = 0
+
+    async def generate_one(slug: str, creature: Dict[str, Any]) -> None:
+        nonlocal completed
+        async with semaphore:
+            started = time.monotonic()
+            gen_status, data = await generate_ai_image_async(gen_client, creature)
+            entry = items[slug]
+            entry["attempts"] += 1
+            entry["seconds"] = round(time.monotonic() - started, 1)
+            staged_path = staging_dir / f"{slug}.png"
+            if gen_status == "success" and await asyncio.to_thread(save_image, data, staged_path):
+                entry.update(state="done", file=staged_path.name)
+            else:
+                error = data.decode("utf-8") if gen_status != "success" else "Could not save image"
+                entry.update(state="failed", error=error)
+            save_manifest(manifest_path, manifest)  # Small; written after every item
+            completed += 1
+            color = "green" if entry["state"] == "done" else "red"
+            cprint(f"[{completed}/{len(selected)}] {creature['name']}: {entry['state']}", color)
+
+    await asyncio.gather(*(generate_one(slug, creature) for slug, creature in selected))
+
+    states = [items[slug]["state"] for slug, _ in selected]
+    cprint(
+        f"\n--- Batch finished: {states.count('done')} staged, {states.count('failed')} failed. ---",
+        "green",
+        attrs=["bold"],
+    )
+    if states.count("failed"):
+        cprint("Re-run with --retry-failed to try the failed creatures again.", "yellow")
+    if states.count("done"):
+        cprint("Run with --review to accept or reject the staged images.", "cyan")
+
+
+def prompt_user_staged(creature_name: str, staged_path: Path) -> str:
+    """Prompt user for a staged batch image."""
+    cprint(f"Staged image for '{creature_name}':", "green")
+    cprint(f"  Path: {staged_path}", "green")
+    while True:
+        cprint("Options: [O]pen, [A]ccept, [R]eject, [S]kip to Next, [Q]uit", "magenta", end="")
+        choice = input(" > ").upper()
+        if choice in ["O", "A", "R", "S", "Q"]:
+            return choice
+        cprint("Invalid choice. Please enter O, A, R, S, or Q.", "red")
+
+
+def review_batch(staging_dir: Path) -> None:
+    """Walks through staged images: accepted ones move to IMAGES_DIR, rejected ones are deleted."""
+    manifest_path = staging_dir / MANIFEST_NAME
+    manifest = load_manifest(manifest_path)
+    staged = [
+        (slug, entry) for slug, entry in manifest["items"].items() if entry["state"] == "done"
+    ]
+    if not staged:
+        cprint(f"No staged images to review in '{staging_dir}'.", "yellow")
+        return
+
+    IMAGES_DIR.mkdir(parents=True, exist_ok=True)
+    for i, (slug, entry) in enumerate(staged):
+        cprint(
+            f"\n--- Reviewing {i + 1}/{len(staged)}: {entry['name']} ---", "blue", attrs=["bold"]
+        )
+        staged_path = staging_dir / entry["file"]
+        if not staged_path.exists():
+            cprint(f"Staged file is missing; marking {entry['name']} as failed.", "red")
+            entry.update(state="failed", error="Staged file missing")
+            save_manifest(manifest_path, manifest)
+            continue
+        if existing_path := check_existing_image(slug):
+            cprint(f"Note: accepting replaces the current image at {existing_path}.", "yellow")
+
+        while True:
+            action = prompt_user_staged(entry["name"], staged_path)
+            if action == "O":
+                open_image_viewer(staged_path)
+                continue
+            break
+        if action == "Q":
+            cprint("Quitting review; the remaining images stay staged.", "red")
+            return
+        if action == "A":
+            shutil.move(staged_path, IMAGES_DIR / f"{slug}.png")
+            entry["state"] = "accepted"
+            cprint(f"Accepted image for {entry['name']}.", "green")
+        elif action == "R":
+            staged_path.unlink(missing_ok=True)
+            entry["state"] = "rejected"
+            cprint(f"Rejected image for {entry['name']}.", "yellow")
+        save_manifest(manifest_path, manifest)
+
+    cprint("\n--- Review finished. ---", "green", attrs=["bold"])
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Generate creature images. Without options, walks through the creatures interactively."
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--batch",
+        action="store_true",
+        help="Generate missing images concurrently into the staging directory.",
+    )
+    mode.add_argument("--review", action="store_true", help="Accept or reject staged batch images.")
+    parser.add_argument(
+        "--staging",
+        type=Path,
+        default=STAGING_DIR,
+        help=f"Staging directory (default: {STAGING_DIR}).",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Requests in flight at once (default: {DEFAULT_CONCURRENCY}).",
+    )
+    parser.add_argument(
+        "--only",
+        action="append",
+        default=[],
+        metavar="PATTERN",
+        help="Only creatures whose name or slug matches this fnmatch pattern (repeatable).",
+    )
+    parser.add_argument(
+        "--regenerate",
+        action="store_true",
+        help="Also generate creatures that already have an image.",
+    )
+    parser.add_argument(
+        "--retry-failed", action="store_true", help="Retry creatures that failed in an earlier run."
+    )
+    parser.add_argument(
+        "--fake",
+        action="store_true",
+        help="Use the offline fake backend (fakegenai.py: placeholder images, random failures).",
+    )
+    parser.add_argument(
+        "--fake-failure-rate",
+        type=float,
+        default=0.1,
+        help="Share of fake requests that fail, half with errors and half blocked (default: 0.1).",
+    )
+    parser.add_argument(
+        "--fake-latency",
+        default="uniform:0.5,2",
+        metavar="SPEC",
+        help="Fake image latency, e.g. fixed:2, uniform:1,3 or lognormal:8,0.4 (default: uniform:0.5,2).",
+    )
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    try:
+        args.fake_latency = fakegenai.Latency(args.fake_latency)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
 # --- Main Execution ---
 if __name__ == "__main__":
-    if not client and (not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY_HERE"):
+    args = parse_args()
+    if args.fake:  # Used by both modes
+        client = fakegenai.FakeClient(
+            image_latency=args.fake_latency,
+            error_rate=args.fake_failure_rate / 2,
+            error_codes=[429, 503, fakegenai.TIMEOUT],
+            block_rate=args.fake_failure_rate / 2,
+            image_size=512,
+        )
+        cprint(f"Using the offline fake backend: {client!r}", "yellow")
+    if args.review:
+        review_batch(args.staging)
+    elif args.batch:
+        gen_client = client
+        if not gen_client:
+            cprint(
+                "Exiting: AI Client could not be initialized. Please provide API Key (or use --fake).",
+                "red",
+                attrs=["bold"],
+            )
+            sys.exit(1)
+        try:
+            asyncio.run(
+                run_batch(
+                    gen_client,
+                    load_creatures(CREATURES_FILE),
+                    args.staging,
+                    args.concurrency,
+                    args.only,
+                    args.regenerate,
+                    args.retry_failed,
+                )
+            )
+        except KeyboardInterrupt:
+            cprint("\nBatch interrupted; run the same command again to resume.", "yellow")
+    elif not client and (not GEMINI_API_KEY or GEMINI_API_KEY == "YOUR_GEMINI_API_KEY_HERE"):
         cprint(
             "Exiting: AI Client could not be initialized. Please provide API Key.",
             "red",
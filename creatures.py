@@ -0,0 +1,168 @@
+# creatures.py
+"""
+Creature registry: Creatures.json validated once and indexed for the browser routes.
+
+`load()` runs at startup; afterwards `registry.get(slug)` and `registry.summaries`
+are plain dict/list reads, so no request re-slugifies, re-validates or re-sorts.
+Numeric stats are parsed into (min, max) once and kept in sorted indexes, so
+`registry.query()` (GET /api/creatures) filters by range with binary searches.
+"""
+
+import logging
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+from pydantic import ValidationError
+from slugify import slugify
+
+import config
+import models
+import utils
+
+log = logging.getLogger(__name__)
+
+NUMERIC_STATS = ("armor_class", "hit_dice", "movement", "number_appearing")
+
+StatRange = Tuple[Optional[int], Optional[int]]  # Inclusive (low, high) query bounds
+
+
+class _StatIndex:
+    """Creatures with a numeric value for one stat, sorted by its min and by its max."""
+
+    def __init__(self, stat: str, summaries: List[models.CreatureSummary]):
+        def bound(s: models.CreatureSummary, end: str) -> Optional[int]:
+            return getattr(s, f"{stat}_{end}")
+
+        numeric = [s for s in summaries if bound(s, "min") is not None]
+        by_min = sorted(numeric, key=lambda s: (bound(s, "min"), bound(s, "max"), s.name))
+        by_max = sorted(numeric, key=lambda s: (bound(s, "max"), s.name))
+        self.min_keys = [bound(s, "min") for s in by_min]
+        self.min_slugs = [s.slug for s in by_min]
+        self.max_keys = [bound(s, "max") for s in by_max]
+        self.max_slugs = [s.slug for s in by_max]
+        # Sort order for this stat: by lower bound, creatures without a value last
+        self.ordered = by_min + [s for s in summaries if bound(s, "min") is None]
+        self.numeric_count = len(by_min)
+
+    def overlapping(self, low: Optional[int], high: Optional[int]) -> Set[str]:
+        """Slugs whose [min, max] overlaps [low, high]: min <= high and max >= low."""
+        slugs: Optional[Set[str]] = None
+        if high is not None:
+            slugs = set(self.min_slugs[: bisect_right(self.min_keys, high)])
+        if low is not None:
+            above = set(self.max_slugs[bisect_left(self.max_keys, low) :])
+            slugs = above if slugs is None else slugs & above
+        return slugs if slugs is not None else set(self.min_slugs)
+
+
+class CreatureRegistry:
+    """Validated creatures with a slug index and a name-sorted summary list."""
+
+    def __init__(self, raw_creatures: List[Dict[str, Any]]):
+        self.by_slug: Dict[str, Dict[str, Any]] = {}  # slug -> creature data (template/JSON shape)
+        self.models: Dict[str, models.Creature] = {}  # slug -> validated model
+        self.summaries: List[models.CreatureSummary] = []  # Sorted by name
+        self._stat_indexes: Dict[str, _StatIndex] = {}
+        self._species: Dict[str, List[str]] = {}  # Casefolded base species -> slugs
+
+        for raw in raw_creatures:
+            try:
+                creature = models.Creature.model_validate(raw)
+            except ValidationError as e:
+                name = raw.get("name", "Unknown") if isinstance(raw, dict) else "Unknown"
+                log.warning(f"Skipping invalid creature '{name}': {e}")
+                continue
+            slug = slugify(creature.name)
+            if not slug:
+                log.warning(f"Skipping creature with unusable name '{creature.name}'.")
+                continue
+            if slug in self.by_slug:
+                log.warning(
+                    f"Duplicate creature slug '{slug}' ('{creature.name}'); keeping the first."
+                )
+                continue
+            self.models[slug] = creature
+            self.by_slug[slug] = creature.model_dump()
+            self.summaries.append(_summarize(creature, slug))
+        self.summaries.sort(key=lambda s: s.name)
+
+        for stat in NUMERIC_STATS:
+            self._stat_indexes[stat] = _StatIndex(stat, self.summaries)
+        for summary in self.summaries:
+            species = (summary.base_species or "").casefold()
+            self._species.setdefault(species, []).append(summary.slug)
+
+    def __len__(self) -> int:
+        return len(self.by_slug)
+
+    def get(self, slug: str) -> Optional[Dict[str, Any]]:
+        """Creature data for a slug, or None."""
+        return self.by_slug.get(slug)
+
+    def data(self) -> List[Dict[str, Any]]:
+        """All creature data, in name order."""
+        return [self.by_slug[s.slug] for s in self.summaries]
+
+    def query(
+        self,
+        ranges: Optional[Mapping[str, StatRange]] = None,
+        species: Optional[str] = None,
+        sort: models.CreatureSortField = models.CreatureSortField.NAME,
+        descending: bool = False,
+    ) -> List[models.CreatureSummary]:
+        """
+        Creatures matching every filter, in the requested order. `ranges` maps a stat in
+        NUMERIC_STATS to inclusive (low, high) bounds (either may be None); a creature
+        matches if its parsed range overlaps them, and creatures without a numeric value
+        for a filtered stat are excluded. `species` is a case-insensitive substring of
+        base_species. Creatures without a value for the sort stat always come last.
+        """
+        selected: Optional[Set[str]] = None
+        for stat, (low, high) in (ranges or {}).items():
+            if low is None and high is None:
+                continue
+            slugs = self._stat_indexes[stat].overlapping(low, high)
+            selected = slugs if selected is None else selected & slugs
+        if species:
+            needle = species.casefold()
+            slugs = {
+                slug for name, group in self._species.items() if needle in name for slug in group
+            }
+            selected = slugs if selected is None else selected & slugs
+
+        if sort == models.CreatureSortField.NAME:
+            ordered = self.summaries[::-1] if descending else self.summaries
+        else:
+            index = self._stat_indexes[sort.value]
+            ordered = index.ordered
+            if descending:  # Reverse the numeric part only, keep value-less creatures last
+                numeric = ordered[: index.numeric_count]
+                ordered = numeric[::-1] + ordered[index.numeric_count :]
+        if selected is None:
+            return list(ordered)
+        return [s for s in ordered if s.slug in selected]
+
+
+registry = CreatureRegistry([])  # Replaced by load(); read as creatures.registry
+
+
+def _summarize(creature: models.Creature, slug: str) -> models.CreatureSummary:
+    """Builds a creature's summary, parsing its numeric stats once."""
+    fields: Dict[str, Any] = {}
+    for stat in NUMERIC_STATS:
+        value = getattr(creature.stats, stat)
+        parsed = utils.parse_stat_range(value)
+        fields[stat] = value
+        fields[f"{stat}_min"], fields[f"{stat}_max"] = parsed or (None, None)
+    return models.CreatureSummary(
+        name=creature.name, slug=slug, base_species=creature.base_species, **fields
+    )
+
+
+def load(raw_creatures: List[Dict[str, Any]]) -> CreatureRegistry:
+    """Builds the registry from Creatures.json data and makes it current."""
+    global registry
+    registry = CreatureRegistry(raw_creatures)
+    config.CREATURE_DATA = registry.data()
+    log.info(f"Creature registry built ({len(registry)} creatures).")
+    return registry
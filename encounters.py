@@ -0,0 +1,115 @@
+# encounters.py
+"""
+Bulk encounter rolling for POST /api/encounters.
+
+Each creature's 'number appearing' range and hit dice (d6 each) are compiled into
+cached dice samplers, and every roll for a creature across all requested encounters
+is drawn in two batches (group sizes, then one HP roll per individual) from a
+seeded generator, so thousands of encounters cost a handful of calls per creature.
+"""
+
+import logging
+import random
+from statistics import fmean
+from typing import Dict, List, Optional, Tuple
+
+import config
+import creatures
+import dice
+import models
+import utils
+
+log = logging.getLogger(__name__)
+
+
+def creature_samplers(
+    summary: models.CreatureSummary,
+) -> Tuple[dice.DiceSampler, Optional[dice.DiceSampler]]:
+    """(number appearing, hit points) samplers for a creature; compiled once, then cached."""
+    appearing = dice.stat_sampler(summary.number_appearing) or dice.compile_dice("1")
+    hit_dice = utils.parse_stat_range(summary.hit_dice)
+    hit_points = dice.compile_dice(f"{hit_dice[0]}d6") if hit_dice and hit_dice[0] > 0 else None
+    return appearing, hit_points
+
+
+def _pick_creatures(
+    registry: creatures.CreatureRegistry, req: models.EncounterRequest, rng: random.Random
+) -> List[List[models.CreatureSummary]]:
+    """The creatures met in each encounter: the requested ones, or one random match each."""
+    by_slug = {s.slug: s for s in registry.summaries}
+    if req.creatures:
+        unknown = [slug for slug in req.creatures if slug not in by_slug]
+        if unknown:
+            raise ValueError(f"Unknown creature slug(s): {', '.join(unknown)}")
+        met = [by_slug[slug] for slug in dict.fromkeys(req.creatures)]  # De-duplicated
+        return [met] * req.count
+
+    candidates = registry.query(
+        {"armor_class": (req.ac_min, req.ac_max), "hit_dice": (req.hd_min, req.hd_max)},
+        req.species,
+    )
+    if not candidates:
+        raise ValueError("No creatures match the given filters.")
+    return [[creature] for creature in rng.choices(candidates, k=req.count)]
+
+
+def roll_encounters(
+    registry: creatures.CreatureRegistry, req: models.EncounterRequest
+) -> models.EncounterResponse:
+    """Rolls req.count encounters. Raises ValueError for an invalid request. CPU-bound."""
+    if req.count > config.MAX_ENCOUNTERS_PER_REQUEST:
+        raise ValueError(
+            f"At most {config.MAX_ENCOUNTERS_PER_REQUEST} encounters can be rolled per request."
+        )
+    seed = req.seed if req.seed is not None else random.SystemRandom().randrange(2**32)
+    rng = random.Random(seed)
+    met = _pick_creatures(registry, req, rng)
+
+    # Which encounters each creature appears in, so its rolls can be drawn in bulk
+    appearances: Dict[str, List[int]] = {}
+    summaries: Dict[str, models.CreatureSummary] = {}
+    for i, encounter in enumerate(met):
+        for creature in encounter:
+            appearances.setdefault(creature.slug, []).append(i)
+            summaries[creature.slug] = creature
+
+    groups: List[List[models.EncounterGroup]] = [[] for _ in met]
+    stats: List[models.EncounterCreatureStats] = []
+    for slug, encounter_ids in appearances.items():
+        creature = summaries[slug]
+        appearing_sampler, hp_sampler = creature_samplers(creature)
+        sizes = appearing_sampler.sample(rng, len(encounter_ids))
+        hit_points = hp_sampler.sample(rng, sum(sizes)) if hp_sampler else []
+
+        group_totals: List[int] = []
+        offset = 0
+        for encounter_id, size in zip(encounter_ids, sizes):
+            group_hp = hit_points[offset : offset + size]
+            offset += size
+            group_totals.append(sum(group_hp))
+            if req.include_rolls:
+                groups[encounter_id].append(
+                    models.EncounterGroup(
+                        slug=slug, name=creature.name, number_appearing=size, hit_points=group_hp
+                    )
+                )
+        stats.append(
+            models.EncounterCreatureStats(
+                slug=slug,
+                name=creature.name,
+                encounters=len(encounter_ids),
+                number_appearing_dice=appearing_sampler.expression,
+                hit_points_dice=hp_sampler.expression if hp_sampler else None,
+                number_appearing_mean=fmean(sizes),
+                number_appearing_min=min(sizes),
+                number_appearing_max=max(sizes),
+                hit_points_mean=fmean(hit_points) if hit_points else None,
+                group_hit_points_mean=fmean(group_totals) if hp_sampler else None,
+            )
+        )
+
+    stats.sort(key=lambda s: s.name)
+    log.info(f"Rolled {req.count} encounters with {len(stats)} creature type(s) (seed {seed}).")
+    return models.EncounterResponse(
+        seed=seed, count=req.count, encounters=groups if req.include_rolls else [], stats=stats
+    )
@@ -0,0 +1,313 @@
+# fakegenai.py
+"""
+A local stand-in for google-genai's Client, for load tests and benchmarks offline.
+
+FakeClient answers the calls the app makes (`models.generate_content`, and
+`aio.models.generate_content` / `generate_content_stream`) with real
+genai response objects: procedurally generated text and PNG images, deterministic
+per prompt, after latencies drawn from configurable distributions. A share of calls
+fail with API errors or timeouts, and a share come back blocked, so queueing,
+retries, caching and streaming can be measured without a network. Select it with
+AI_BACKEND=fake (see config.py). Deliberately free of project imports so the
+standalone creatures-img-gen.py script can use it too.
+"""
+
+import asyncio
+import functools
+import hashlib
+import io
+import logging
+import random
+import time
+from typing import Any, AsyncIterator, List, Optional, Sequence, Tuple
+
+import httpx  # Installed with google-genai, which uses it for transport
+from google.genai import errors as genai_errors, types as genai_types
+from PIL import Image, ImageDraw
+
+log = logging.getLogger(__name__)
+
+TIMEOUT = "timeout"  # Error "code" for a call that times out instead of returning a status
+
+_WORDS = {
+    "build": ["wiry", "hulking", "gaunt", "compact", "towering", "lithe"],
+    "skin": ["scaled", "furred", "leathery", "crystalline", "mottled", "chitinous"],
+    "eyes": ["amber", "milky", "glowing green", "compound", "mismatched", "violet"],
+    "gear": [
+        "a salvaged laser pistol",
+        "a rusted power-armor gauntlet",
+        "a spear tipped with pre-war glass",
+        "a patched radiation cloak",
+        "a backpack of scavenged circuitry",
+        "a bone-handled machete",
+    ],
+    "mood": ["wary", "cheerful", "grim", "curious", "restless", "calculating"],
+    "place": [
+        "the glowing craters of the old city",
+        "a mutant-infested swamp",
+        "the ruins of a Cryptic Alliance outpost",
+        "the salt flats beyond the Deathlands",
+        "a collapsed orbital elevator",
+        "a radioactive pine forest",
+    ],
+}
+
+
+class Latency:
+    """
+    A latency distribution in seconds, from a spec like "fixed:2", "uniform:1,3",
+    "normal:2,0.5" (mean, stdev) or "lognormal:8,0.5" (median, sigma; a long tail
+    like real model latencies). Samples are never negative.
+    """
+
+    KINDS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+
+    def __init__(self, spec: str):
+        kind, _, params = spec.partition(":")
+        kind = kind.strip().lower()
+        try:
+            values = [float(v) for v in params.split(",")] if params else []
+        except ValueError:
+            raise ValueError(f"Invalid latency spec '{spec}': parameters must be numbers")
+        if self.KINDS.get(kind) != len(values):
+            raise ValueError(
+                f"Invalid latency spec '{spec}': expected one of fixed:s, uniform:lo,hi, "
+                "normal:mean,stdev or lognormal:median,sigma"
+            )
+        self.spec = spec
+        self.kind = kind
+        self.values = values
+
+    def sample(self, rng: random.Random) -> float:
+        a = self.values[0]
+        if self.kind == "fixed":
+            return max(0.0, a)
+        b = self.values[1]
+        if self.kind == "uniform":
+            return max(0.0, rng.uniform(a, b))
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(a, b))
+        return rng.lognormvariate(0.0, b) * a  # lognormal: median * e^N(0, sigma)
+
+    def __repr__(self) -> str:
+        return f"Latency({self.spec!r})"
+
+
+def _prompt_text(contents: Any) -> str:
+    """The text parts of a request's contents, joined (images and other parts are skipped)."""
+    items = contents if isinstance(contents, (list, tuple)) else [contents]
+    texts = [item for item in items if isinstance(item, str)]
+    texts += [item.text for item in items if isinstance(item, genai_types.Part) and item.text]
+    return "\n".join(texts)
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+
+
+def _fake_description(prompt: str) -> str:
+    """A few paragraphs of plausible character text, the same for the same prompt."""
+    rng = random.Random(_seed(prompt))
+    pick = {key: rng.choice(words) for key, words in _WORDS.items()}
+    return (
+        f"A {pick['build']}, {pick['skin']} figure with {pick['eyes']} eyes, this wanderer "
+        f"carries {pick['gear']} and the {pick['mood']} bearing of someone who has "
+        "survived too many raids to trust easy promises.\n\n"
+        f"Raised among the scavengers of {pick['place']}, they learned early that every "
+        "relic of the Ancients can save a life or end one. Their mutations set them apart "
+        "even there, and they left to find a place where strangeness is an asset.\n\n"
+        "They travel light, trade fairly, and keep a careful tally of every debt owed to "
+        "them, whether in water, ammunition or favors."
+    )
+
+
+@functools.lru_cache(maxsize=32)
+def _fake_image(seed: int, size: int) -> bytes:
+    """
+    A noisy, seed-coloured PNG about as large as a real generated image (cached, so a
+    load test spends its CPU in the app rather than here).
+    """
+    rng = random.Random(seed)
+    base = Image.new("RGB", (size, size), tuple(rng.randrange(256) for _ in range(3)))
+    noise = Image.effect_noise((size, size), 64).convert("RGB")
+    img = Image.blend(base, noise, 0.35)
+    draw = ImageDraw.Draw(img)
+    for _ in range(6):
+        x, y, r = rng.randrange(size), rng.randrange(size), rng.randrange(size // 16, size // 4)
+        colour = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=colour)
+    draw.text((16, 16), "FAKE AI IMAGE", fill=(255, 255, 255))
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _usage(prompt: str, output_tokens: int) -> genai_types.GenerateContentResponseUsageMetadata:
+    prompt_tokens = max(1, len(prompt) // 4)  # Roughly four characters per token
+    return genai_types.GenerateContentResponseUsageMetadata(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=output_tokens,
+        total_token_count=prompt_tokens + output_tokens,
+    )
+
+
+def _candidate(parts: List[genai_types.Part]) -> genai_types.Candidate:
+    return genai_types.Candidate(
+        content=genai_types.Content(role="model", parts=parts),
+        finish_reason=genai_types.FinishReason.STOP,
+    )
+
+
+class FakeClient:
+    """
+    Drop-in for genai.Client. Text requests take text_latency (to the first chunk when
+    streaming, then chunk_latency per chunk); requests with the IMAGE response modality
+    take image_latency. Each call fails with probability error_rate (an APIError with
+    one of error_codes, or a timeout for "timeout") and is otherwise blocked with
+    probability block_rate (a response without candidates and one of block_reasons).
+    """
+
+    def __init__(
+        self,
+        text_latency: Latency = Latency("lognormal:1.5,0.4"),
+        image_latency: Latency = Latency("lognormal:8,0.4"),
+        chunk_latency: Latency = Latency("uniform:0.03,0.12"),
+        error_rate: float = 0.0,
+        error_codes: Sequence[Any] = (429, 503),
+        block_rate: float = 0.0,
+        block_reasons: Sequence[str] = ("SAFETY",),
+        image_size: int = 1024,
+        seed: Optional[int] = None,
+    ):
+        self.text_latency = text_latency
+        self.image_latency = image_latency
+        self.chunk_latency = chunk_latency
+        self.error_rate = error_rate
+        self.error_codes = list(error_codes)
+        self.block_rate = block_rate
+        self.block_reasons = list(block_reasons)
+        self.image_size = image_size
+        self.rng = random.Random(seed)  # Drives latencies and failures, not the content
+        self.models = _SyncModels(self)
+        self.aio = _AsyncNamespace(_AsyncModels(self))
+
+    def __repr__(self) -> str:
+        return (
+            f"FakeClient(text={self.text_latency.spec}, image={self.image_latency.spec}, "
+            f"errors={self.error_rate}, blocks={self.block_rate})"
+        )
+
+    # --- Outcomes ---
+
+    def _is_image(self, config: Any) -> bool:
+        modalities = getattr(config, "response_modalities", None) or []
+        return any(str(getattr(m, "value", m)).upper() == "IMAGE" for m in modalities)
+
+    def _plan(self, image: bool) -> Tuple[float, Optional[BaseException], bool]:
+        """Draws (delay, error, blocked) for one call."""
+        delay = (self.image_latency if image else self.text_latency).sample(self.rng)
+        roll = self.rng.random()
+        if roll < self.error_rate and self.error_codes:
+            code = self.rng.choice(self.error_codes)
+            if code == TIMEOUT:
+                return delay, httpx.ReadTimeout("Fake backend: simulated timeout"), False
+            return delay * 0.1, self._api_error(int(code)), False  # Errors come back fast
+        return delay, None, roll < self.error_rate + self.block_rate
+
+    @staticmethod
+    def _api_error(code: int) -> genai_errors.APIError:
+        error_class = genai_errors.ServerError if code >= 500 else genai_errors.ClientError
+        return error_class(
+            code,
+            {"error": {"code": code, "message": "Fake backend: simulated error", "status": "FAKE"}},
+        )
+
+    def _blocked(self, prompt: str) -> genai_types.GenerateContentResponse:
+        return genai_types.GenerateContentResponse(
+            prompt_feedback=genai_types.GenerateContentResponsePromptFeedback(
+                block_reason=self.rng.choice(self.block_reasons)
+            ),
+            usage_metadata=_usage(prompt, 0),
+        )
+
+    def _response(self, prompt: str, image: bool) -> genai_types.GenerateContentResponse:
+        if image:
+            data = _fake_image(_seed(prompt), self.image_size)
+            parts = [
+                genai_types.Part(text="Here is the illustration."),
+                genai_types.Part(inline_data=genai_types.Blob(mime_type="image/png", data=data)),
+            ]
+            output_tokens = 1290  # What Gemini bills per generated image
+        else:
+            text = _fake_description(prompt)
+            parts = [genai_types.Part(text=text)]
+            output_tokens = len(text) // 4
+        return genai_types.GenerateContentResponse(
+            candidates=[_candidate(parts)], usage_metadata=_usage(prompt, output_tokens)
+        )
+
+    # --- Calls ---
+
+    def generate_content(self, model: str, contents: Any, config: Any = None):
+        prompt, image = _prompt_text(contents), self._is_image(config)
+        delay, error, blocked = self._plan(image)
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return self._blocked(prompt) if blocked else self._response(prompt, image)
+
+    async def agenerate_content(self, model: str, contents: Any, config: Any = None):
+        prompt, image = _prompt_text(contents), self._is_image(config)
+        delay, error, blocked = self._plan(image)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        if blocked:
+            return self._blocked(prompt)
+        if image:  # Encoding a new image takes a moment; keep it off the event loop
+            return await asyncio.to_thread(self._response, prompt, image)
+        return self._response(prompt, image)
+
+    async def agenerate_content_stream(
+        self, model: str, contents: Any, config: Any = None
+    ) -> AsyncIterator[genai_types.GenerateContentResponse]:
+        prompt = _prompt_text(contents)
+        delay, error, blocked = self._plan(image=False)
+        await asyncio.sleep(delay)  # Time to the first chunk
+        if error is not None:
+            raise error
+        return self._stream(prompt, blocked)
+
+    async def _stream(
+        self, prompt: str, blocked: bool
+    ) -> AsyncIterator[genai_types.GenerateContentResponse]:
+        if blocked:
+            yield self._blocked(prompt)
+            return
+        words = _fake_description(prompt).split(" ")
+        for i in range(0, len(words), 8):
+            if i:
+                await asyncio.sleep(self.chunk_latency.sample(self.rng))
+            text = " ".join(words[i : i + 8]) + (" " if i + 8 < len(words) else "")
+            yield genai_types.GenerateContentResponse(
+                candidates=[_candidate([genai_types.Part(text=text)])]
+            )
+        yield genai_types.GenerateContentResponse(
+            usage_metadata=_usage(prompt, len(words) * 4 // 3)
+        )
+
+
+class _SyncModels:
+    def __init__(self, client: FakeClient):
+        self.generate_content = client.generate_content
+
+
+class _AsyncModels:
+    def __init__(self, client: FakeClient):
+        self.generate_content = client.agenerate_content
+        self.generate_content_stream = client.agenerate_content_stream
+
+
+class _AsyncNamespace:
+    def __init__(self, models: _AsyncModels):
+        self.models = models
@@ -0,0 +1,306 @@
+# httpcache.py
+"""
+HTTP caching for images: strong content-hash ETags, per-mount Cache-Control
+policies, and content-hashed URLs that browsers may cache forever. Also holds
+pre-rendered, pre-compressed HTML pages for routes whose output rarely changes.
+
+A hashed URL embeds the first HASH_CHARS hex digits of the file's sha256, either in
+the name (/static/images/ark.<hash>.png) or as ?v=<hash> (/variants/...). When the
+hash matches the file currently on disk the response is marked immutable; a stale
+hash still gets the file, just with the mount's normal policy.
+"""
+
+import calendar
+import gzip
+import hashlib
+import logging
+import os
+import re
+import stat
+from collections import OrderedDict
+from email.utils import formatdate, parsedate
+from pathlib import Path
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, HTMLResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+import config
+import imageindex
+import imaging
+
+try:
+    import brotli
+except ImportError:  # Optional: pages are still served gzipped or plain without it
+    brotli = None
+
+log = logging.getLogger(__name__)
+
+HASH_CHARS = imaging.HASH_CHARS
+HASHED_NAME_RE = re.compile(
+    r"^(?P<stem>[^.]+)\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.[A-Za-z0-9]+)$" % HASH_CHARS
+)
+HASH_CACHE_SIZE = 4096  # Files whose content hash is remembered (keyed by path, size, mtime)
+
+_hash_cache: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()
+
+
+def content_hash(path: Path, st: Optional[os.stat_result] = None) -> str:
+    """
+    sha256 of a file, from the image manifest when it is current, else computed once
+    per (size, mtime) and remembered. Blocking: call from a worker thread.
+    """
+    st = st or os.stat(path)
+    key = str(path)
+    cached = _hash_cache.get(key)
+    if cached and cached[:2] == (st.st_size, st.st_mtime_ns):
+        _hash_cache.move_to_end(key)
+        return cached[2]
+
+    digest = None
+    try:
+        rel = Path(path).relative_to(config.IMAGE_DIR).as_posix()
+        entry = imageindex.manifest().get(rel)
+        if entry and entry.get("stamp") == [st.st_size, st.st_mtime_ns]:
+            digest = entry["sha256"]
+    except ValueError:
+        pass  # Not under images/, so not in the manifest
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+
+    _hash_cache[key] = (st.st_size, st.st_mtime_ns, digest)
+    if len(_hash_cache) > HASH_CACHE_SIZE:
+        _hash_cache.popitem(last=False)
+    return digest
+
+
+def is_not_modified(etag: str, request_headers: Headers) -> bool:
+    """True if the request's If-None-Match already names this ETag."""
+    if_none_match = request_headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    ]
+
+
+def cached_file_response(
+    path: Path,
+    request_headers: Headers,
+    cache_control: str,
+    requested_hash: Optional[str] = None,
+    media_type: Optional[str] = None,
+    headers: Optional[dict] = None,
+) -> Response:
+    """
+    FileResponse (or 304) with a content-hash ETag. Uses the immutable policy when
+    requested_hash matches the file's hash. Blocking: call from a worker thread.
+    """
+    st = os.stat(path)
+    digest = content_hash(path, st)
+    response = FileResponse(path, stat_result=st, media_type=media_type, headers=headers)
+    response.headers["etag"] = f'"{digest}"'
+    if requested_hash and digest.startswith(requested_hash):
+        response.headers["cache-control"] = config.IMMUTABLE_CACHE_CONTROL
+    else:
+        response.headers["cache-control"] = cache_control
+    if is_not_modified(response.headers["etag"], request_headers):
+        return NotModifiedResponse(response.headers)
+    return response
+
+
+IMAGE_SUFFIXES = (".png", ".webp", ".avif", ".jpg", ".jpeg", ".gif")
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles that adds content-hash ETags, a Cache-Control policy, and hashed names.
+    Only files with one of `suffixes` are served (not manifests or in-flight temp files).
+    """
+
+    def __init__(
+        self,
+        *,
+        directory: Path,
+        cache_control: str,
+        suffixes: Tuple[str, ...] = IMAGE_SUFFIXES,
+        **kwargs,
+    ):
+        super().__init__(directory=directory, **kwargs)
+        self.cache_control = cache_control
+        self.suffixes = suffixes
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+
+        if not path.lower().endswith(self.suffixes):
+            raise HTTPException(status_code=404)
+
+        requested_hash = None
+        head, name = os.path.split(path)
+        match = HASHED_NAME_RE.match(name)
+        if match:
+            path = os.path.join(head, match["stem"] + match["ext"])
+            requested_hash = match["hash"]
+
+        try:
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+        except OSError:
+            raise HTTPException(status_code=404)
+        if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+            raise HTTPException(status_code=404)
+
+        return await anyio.to_thread.run_sync(
+            cached_file_response,
+            Path(full_path),
+            Headers(scope=scope),
+            self.cache_control,
+            requested_hash,
+        )
+
+
+# --- URL Helpers ---
+
+
+def static_url(image_path: str) -> str:
+    """
+    URL for a static-relative image path: content-hashed (cacheable forever) when
+    the manifest describes the file as it is now, else the plain /static URL.
+    """
+    digest = imaging.current_hash(image_path)
+    if digest is None:
+        return f"/static/{image_path}"
+    stem, _, ext = image_path.rpartition(".")
+    return f"/static/{stem}.{digest}.{ext}"
+
+
+# --- Rendered Pages ---
+
+GZIP_LEVEL = 9  # Pages are compressed once per render, so the slowest setting is affordable
+BROTLI_QUALITY = 11
+
+
+class RenderedPage:
+    """An HTML page rendered once, with its compressed encodings and a content-hash ETag."""
+
+    __slots__ = ("bodies", "etag", "last_modified")
+
+    def __init__(self, html: str, last_modified: Optional[float] = None):
+        body = html.encode("utf-8")
+        self.bodies: Dict[str, bytes] = {"identity": body}
+        gzipped = gzip.compress(body, GZIP_LEVEL, mtime=0)  # mtime=0: same bytes every render
+        if len(gzipped) < len(body):
+            self.bodies["gzip"] = gzipped
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+            if len(compressed) < len(body):
+                self.bodies["br"] = compressed
+        self.etag = hashlib.sha256(body).hexdigest()[: HASH_CHARS * 2]
+        self.last_modified = last_modified
+
+
+def _accepted_encodings(accept_encoding: str) -> Dict[str, float]:
+    """Parses an Accept-Encoding header into {coding: q}."""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                pass
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def _http_date(value: str) -> Optional[int]:
+    """Parses an HTTP date header into a POSIX timestamp, or None if malformed."""
+    parsed = parsedate(value)
+    return calendar.timegm(parsed) if parsed else None
+
+
+def choose_encoding(page: RenderedPage, accept_encoding: str) -> str:
+    """Picks the smallest encoding of the page that the client accepts."""
+    accepted = _accepted_encodings(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    for coding in ("br", "gzip"):  # Smallest first
+        if coding in page.bodies and accepted.get(coding, wildcard) > 0:
+            return coding
+    return "identity"
+
+
+def page_response(
+    page: RenderedPage,
+    request_headers: Headers,
+    cache_control: str = config.REVALIDATE_CACHE_CONTROL,
+) -> Response:
+    """
+    Serves a rendered page in the best accepted encoding, or 304 if the client's copy
+    (If-None-Match, else If-Modified-Since) is current. Cheap: no rendering or compression.
+    """
+    coding = choose_encoding(page, request_headers.get("accept-encoding", ""))
+    # Each encoding is a different byte sequence, so it gets its own strong ETag
+    etag = f'"{page.etag}"' if coding == "identity" else f'"{page.etag}-{coding}"'
+    headers = {"etag": etag, "cache-control": cache_control, "vary": "Accept-Encoding"}
+    if page.last_modified is not None:
+        headers["last-modified"] = formatdate(page.last_modified, usegmt=True)
+
+    if "if-none-match" in request_headers:
+        if is_not_modified(etag, request_headers):
+            return NotModifiedResponse(Headers(headers))
+    elif page.last_modified is not None and "if-modified-since" in request_headers:
+        since = _http_date(request_headers["if-modified-since"])
+        if since is not None and int(page.last_modified) <= since:
+            return NotModifiedResponse(Headers(headers))
+
+    if coding != "identity":
+        headers["content-encoding"] = coding
+    return HTMLResponse(page.bodies[coding], headers=headers)
+
+
+class PageCache:
+    """
+    Bounded LRU of rendered pages. Each entry remembers the `version` it was rendered
+    for (anything comparable: file stamps, data objects); a lookup with a different
+    version is a miss, so callers never have to invalidate on change explicitly.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._pages: "OrderedDict[Hashable, Tuple[Any, RenderedPage]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def get(self, key: Hashable, version: Any) -> Optional[RenderedPage]:
+        """The cached page for key if it was rendered for this version, else None."""
+        cached = self._pages.get(key)
+        if cached is None or cached[0] != version:
+            return None
+        self._pages.move_to_end(key)
+        return cached[1]
+
+    def put(self, key: Hashable, version: Any, page: RenderedPage) -> None:
+        self._pages[key] = (version, page)
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.max_entries:
+            self._pages.popitem(last=False)
+
+    def discard(self, key: Hashable) -> None:
+        self._pages.pop(key, None)
+
+    def clear(self) -> None:
+        self._pages.clear()
@@ -0,0 +1,192 @@
+# imageindex.py
+"""
+In-memory index of the source images under config.IMAGE_DIR, plus the optimizer's
+image manifest (config.IMAGE_MANIFEST_FILE).
+
+Page routes ask it whether a character or creature has an image, at what URL, and
+with what dimensions, and template helpers read content hashes and variant sizes
+from the manifest, instead of stat()ing files on every request. Both are loaded
+once at startup, updated by the save/delete/import paths in this process, and,
+with config.IMAGE_WATCH, by a filesystem watcher that picks up changes made by
+other worker processes or the offline optimizer.
+"""
+
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from PIL import Image, UnidentifiedImageError
+
+import config
+import models
+import paths
+import storage
+
+try:
+    import watchfiles
+except ImportError:  # Optional: only needed for config.IMAGE_WATCH
+    watchfiles = None
+
+log = logging.getLogger(__name__)
+
+SOURCE_SUFFIX = ".png"  # Variants (.webp/.avif) are derived data and not indexed
+
+_images: Dict[str, models.ImageInfo] = {}  # Static-relative path -> info
+# Bumped when creature or site art (not a character portrait) changes in the index or the
+# manifest, so creature pages can tell they are stale; portrait saves leave it alone
+art_generation = 0
+_manifest: Dict[str, Dict[str, Any]] = {}  # IMAGE_DIR-relative path -> optimizer manifest entry
+
+
+def _iter_source_files(directory: Path) -> Iterator[os.DirEntry]:
+    """Yields every source image under directory (recursively) via scandir."""
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_dir():
+            yield from _iter_source_files(Path(entry.path))
+        elif entry.name.endswith(SOURCE_SUFFIX) and not entry.name.startswith("."):
+            yield entry
+
+
+def _read_info(path: Path, st: Optional[os.stat_result] = None) -> Optional[models.ImageInfo]:
+    """Reads size, mtime and dimensions (header only) of an image, or None if unreadable."""
+    try:
+        st = st or path.stat()
+        with Image.open(path) as img:
+            width, height = img.size
+    except (OSError, UnidentifiedImageError) as e:
+        log.warning(f"Could not index image {path}: {e}")
+        return None
+    return models.ImageInfo(
+        path=paths.static_url_path(path),
+        width=width,
+        height=height,
+        size=st.st_size,
+        mtime_ns=st.st_mtime_ns,
+    )
+
+
+def _art_only(entries: Dict[str, Any], root: Path) -> Dict[str, Any]:
+    """The entries (keyed by path relative to root) that are not character portraits."""
+    return {
+        key: value for key, value in entries.items() if not paths.is_character_image(root / key)
+    }
+
+
+def build() -> int:
+    """(Re)builds the index from disk. Blocking: run via storage.run_io. Returns the count."""
+    global _images, art_generation
+    images: Dict[str, models.ImageInfo] = {}
+    for entry in _iter_source_files(config.IMAGE_DIR):
+        path = Path(entry.path)
+        previous = _images.get(paths.static_url_path(path))
+        st = entry.stat()
+        if previous and (previous.size, previous.mtime_ns) == (st.st_size, st.st_mtime_ns):
+            images[previous.path] = previous  # Unchanged: skip re-reading the header
+            continue
+        info = _read_info(path, st)
+        if info:
+            images[info.path] = info
+    if _art_only(images, config.STATIC_DIR) != _art_only(_images, config.STATIC_DIR):
+        art_generation += 1
+    _images = images  # Swap in whole, so readers never see a half-built index
+    log.info(f"Image index built with {len(images)} images.")
+    return len(images)
+
+
+def refresh(path: Path) -> Optional[models.ImageInfo]:
+    """Re-reads one image into the index, or drops it if the file is gone. Blocking."""
+    global art_generation
+    key = paths.static_url_path(path)
+    info = _read_info(path) if path.is_file() else None
+    if info != _images.get(key) and not paths.is_character_image(path):
+        art_generation += 1
+    if info:
+        _images[key] = info
+    else:
+        _images.pop(key, None)
+    return info
+
+
+def refresh_character(char_id: str) -> None:
+    """Re-reads a character's portrait locations after a save, import or delete. Blocking."""
+    for path in (paths.character_image_path(char_id), paths.legacy_character_image_path(char_id)):
+        refresh(path)
+
+
+def load_manifest() -> int:
+    """
+    (Re)reads the optimizer manifest into memory; an unreadable or missing file counts
+    as empty. The held mapping is only replaced when its content changed, so pages
+    versioned on it stay cached. Blocking: run via storage.run_io. Returns the count.
+    """
+    global _manifest, art_generation
+    try:
+        with config.IMAGE_MANIFEST_FILE.open("r", encoding="utf-8") as f:
+            images = json.load(f).get("images", {})
+    except FileNotFoundError:
+        images = {}
+    except (OSError, ValueError, AttributeError) as e:
+        log.warning(f"Ignoring unreadable image manifest {config.IMAGE_MANIFEST_FILE}: {e}")
+        images = {}
+    if not isinstance(images, dict):
+        images = {}
+    if images != _manifest:
+        if _art_only(images, config.IMAGE_DIR) != _art_only(_manifest, config.IMAGE_DIR):
+            art_generation += 1
+        _manifest = images  # Swapped in whole, like the image index
+        log.info(f"Image manifest loaded with {len(images)} entries.")
+    return len(images)
+
+
+def manifest() -> Dict[str, Dict[str, Any]]:
+    """The optimizer manifest as last loaded (empty if the optimizer has never run)."""
+    return _manifest
+
+
+def get(image_path: str) -> Optional[models.ImageInfo]:
+    """Info for a static-relative image path, if indexed."""
+    return _images.get(image_path)
+
+
+def character_image(char_id: str) -> Optional[models.ImageInfo]:
+    """A character's portrait (canonical location first, then legacy flat), if indexed."""
+    return get(paths.static_url_path(paths.character_image_path(char_id))) or get(
+        paths.static_url_path(paths.legacy_character_image_path(char_id))
+    )
+
+
+def creature_image(slug: str) -> Optional[models.ImageInfo]:
+    """A creature's art, if indexed."""
+    return get(paths.static_url_path(paths.creature_image_path(slug)))
+
+
+# --- Filesystem Watcher ---
+
+
+async def watch() -> None:
+    """
+    Keeps the index in sync with changes to config.IMAGE_DIR made by anyone (other
+    uvicorn workers, imports, the optimizer). Runs until cancelled.
+    """
+    if watchfiles is None:
+        log.warning("IMAGE_WATCH is set but 'watchfiles' is not installed; image watcher disabled.")
+        return
+    log.info(f"Watching {config.IMAGE_DIR} for image changes.")
+    async for changes in watchfiles.awatch(config.IMAGE_DIR):
+        changed = {
+            Path(p)
+            for _, p in changes
+            if p.endswith(SOURCE_SUFFIX) and not Path(p).name.startswith(".")
+        }
+        for path in changed:
+            await storage.run_io(refresh, path)
+        if changed:
+            log.debug(f"Image index refreshed for {len(changed)} changed file(s).")
+        if any(Path(p) == config.IMAGE_MANIFEST_FILE for _, p in changes):
+            await storage.run_io(load_manifest)  # Rewritten by the optimizer
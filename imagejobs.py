@@ -0,0 +1,245 @@
+# imagejobs.py
+"""
+Image generation as background jobs, so no HTTP request waits 10-30 s on Gemini.
+
+`submit()` returns at once with a job; the generation runs as a task limited to
+config.IMAGE_JOB_CONCURRENCY at a time (and config.IMAGE_JOB_MAX_PENDING queued or
+running in total). Submitting a description that already has a pending job returns
+that job. Every submission gets its own subscription token; `cancel()` withdraws
+that token (once), and only the last subscription leaving cancels the generation.
+Clients poll `get()` or follow `events()`; finished
+jobs are kept for config.IMAGE_JOB_TTL_SECONDS, at most config.IMAGE_JOB_MAX_FINISHED.
+A succeeded job carries an imagestore handle, not the image itself.
+"""
+
+import asyncio
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional, Set, Tuple
+
+import ai_services
+import aicache
+import config
+import imagestore
+import models
+import storage
+
+log = logging.getLogger(__name__)
+
+TERMINAL_STATES = {
+    models.ImageJobState.SUCCEEDED,
+    models.ImageJobState.FAILED,
+    models.ImageJobState.CANCELLED,
+}
+
+
+class ImageJob:
+    """One image generation: its state, result, and an event for change notifications."""
+
+    def __init__(self, request_data: models.GenerateImageRequest, key: str):
+        self.id = secrets.token_urlsafe(12)
+        self.key = key  # Dedup key of the request
+        self.request_data = request_data
+        self.state = models.ImageJobState.QUEUED
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.error: Optional[str] = None
+        self.error_status: Optional[int] = None
+        self.image_handle: Optional[str] = None
+        self.mime_type: Optional[str] = None
+        self.task: Optional["asyncio.Task[None]"] = None
+        self.subscriptions: Set[str] = set()  # Tokens of submissions not yet withdrawn
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.state in TERMINAL_STATES
+
+    def _set_state(self, state: models.ImageJobState) -> None:
+        self.state = state
+        if state == models.ImageJobState.RUNNING:
+            self.started = time.time()
+        elif state in TERMINAL_STATES:
+            self.finished = time.time()
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()  # Wakes every events() subscriber
+
+    def subscribe(self) -> str:
+        """Adds a subscription and returns its token (needed to cancel() it)."""
+        token = secrets.token_urlsafe(12)
+        self.subscriptions.add(token)
+        return token
+
+    def response(
+        self, deduplicated: bool = False, subscription: Optional[str] = None
+    ) -> models.ImageJobResponse:
+        return models.ImageJobResponse(
+            job_id=self.id,
+            subscription=subscription,
+            state=self.state,
+            created=self.created,
+            started=self.started,
+            finished=self.finished,
+            deduplicated=deduplicated,
+            error=self.error,
+            error_status=self.error_status,
+            image_handle=self.image_handle,
+            image_url=imagestore.url(self.image_handle, self.mime_type)
+            if self.image_handle
+            else None,
+            mime_type=self.mime_type,
+        )
+
+
+_jobs: "OrderedDict[str, ImageJob]" = OrderedDict()  # Job ID -> job, oldest first
+_pending: Dict[str, ImageJob] = {}  # Dedup key -> queued or running job
+_semaphore: Optional[asyncio.Semaphore] = None  # Created on first use, in the loop
+
+
+def _sweep() -> None:
+    """Drops finished jobs past their TTL, then the oldest beyond IMAGE_JOB_MAX_FINISHED."""
+    cutoff = time.time() - config.IMAGE_JOB_TTL_SECONDS
+    finished = [job for job in _jobs.values() if job.done]
+    excess = len(finished) - config.IMAGE_JOB_MAX_FINISHED
+    for i, job in enumerate(finished):
+        if i < excess or job.finished < cutoff:
+            del _jobs[job.id]
+
+
+async def _run(job: ImageJob) -> None:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(config.IMAGE_JOB_CONCURRENCY)
+    try:
+        async with _semaphore:
+            job._set_state(models.ImageJobState.RUNNING)
+            log.info(f"Image job {job.id} started.")
+            try:
+                status, result, mime_type = await ai_services.generate_ai_image(job.request_data)
+            except ai_services.AIServiceBusy as e:
+                status, result, mime_type = "error", str(e), None
+            if job.done:
+                return  # Cancelled while the result was on its way
+            if status == "success":
+                try:
+                    job.image_handle = await storage.run_io(imagestore.put, result, mime_type)
+                except OSError as e:
+                    log.error(f"Could not hold the image of job {job.id}: {e}", exc_info=True)
+                    status, result = "error", f"Could not store the generated image: {e}"
+            if status == "success":
+                job.mime_type = mime_type
+                job._set_state(models.ImageJobState.SUCCEEDED)
+                log.info(f"Image job {job.id} succeeded.")
+            else:
+                job.error = result
+                job.error_status = ai_services.error_status(result)
+                job._set_state(models.ImageJobState.FAILED)
+                log.warning(f"Image job {job.id} failed: {result}")
+    except asyncio.CancelledError:
+        _mark_cancelled(job)  # Not re-raised: the job task simply ends
+    finally:
+        if _pending.get(job.key) is job:
+            del _pending[job.key]
+
+
+def _mark_cancelled(job: ImageJob) -> None:
+    if not job.done:
+        job._set_state(models.ImageJobState.CANCELLED)
+        log.info(f"Image job {job.id} cancelled.")
+
+
+def submit(request_data: models.GenerateImageRequest) -> Tuple[ImageJob, bool]:
+    """
+    Starts a job for the request, or returns the pending job for the same description.
+    Either way the caller gets a new subscription to the job (see cancel()).
+    Returns (job, deduplicated, subscription token). Raises AIServiceBusy if too many
+    jobs are pending.
+    """
+    _sweep()
+    key = aicache.cache_key("image", request_data.description)
+    existing = _pending.get(key)
+    if existing is not None:
+        subscription = existing.subscribe()
+        log.info(
+            f"Image request joined pending job {existing.id} "
+            f"({len(existing.subscriptions)} subscriptions)."
+        )
+        return existing, True, subscription
+    if len(_pending) >= config.IMAGE_JOB_MAX_PENDING:
+        raise ai_services.AIServiceBusy(
+            "Too many image jobs are pending. Please try again shortly."
+        )
+
+    job = ImageJob(request_data, key)
+    subscription = job.subscribe()
+    _jobs[job.id] = job
+    _pending[key] = job
+    job.task = asyncio.create_task(_run(job))
+    log.info(f"Image job {job.id} queued ({len(_pending)} pending).")
+    return job, False, subscription
+
+
+def pending_count() -> int:
+    """Jobs queued or running."""
+    return len(_pending)
+
+
+def get(job_id: str) -> Optional[ImageJob]:
+    """The job with this ID, or None if unknown or expired."""
+    _sweep()
+    return _jobs.get(job_id)
+
+
+def cancel(job_id: str, subscription: str) -> Optional[ImageJob]:
+    """
+    Withdraws a subscription from a queued or running job, and cancels the job when the
+    last one leaves, like waiters on a shared gateway call: a deduplicated job keeps
+    running for the other clients. A token already withdrawn (a repeated cancel) or
+    unknown changes nothing. Finished jobs are left as they are.
+    """
+    job = get(job_id)
+    if job is not None and not job.done:
+        if subscription not in job.subscriptions:
+            return job
+        job.subscriptions.discard(subscription)
+        if job.subscriptions:
+            log.info(
+                f"Image job {job.id} kept for its {len(job.subscriptions)} other subscription(s)."
+            )
+            return job
+        if job.task is not None:
+            job.task.cancel()
+        # Recorded here too: a task cancelled before it first runs never enters _run
+        _mark_cancelled(job)
+        if _pending.get(job.key) is job:
+            del _pending[job.key]
+    return job
+
+
+async def events(
+    job: ImageJob, keepalive_seconds: float = 15.0
+) -> AsyncIterator[Optional[ImageJob]]:
+    """
+    Yields the job now and after each state change, ending after a terminal state.
+    Yields None every keepalive_seconds without a change (for SSE keep-alive comments).
+    """
+    while True:
+        changed = job._changed
+        yield job
+        if job.done:
+            return
+        while not changed.is_set():
+            try:
+                await asyncio.wait_for(changed.wait(), keepalive_seconds)
+            except asyncio.TimeoutError:
+                yield None
+
+
+def shutdown() -> None:
+    """Cancels all unfinished jobs."""
+    for job in list(_pending.values()):
+        if job.task is not None:
+            job.task.cancel()
@@ -0,0 +1,90 @@
+# imagestore.py
+"""
+Generated images held server-side until the character is saved (or they expire).
+
+A generated image is written once to config.GENERATED_IMAGE_DIR under a random
+handle. The browser gets the handle and a preview URL (/generated/<file>) instead
+of megabytes of base64, and save_character hard-links the held file into place, so
+the image is never re-sent, re-decoded or copied. Files expire after
+config.GENERATED_IMAGE_TTL_SECONDS, and the oldest are evicted once the store grows
+past config.GENERATED_IMAGE_MAX_BYTES. The directory is shared by all workers.
+All functions are blocking (run them via storage.run_io).
+"""
+
+import logging
+import re
+import secrets
+import time
+from pathlib import Path
+from typing import Optional
+
+import config
+import storage
+
+log = logging.getLogger(__name__)
+
+HANDLE_RE = re.compile(r"^[A-Za-z0-9_-]{22}$")  # secrets.token_urlsafe(16)
+EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/webp": ".webp"}
+
+
+def _sweep() -> None:
+    """Deletes expired files, then the oldest until the store fits its size cap."""
+    cutoff = time.time() - config.GENERATED_IMAGE_TTL_SECONDS
+    files = []
+    for path in config.GENERATED_IMAGE_DIR.glob("*.*"):
+        if path.name.startswith("."):
+            continue  # A temp file being written
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue  # Taken or swept by another worker
+        if st.st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+        else:
+            files.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= config.GENERATED_IMAGE_MAX_BYTES:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        log.info(f"Evicted held image {path.name} (store over its size cap).")
+
+
+def put(data: bytes, mime_type: Optional[str]) -> str:
+    """Holds a generated image and returns its handle."""
+    _sweep()
+    handle = secrets.token_urlsafe(16)
+    suffix = EXTENSIONS.get(mime_type or "", ".png")
+    storage.atomic_write_bytes(config.GENERATED_IMAGE_DIR / f"{handle}{suffix}", data)
+    log.info(f"Holding generated image {handle} ({len(data)} bytes).")
+    return handle
+
+
+def path(handle: str) -> Optional[Path]:
+    """The held file for a handle, or None if the handle is malformed, unknown or expired."""
+    if not HANDLE_RE.match(handle):
+        return None
+    for suffix in EXTENSIONS.values():
+        candidate = config.GENERATED_IMAGE_DIR / f"{handle}{suffix}"
+        try:
+            st = candidate.stat()
+        except FileNotFoundError:
+            continue
+        if st.st_mtime < time.time() - config.GENERATED_IMAGE_TTL_SECONDS:
+            return None  # Expired; the next sweep deletes it
+        return candidate
+    return None
+
+
+def url(handle: str, mime_type: Optional[str]) -> str:
+    """Preview URL of a held image (served by GET /generated/{filename})."""
+    return f"/generated/{handle}{EXTENSIONS.get(mime_type or '', '.png')}"
+
+
+def discard(handle: str) -> None:
+    """Deletes a held image once it has been saved (or is no longer wanted)."""
+    held = path(handle)
+    if held is not None:
+        held.unlink(missing_ok=True)
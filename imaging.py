@@ -0,0 +1,412 @@
+# imaging.py
+"""
+Resized variants of portraits and creature art.
+
+Each source PNG under config.IMAGE_DIR can have a 'full'-size variant plus one per
+entry in config.IMAGE_VARIANT_WIDTHS, stored next to it as <stem>.<variant>.<fmt>
+(see paths.variant_path). WebP variants are written when a character is saved and
+otherwise built on first request, then reused until the source changes.
+
+`uv run python imaging.py --optimize` processes the whole library offline on a
+process pool: PNGs are recompressed losslessly, every variant is written in every
+format of config.IMAGE_VARIANT_FORMATS, and config.IMAGE_MANIFEST_FILE records
+hashes, dimensions and variant sizes so /variants can serve the smallest format
+a browser accepts. Files whose hash is unchanged are skipped on later runs.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageOps, PngImagePlugin, features
+
+import config
+import imageindex
+import paths
+import storage
+
+log = logging.getLogger(__name__)
+
+FULL_VARIANT = "full"  # Variant at the source's own size
+MANIFEST_VERSION = 1
+HASH_CHARS = 12  # sha256 hex digits used in content-hashed URLs
+_PIL_FORMATS = {"webp": "WEBP", "avif": "AVIF"}
+MEDIA_TYPES = {"webp": "image/webp", "avif": "image/avif"}
+
+_manifest_lock = threading.Lock()  # Serialises manifest rewrites between pool threads
+
+
+def _variant_widths() -> Dict[str, Optional[int]]:
+    """{variant name: max width}, where None keeps the source size."""
+    return {FULL_VARIANT: None, **config.IMAGE_VARIANT_WIDTHS}
+
+
+def available_formats() -> List[str]:
+    """Configured variant formats this Pillow build can encode."""
+    return [
+        fmt
+        for fmt in config.IMAGE_VARIANT_FORMATS
+        if fmt in _PIL_FORMATS and features.check(_PIL_FORMATS[fmt].lower())
+    ]
+
+
+def _is_fresh(variant: Path, source: Path) -> bool:
+    """True if the variant exists and is at least as new as its source."""
+    try:
+        return variant.stat().st_mtime >= source.stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def _encode_variant(
+    img: Image.Image, width: Optional[int], fmt: str = "webp"
+) -> Tuple[bytes, int, int]:
+    """
+    Downsizes an image to at most width px wide (never upscales) and encodes it.
+    Returns (data, width, height).
+    """
+    resized = img.copy()
+    if width is not None:
+        resized.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+    if resized.mode not in ("RGB", "RGBA"):
+        resized = resized.convert("RGBA" if "A" in resized.getbands() else "RGB")
+    buf = io.BytesIO()
+    options = {"method": 4} if fmt == "webp" else {}
+    resized.save(
+        buf, format=_PIL_FORMATS[fmt], quality=config.IMAGE_VARIANT_QUALITY[fmt], **options
+    )
+    return buf.getvalue(), resized.width, resized.height
+
+
+def generate_variants(source: Path, force: bool = False) -> Dict[str, Path]:
+    """
+    Writes every configured WebP width variant of source that is missing or stale.
+    Returns {variant name: path}. Blocking (decode + resize): run via storage.run_io.
+    """
+    results: Dict[str, Path] = {}
+    todo = {}
+    for variant, width in config.IMAGE_VARIANT_WIDTHS.items():
+        target = paths.variant_path(source, variant)
+        results[variant] = target
+        if force or not _is_fresh(target, source):
+            todo[target] = width
+    if not todo:
+        return results
+
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        img.load()
+        for target, width in todo.items():
+            storage.atomic_write_bytes(target, _encode_variant(img, width)[0])
+    log.info(f"Generated {len(todo)} image variant(s) for {source.name}")
+    return results
+
+
+# --- Serving ---
+
+
+def resolve_source(image_path: str) -> Optional[Path]:
+    """
+    Maps a static-relative image path (e.g. 'images/characters/ab/<id>.png') to the
+    source PNG on disk, or None if it is not an existing PNG under config.IMAGE_DIR.
+    """
+    try:
+        source = (config.STATIC_DIR / image_path).resolve()
+        source.relative_to(config.IMAGE_DIR.resolve())
+    except (ValueError, OSError):
+        return None
+    if source.suffix.lower() != ".png" or not source.is_file():
+        return None
+    return source
+
+
+def manifest_entry(image_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Manifest entry for a static-relative image path, if the optimizer has seen it.
+    Read from the copy imageindex holds in memory: no stat() per call.
+    """
+    try:
+        rel = (config.STATIC_DIR / image_path).relative_to(config.IMAGE_DIR).as_posix()
+    except ValueError:
+        return None
+    return imageindex.manifest().get(rel)
+
+
+def discard_variants(source: Path) -> None:
+    """
+    Deletes every variant of a source image and drops its manifest entry, for a source
+    that is being replaced or removed (stale variants must not be served for the new
+    file). Blocking.
+    """
+    for variant in paths.variant_paths(source):
+        variant.unlink(missing_ok=True)
+    try:
+        rel = source.relative_to(config.IMAGE_DIR).as_posix()
+    except ValueError:
+        return
+    with _manifest_lock:
+        # The file, not the held copy: another worker may have loaded a newer manifest
+        try:
+            with config.IMAGE_MANIFEST_FILE.open("r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest["images"].pop(rel, None) is None:
+                return
+        except FileNotFoundError:
+            return  # The optimizer has never run
+        except (OSError, ValueError, KeyError, AttributeError, TypeError) as e:
+            log.warning(f"Could not drop {rel} from image manifest: {e}")
+            return
+        storage.atomic_write_bytes(
+            config.IMAGE_MANIFEST_FILE, json.dumps(manifest, indent=2).encode("utf-8")
+        )
+        imageindex.load_manifest()
+    log.info(f"Dropped variants and manifest entry of {rel}")
+
+
+def get_variant(image_path: str, variant: str, accept: str = "") -> Optional[Tuple[Path, str]]:
+    """
+    Returns (file, media type) for a variant of a static-relative source path, or None
+    if the variant name or source is unknown. Uses the smallest up-to-date optimizer
+    output whose format appears in the Accept header, else builds (if needed) and
+    returns the WebP variant. Blocking.
+    """
+    widths = _variant_widths()
+    if variant not in widths:
+        return None
+    source = resolve_source(image_path)
+    if source is None:
+        return None
+
+    entry = manifest_entry(image_path) or {}
+    if entry.get("stamp") == _source_stamp(source):  # Source unchanged since the optimizer ran
+        candidates = []
+        for fmt, variants in entry.get("variants", {}).items():
+            info = variants.get(variant)
+            if info and fmt in MEDIA_TYPES and (fmt == "webp" or MEDIA_TYPES[fmt] in accept):
+                candidates.append((info.get("bytes", 0), fmt))
+        for _, fmt in sorted(candidates):
+            target = paths.variant_path(source, variant, fmt)
+            if target.is_file():
+                return target, MEDIA_TYPES[fmt]
+
+    target = paths.variant_path(source, variant)
+    if not _is_fresh(target, source):
+        with Image.open(source) as img:
+            img = ImageOps.exif_transpose(img)
+            storage.atomic_write_bytes(target, _encode_variant(img, widths[variant])[0])
+        log.info(f"Generated {variant} variant for {source.name} on demand")
+    return target, MEDIA_TYPES["webp"]
+
+
+def current_hash(image_path: str) -> Optional[str]:
+    """
+    Short content hash of a static-relative image path, if the manifest entry still
+    matches the file as indexed (same size and mtime), else None.
+    """
+    entry = manifest_entry(image_path)
+    info = imageindex.get(image_path)  # In memory: no stat() per URL
+    if not entry or not entry.get("sha256") or info is None:
+        return None
+    current = entry.get("stamp") == [info.size, info.mtime_ns]
+    return entry["sha256"][:HASH_CHARS] if current else None
+
+
+# --- Template Helpers ---
+
+
+def variant_url(image_path: str, variant: str) -> str:
+    """
+    URL of a variant of a static-relative image path (served by /variants/...),
+    versioned with the source's content hash when known so it can be cached forever.
+    """
+    digest = current_hash(image_path)
+    url = f"/variants/{variant}/{image_path}"
+    return f"{url}?v={digest}" if digest else url
+
+
+def srcset(image_path: str) -> str:
+    """
+    srcset attribute value listing every width variant. Once the optimizer manifest
+    knows the image, its real variant widths are used (including the full-size one).
+    """
+    entry = manifest_entry(image_path) or {}
+    known = entry.get("variants", {}).get("webp", {})
+    if known:
+        candidates = {}
+        for variant, info in known.items():
+            # Variants capped at the source width duplicate each other; keep the smallest name
+            if info["width"] not in candidates or variant != FULL_VARIANT:
+                candidates[info["width"]] = variant
+        pairs = sorted((width, variant) for width, variant in candidates.items())
+    else:
+        pairs = sorted((width, variant) for variant, width in config.IMAGE_VARIANT_WIDTHS.items())
+    return ", ".join(f"{variant_url(image_path, variant)} {width}w" for width, variant in pairs)
+
+
+# --- Offline Optimizer ---
+
+
+def _source_stamp(source: Path) -> List[int]:
+    """[size, mtime_ns] of a source file, used to tell whether a manifest entry still applies."""
+    st = source.stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _variants_exist(source: Path, entry: Dict[str, Any]) -> bool:
+    return all(
+        (source.parent / Path(info["path"]).name).is_file()
+        for variants in entry.get("variants", {}).values()
+        for info in variants.values()
+    )
+
+
+def optimize_image(
+    source: Path, previous: Optional[Dict[str, Any]], formats: List[str], force: bool = False
+) -> Tuple[Dict[str, Any], int, bool]:
+    """
+    Recompresses one PNG losslessly (kept only if smaller) and writes all its variants.
+    Returns (manifest entry, bytes saved on the PNG, whether anything was reprocessed).
+    A file whose hash matches the previous entry is only re-stamped. Runs in a worker process.
+    """
+    digest = _sha256(source)
+    if (
+        not force
+        and previous
+        and previous.get("sha256") == digest
+        and set(previous.get("variants", {})) == set(formats)
+        and _variants_exist(source, previous)
+    ):
+        return {**previous, "stamp": _source_stamp(source)}, 0, False
+
+    saved = 0
+    with Image.open(source) as img:
+        img.load()
+        original_size = source.stat().st_size
+        buf = io.BytesIO()
+        img.save(buf, format="PNG", optimize=True, **_png_save_options(img))
+        if buf.tell() < original_size:
+            storage.atomic_write_bytes(source, buf.getvalue())
+            saved = original_size - buf.tell()
+            digest = hashlib.sha256(buf.getvalue()).hexdigest()
+
+        oriented = ImageOps.exif_transpose(img)
+        entry: Dict[str, Any] = {
+            "sha256": digest,
+            "width": oriented.width,
+            "height": oriented.height,
+            "bytes": source.stat().st_size,
+            "stamp": _source_stamp(source),
+            "variants": {},
+        }
+        for fmt in formats:
+            for variant, width in _variant_widths().items():
+                data, w, h = _encode_variant(oriented, width, fmt)
+                target = paths.variant_path(source, variant, fmt)
+                storage.atomic_write_bytes(target, data)
+                entry["variants"].setdefault(fmt, {})[variant] = {
+                    "path": target.relative_to(config.IMAGE_DIR).as_posix(),
+                    "width": w,
+                    "height": h,
+                    "bytes": len(data),
+                }
+    return entry, saved, True
+
+
+def _png_save_options(img: Image.Image) -> Dict[str, Any]:
+    """Carries metadata over so recompression changes nothing but the encoding."""
+    options: Dict[str, Any] = {
+        key: img.info[key]
+        for key in ("transparency", "icc_profile", "dpi", "gamma")
+        if key in img.info
+    }
+    text = getattr(img, "text", {})
+    if text:
+        options["pnginfo"] = PngImagePlugin.PngInfo()
+        for key, value in text.items():
+            options["pnginfo"].add_text(key, value)
+    return options
+
+
+def optimize_library(workers: Optional[int] = None, force: bool = False) -> Dict[str, int]:
+    """
+    Optimizes every PNG under config.IMAGE_DIR in parallel and rewrites the manifest.
+    Returns counters: processed, unchanged, failed, png_bytes_saved.
+    """
+    formats = available_formats()
+    missing = set(config.IMAGE_VARIANT_FORMATS) - set(formats)
+    if missing:
+        log.warning(f"Pillow cannot encode {sorted(missing)}; skipping those formats.")
+
+    imageindex.load_manifest()  # This runs offline: the server's copy is not loaded here
+    previous = {} if force else dict(imageindex.manifest())
+    sources = sorted(p for p in config.IMAGE_DIR.rglob("*.png") if p.is_file())
+    images: Dict[str, Dict[str, Any]] = {}
+    stats = {"processed": 0, "unchanged": 0, "failed": 0, "png_bytes_saved": 0}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for source in sources:
+            rel = source.relative_to(config.IMAGE_DIR).as_posix()
+            futures[pool.submit(optimize_image, source, previous.get(rel), formats, force)] = rel
+        for future in as_completed(futures):
+            rel = futures[future]
+            try:
+                entry, saved, processed = future.result()
+            except Exception as e:
+                log.error(f"Could not optimize {rel}: {e}")
+                stats["failed"] += 1
+                if rel in previous:
+                    images[rel] = previous[rel]
+                continue
+            images[rel] = entry
+            if processed:
+                stats["processed"] += 1
+                stats["png_bytes_saved"] += saved
+                log.info(f"Optimized {rel} ({saved} bytes saved on PNG)")
+            else:
+                stats["unchanged"] += 1
+
+    manifest = {"version": MANIFEST_VERSION, "images": dict(sorted(images.items()))}
+    storage.atomic_write_bytes(
+        config.IMAGE_MANIFEST_FILE, json.dumps(manifest, indent=2).encode("utf-8")
+    )
+    imageindex.load_manifest()
+    log.info(
+        f"Image optimization complete: {stats['processed']} processed, {stats['unchanged']} "
+        f"unchanged, {stats['failed']} failed, {stats['png_bytes_saved']} PNG bytes saved."
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Image library tools.")
+    parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="Recompress PNGs and write WebP/AVIF variants plus the image manifest.",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(), help="Worker processes (default: CPUs)."
+    )
+    parser.add_argument("--force", action="store_true", help="Reprocess unchanged files too.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    if args.optimize:
+        optimize_library(workers=args.workers, force=args.force)
+    else:
+        parser.print_help()
@@ -1,24 +1,46 @@
+import asyncio
+import base64
+import io
 import json
+import os
+import tarfile
 import time
-import uuid
-from typing import List, Optional  # Added List and Optional
+from pathlib import Path
+from typing import List, Optional, Set  # Added List and Optional
 
 from fastapi import FastAPI, HTTPException, Request, Response, status
 
 # Import RedirectResponse here
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import (
+    HTMLResponse,
+    JSONResponse,
+    PlainTextResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
 from fastapi.templating import Jinja2Templates
 from pydantic import ValidationError
-from slugify import slugify
 
 import ai_services
+import aitelemetry
+import archive
+import charfile
+import combat
 
 # --- Project Modules ---
 # running main.py directly as a script
 import config
 import core
+import creatures
+import encounters
+import httpcache
+import imageindex
+import imagejobs
+import imagestore
+import imaging
 import models
+import paths
+import storage
 import utils
 
 log = utils.log  # Use logger from utils setup
@@ -38,15 +60,39 @@ app = FastAPI(
 templates = Jinja2Templates(directory=config.TEMPLATE_DIR)
 # Add custom filters from utils
 templates.env.filters["datetimeformat"] = utils.datetimeformat
-
-# Mount static files directory (using path from config)
-# Serve '.' which includes 'images' and potentially other static assets
-app.mount("/static", StaticFiles(directory=config.STATIC_DIR), name="static")
+# Responsive image helpers (downsized WebP variants, see imaging.py)
+templates.env.globals["image_srcset"] = imaging.srcset
+templates.env.globals["image_variant_url"] = imaging.variant_url
+templates.env.globals["static_url"] = httpcache.static_url  # Content-hashed when possible
+templates.env.globals["creature_image"] = imageindex.creature_image
+
+# Mount static image directories (using paths from config). Only images/ is exposed, never
+# the project root. Portraits are revalidated via ETag; creature and site art is cached for
+# a day, or forever under content-hashed names. More specific mounts must come first.
+app.mount(
+    "/static/images/characters",
+    httpcache.CachedStaticFiles(
+        directory=config.CHARACTER_IMAGE_DIR,
+        cache_control=config.REVALIDATE_CACHE_CONTROL,
+        check_dir=False,  # Created by utils.ensure_dirs() at startup
+    ),
+    name="character_images",
+)
+app.mount(
+    "/static/images",
+    httpcache.CachedStaticFiles(
+        directory=config.IMAGE_DIR, cache_control=config.STATIC_CACHE_CONTROL
+    ),
+    name="images",
+)
 
 
 # --------------------------
 # Startup Event
 # --------------------------
+_background_tasks: Set[asyncio.Task] = set()  # Long-running tasks, cancelled on shutdown
+
+
 @app.on_event("startup")
 async def startup_event():
     """Load data files and configure AI when the application starts."""
@@ -54,7 +100,9 @@ async def startup_event():
     utils.ensure_dirs()  # Ensure data directories exist
 
     # Check for Gemini API Key (already checked in ai_services, but good place to log)
-    if not config.GEMINI_API_KEY:
+    if config.AI_BACKEND == "fake":
+        log.warning("AI backend is the offline fake (AI_BACKEND=fake).")
+    elif not config.GEMINI_API_KEY:
         log.critical(
             "GOOGLE_API_KEY environment variable not set. AI features will be unavailable."
         )
@@ -93,19 +141,38 @@ async def startup_event():
 
     # Load creature data
     try:
-        config.CREATURE_DATA = utils.load_data_file(config.CREATURES_FILE)
-        # Optional: Validate with Pydantic models if defined
-        # validated_creatures = [models.Creature(**creature) for creature in config.CREATURE_DATA]
-        # config.CREATURE_DATA = [c.model_dump() for c in validated_creatures] # Store as dicts if needed later
+        raw_creatures = utils.load_data_file(config.CREATURES_FILE)
+        if not isinstance(raw_creatures, list):
+            raise ValueError(f"{config.CREATURES_FILE} must contain a list of creatures.")
+        # Validate once and index by slug; also sets config.CREATURE_DATA (validated dicts)
+        creatures.load(raw_creatures)
         log.info(f"Creature data loaded successfully ({len(config.CREATURE_DATA)} creatures).")
     except (FileNotFoundError, ValueError, IOError, json.JSONDecodeError, ValidationError) as e:
         log.critical(
             f"FATAL: Could not load or validate creature data on startup: {e}", exc_info=True
         )
-        config.CREATURE_DATA = []  # Ensure it's an empty list on failure
+        creatures.load([])  # Ensure an empty registry on failure
+
+    # Index images (and the optimizer manifest) in memory so page routes never stat() per request
+    await storage.run_io(imageindex.build)
+    await storage.run_io(imageindex.load_manifest)
+    if ai_services.client:  # Encode the style reference now rather than on the first request
+        await storage.run_io(ai_services.style_reference.part)
+    if config.IMAGE_WATCH:
+        _background_tasks.add(asyncio.create_task(imageindex.watch()))
     log.info("Startup complete.")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background tasks and flush pending storage writes before the process exits."""
+    for task in _background_tasks:
+        task.cancel()
+    combat.shutdown()
+    imagejobs.shutdown()
+    storage.shutdown()
+
+
 # --------------------------
 # API Routes
 # --------------------------
@@ -142,13 +209,10 @@ async def char_browser(request: Request):
     utils.ensure_dirs()
 
     # Read individual files for robustness
-    for fp in config.CHAR_DIR.glob("*.json"):
-        if fp.name == "index.json":
-            continue  # Skip index itself
+    for char_id, fp in paths.iter_character_files():
         try:
             data = utils.load_data_file(fp)
             # Validate essential fields for summary
-            char_id = fp.stem
             name = data.get("name", "Unnamed")
             char_type = data.get(
                 "characterType", data.get("character_type", "Unknown")
@@ -156,8 +220,7 @@ async def char_browser(request: Request):
             hp = data.get("hitPoints", data.get("hit_points"))  # Check both aliases
             # Use file modification time as fallback for 'saved' if missing
             saved_time = data.get("saved", int(fp.stat().st_mtime))
-            image_rel_path = f"images/{char_id}.png"
-            image_full_path = config.IMAGE_DIR / f"{char_id}.png"
+            image = imageindex.character_image(char_id)  # In memory, no stat() per card
 
             summary = models.CharacterSummary(
                 id=char_id,
@@ -165,7 +228,9 @@ async def char_browser(request: Request):
                 type=char_type,
                 hit_points=hp,
                 saved=saved_time,
-                image=image_rel_path if image_full_path.exists() else None,
+                image=image.path if image else None,
+                image_width=image.width if image else None,
+                image_height=image.height if image else None,
             )
             summaries.append(summary)
         except (ValidationError, ValueError, IOError, json.JSONDecodeError) as e:
@@ -178,95 +243,125 @@ async def char_browser(request: Request):
     )
 
 
+# Rendered detail pages, keyed by character ID and stored with the version they were
+# rendered for, so a re-save or import is a miss; delete_character() drops the entry.
+_character_pages = httpcache.PageCache(config.CHARACTER_PAGE_CACHE_SIZE)
+CHARACTER_TEMPLATE = "charbrowse.html"
+
+
+def _render_page(
+    template_name: str, context: dict, last_modified: Optional[float] = None
+) -> httpcache.RenderedPage:
+    """Renders and compresses a page for the page caches. Blocking (compression is CPU-bound)."""
+    html = templates.env.get_template(template_name).render(context)
+    return httpcache.RenderedPage(html, last_modified=last_modified)
+
+
 @app.get("/browser/{char_id}", response_class=HTMLResponse, tags=["UI"])
 async def view_character(char_id: str, request: Request):
-    """Render a single saved character."""
+    """Render a single saved character (cached; 304 for a matching conditional request)."""
     log.info(f"Serving single character view for ID: {char_id}")
-    char_file = config.CHAR_DIR / f"{char_id}.json"
-    if not char_file.exists():
+    char_file = paths.find_character_json(char_id)
+    if char_file is None:
         log.warning(f"Character file not found for ID: {char_id}")
         raise HTTPException(status_code=404, detail="Character not found")
 
     try:
-        # Load raw data to pass to template
-        data = utils.load_data_file(char_file)
-    except Exception as e:
-        log.error(f"Could not read character file {char_file}: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Could not read character file")
-
-    image_file = config.IMAGE_DIR / f"{char_id}.png"
-    # Pass relative path for template src attribute
-    image_rel_path = f"images/{char_id}.png" if image_file.exists() else None
+        st = await storage.run_io(os.stat, char_file)
+    except FileNotFoundError:
+        log.warning(f"Character file {char_file} was deleted while being served.")
+        raise HTTPException(status_code=404, detail="Character not found")
 
-    return templates.TemplateResponse(
-        "charbrowse.html",
-        {
-            "request": request,
-            "single_character": data,
-            "image_path": image_rel_path,
-            "character_id": char_id,  # Explicitly pass the ID to the template
-        },
+    image = imageindex.character_image(char_id)
+    if image is None and paths.find_character_image(char_id):
+        # Saved by another worker process since this index was built
+        await storage.run_io(imageindex.refresh_character, char_id)
+        image = imageindex.character_image(char_id)
+
+    # A saved character only changes through a re-save or import, which changes its
+    # file's size/mtime; the template, portrait and image manifest feed the page too.
+    version = (
+        st.st_mtime_ns,
+        st.st_size,
+        image,
+        templates.env.get_template(CHARACTER_TEMPLATE),
+        imageindex.manifest(),
     )
+    page = _character_pages.get(char_id, version)
+    if page is None:
+        try:
+            # Load data (either on-disk format) in the full shape the template expects
+            data = await storage.run_io(charfile.load_character_data, char_file)
+        except Exception as e:
+            log.error(f"Could not read character file {char_file}: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail="Could not read character file")
+
+        last_modified = max(st.st_mtime, image.mtime_ns / 1e9 if image else 0)
+        page = await storage.run_io(
+            _render_page,
+            CHARACTER_TEMPLATE,
+            {
+                "single_character": data,
+                "image": image,  # Relative path and dimensions for the template
+                "character_id": char_id,  # Explicitly pass the ID to the template
+            },
+            last_modified,
+        )
+        _character_pages.put(char_id, version, page)
+    return httpcache.page_response(page, request.headers)
 
 
 # --- Creature Browser Routes ---
 
 
+# Rendered once per version of their inputs (see _creature_page_version) and served from
+# memory, pre-compressed, with an ETag; nothing on these pages depends on the request.
+_creature_pages = httpcache.PageCache(config.CREATURE_PAGE_CACHE_SIZE)
+CREATURE_TEMPLATE = "creaturebrowse.html"
+
+
+def _creature_page_version() -> tuple:
+    """
+    Everything a creature page is rendered from: the template (Jinja returns a new object
+    when the file changes), the registry (replaced by creatures.load()), and the creature
+    art's index and manifest entries (image URLs, dimensions, srcsets). Character
+    portrait saves and deletes do not touch any of these.
+    """
+    return (
+        templates.env.get_template(CREATURE_TEMPLATE),
+        creatures.registry,
+        imageindex.art_generation,
+    )
+
+
+async def _creature_page_response(slug: Optional[str], context: dict, request: Request) -> Response:
+    """Serves the list page (slug None) or a creature's page, rendering it on first use."""
+    version = _creature_page_version()
+    page = _creature_pages.get(slug, version)
+    if page is None:
+        page = await storage.run_io(_render_page, CREATURE_TEMPLATE, context)
+        _creature_pages.put(slug, version, page)
+        log.debug(f"Rendered creature page for {slug or 'the list'}.")
+    return httpcache.page_response(page, request.headers)
+
+
 @app.get("/creature_browser", response_class=HTMLResponse, tags=["UI", "Creature Browser"])
 async def creature_browser_list(request: Request):
-    """Server-side render of the creature browser list."""
+    """Creature browser list, served from the rendered page cache."""
     log.info("Serving creature browser list page.")
-    if not config.CREATURE_DATA:
+    if not len(creatures.registry):
         log.warning("Creature data not loaded, serving empty browser.")
         # Optionally raise 503 Service Unavailable if data is critical
         # raise HTTPException(status_code=503, detail="Creature data not available")
-        creatures_summary = []
-    else:
-        creatures_summary = []
-        for creature_data in config.CREATURE_DATA:
-            try:
-                # Validate essential fields for summary (using dict access)
-                name = creature_data.get("name")
-                if not name:
-                    log.warning("Skipping creature with missing name.")
-                    continue
-
-                slug = slugify(name)
-                image_file_path = config.IMAGE_DIR / f"{slug}.png"
-                image_url_path = f"/static/images/{slug}.png" if image_file_path.exists() else None
-
-                # Extract key stats safely
-                stats = creature_data.get("stats", {})
-                ac = stats.get("armor_class", "N/A")
-                hd = stats.get("hit_dice", "N/A")
-
-                summary = {
-                    "name": name,
-                    "slug": slug,
-                    "image": image_url_path,
-                    "armor_class": ac,
-                    "hit_dice": hd,
-                    "base_species": creature_data.get(
-                        "base_species"
-                    ),  # Added for potential card display
-                }
-                creatures_summary.append(summary)
-            except Exception as e:
-                log.warning(
-                    f"Error processing creature '{creature_data.get('name', 'Unknown')}' for list view: {e}"
-                )
-                continue  # Skip this creature if processing fails
-
-    # Sort creatures alphabetically by name for consistency
-    creatures_summary.sort(key=lambda c: c["name"])
 
-    return templates.TemplateResponse(
-        "creaturebrowse.html",
+    # Summaries are built and name-sorted once at load; images come from the in-memory index
+    return await _creature_page_response(
+        None,
         {
-            "request": request,
-            "creatures": creatures_summary,
+            "creatures": creatures.registry.summaries,
             "single_creature": None,
         },  # Ensure single_creature is None for list view
+        request,
     )
 
 
@@ -276,37 +371,90 @@ async def creature_browser_list(request: Request):
     tags=["UI", "Creature Browser"],
 )
 async def view_creature(creature_slug: str, request: Request):
-    """Render a single saved creature by its slug."""
+    """A single creature by its slug, served from the rendered page cache."""
     log.info(f"Serving single creature view for slug: {creature_slug}")
-    if not config.CREATURE_DATA:
+    if not len(creatures.registry):
         log.error("Attempted to view single creature, but creature data is not loaded.")
         raise HTTPException(status_code=503, detail="Creature data not available")
 
-    found_creature = None
-    for creature_data in config.CREATURE_DATA:
-        if slugify(creature_data.get("name", "")) == creature_slug:
-            found_creature = creature_data
-            break
+    found_creature = creatures.registry.get(creature_slug)
 
     if not found_creature:
         log.warning(f"Creature not found for slug: {creature_slug}")
         raise HTTPException(status_code=404, detail="Creature not found")
 
-    # Check for image
-    image_file_path = config.IMAGE_DIR / f"{creature_slug}.png"
-    image_url_path = f"/static/images/{creature_slug}.png" if image_file_path.exists() else None
-
-    return templates.TemplateResponse(
-        "creaturebrowse.html",
+    return await _creature_page_response(
+        creature_slug,
         {
-            "request": request,
             "single_creature": found_creature,
-            "image_path": image_url_path,
+            "image": imageindex.creature_image(creature_slug),
             "creatures": None,
         },  # Ensure creatures is None for single view
+        request,
     )
 
 
+@app.get("/api/creatures", response_model=models.CreatureQueryResponse, tags=["Creature Browser"])
+async def query_creatures(
+    ac_min: Optional[int] = None,
+    ac_max: Optional[int] = None,
+    hd_min: Optional[int] = None,
+    hd_max: Optional[int] = None,
+    movement_min: Optional[int] = None,
+    movement_max: Optional[int] = None,
+    appearing_min: Optional[int] = None,
+    appearing_max: Optional[int] = None,
+    species: Optional[str] = None,
+    sort: models.CreatureSortField = models.CreatureSortField.NAME,
+    desc: bool = False,
+):
+    """
+    Filters and sorts creatures by their numeric stats, e.g. ?hd_min=8&ac_max=5&sort=hit_dice.
+    Ranges like number appearing '1-6' match when they overlap the requested bounds.
+    """
+    ranges = {
+        "armor_class": (ac_min, ac_max),
+        "hit_dice": (hd_min, hd_max),
+        "movement": (movement_min, movement_max),
+        "number_appearing": (appearing_min, appearing_max),
+    }
+    for stat, (low, high) in ranges.items():
+        if low is not None and high is not None and low > high:
+            raise HTTPException(status_code=400, detail=f"Empty {stat} range: {low} > {high}")
+    if not len(creatures.registry):
+        raise HTTPException(status_code=503, detail="Creature data not available")
+
+    # Binary searches over indexes built at load time; no parsing or sorting per request
+    matches = creatures.registry.query(ranges, species, sort, desc)
+    return models.CreatureQueryResponse(count=len(matches), creatures=matches)
+
+
+@app.post("/api/encounters", response_model=models.EncounterResponse, tags=["Creature Browser"])
+async def roll_encounters(req: models.EncounterRequest):
+    """Rolls group sizes and per-individual HP for many encounters at once (optionally seeded)."""
+    if not len(creatures.registry):
+        raise HTTPException(status_code=503, detail="Creature data not available")
+    try:
+        # CPU-bound for large counts; keep it off the event loop
+        return await storage.run_cpu(encounters.roll_encounters, creatures.registry, req)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post(
+    "/api/simulate", response_model=models.CombatSimulationResponse, tags=["Creature Browser"]
+)
+async def simulate_combat(req: models.CombatSimulationRequest):
+    """Monte Carlo win rates and HP left for a party against an encounter (cached per seed)."""
+    if not len(creatures.registry):
+        raise HTTPException(status_code=503, detail="Creature data not available")
+    try:
+        # Character files are read on the I/O pool, the fights run on the process pool
+        return await combat.simulate(creatures.registry, req)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 # --- Character Generation API ---
 
 
@@ -433,62 +581,78 @@ async def save_character(req: models.SaveCharacterRequest):
     utils.ensure_dirs()
 
     # -------- Generate Unique ID --------
-    base_slug = slugify(req.character.name or "unnamed", lowercase=True)[:40] or "unnamed"
-    uid_snip = uuid.uuid4().hex[:6]
     ts = int(time.time())
-    char_id = f"{base_slug}-{ts}-{uid_snip}"
+    char_id = utils.new_character_id(req.character.name, ts)
     log.info(f"Generated character ID: {char_id}")
 
-    char_path = config.CHAR_DIR / f"{char_id}.json"
-    img_path = config.IMAGE_DIR / f"{char_id}.png"
-    img_rel_path = f"images/{char_id}.png"  # Relative path for index and response
+    char_path = paths.character_json_path(char_id)
+    img_path = paths.character_image_path(char_id)
+    img_rel_path = paths.static_url_path(img_path)  # Relative path for index and response
+
+    # Compact format: snake_case keys, mutations as catalog references, structured log
+    char_json_str = charfile.encode_character(req.character)
+
+    # -------- Optional Image (validated before anything touches disk) --------
+    img_bytes: Optional[bytes] = None
+    img_source: Optional[Path] = None  # A held generated image, linked into place
+    if req.image_data and req.image_handle:
+        raise HTTPException(status_code=400, detail="Send image_data or image_handle, not both.")
+    if req.image_handle:
+        img_source = await storage.run_io(imagestore.path, req.image_handle)
+        if img_source is None:
+            raise HTTPException(
+                status_code=410,
+                detail="The generated image has expired. Please generate it again.",
+            )
+        img_size = (await storage.run_io(os.stat, img_source)).st_size
+        if img_size > config.MAX_IMAGE_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Image exceeds {config.MAX_IMAGE_BYTES // 1024} KB limit",
+            )
+    elif req.image_data:
+        log.info(f"Processing image data for character {char_id}.")
+        try:
+            img_bytes = await storage.run_io(utils.decode_base64_image, req.image_data)
+        except ValueError as e:  # Catch specific error from decode_base64_image
+            raise HTTPException(status_code=400, detail=str(e))
+
+        if len(img_bytes) > config.MAX_IMAGE_BYTES:
+            log.warning(
+                f"Image for {char_id} rejected, size {len(img_bytes)} > {config.MAX_IMAGE_BYTES}"
+            )
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Image exceeds {config.MAX_IMAGE_BYTES // 1024} KB limit",
+            )
 
-    # -------- Write JSON --------
+    # -------- Write JSON + Image (atomic, off the event loop) --------
+    has_image = img_bytes is not None or img_source is not None
     try:
-        # Use model_dump_json WITHOUT by_alias=True to save with internal Python keys (snake_case)
-        # exclude_none=True keeps the JSON cleaner
-        char_json_str = req.character.model_dump_json(exclude_none=True, indent=2)
-        with char_path.open("w", encoding="utf-8") as f:
-            f.write(char_json_str)
-        log.info(f"Character JSON saved to: {char_path}")
+        await storage.run_io(
+            storage.save_character_files,
+            char_path,
+            char_json_str,
+            img_path if has_image else None,
+            img_bytes,
+            img_source,
+        )
     except Exception as e:
-        log.error(f"Could not save character JSON to {char_path}: {e}", exc_info=True)
+        log.error(f"Could not save character {char_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Could not save character data: {e}")
+    saved_image_path = img_rel_path if has_image else None
+    if req.image_handle:
+        await storage.run_io(imagestore.discard, req.image_handle)  # Now linked into place
 
-    # -------- Optional Image --------
-    saved_image_path: Optional[str] = None
-    if req.image_data:
-        log.info(f"Processing image data for character {char_id}.")
+    # -------- Responsive Variants (derived data, rebuilt on demand if this fails) --------
+    if has_image:
+        await storage.run_io(imageindex.refresh, img_path)
         try:
-            img_bytes = utils.decode_base64_image(req.image_data)
-
-            if len(img_bytes) > config.MAX_IMAGE_BYTES:
-                log.warning(
-                    f"Image for {char_id} rejected, size {len(img_bytes)} > {config.MAX_IMAGE_BYTES}"
-                )
-                # Clean up JSON before raising error
-                char_path.unlink(missing_ok=True)
-                raise HTTPException(
-                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                    detail=f"Image exceeds {config.MAX_IMAGE_BYTES // 1024} KB limit",
-                )
-
-            with img_path.open("wb") as f:
-                f.write(img_bytes)
-            saved_image_path = img_rel_path  # Store relative path
-            log.info(f"Character image saved to: {img_path}")
-
-        except ValueError as e:  # Catch specific error from decode_base64_image
-            # Clean up JSON
-            char_path.unlink(missing_ok=True)
-            raise HTTPException(status_code=400, detail=str(e))
+            await storage.run_io(imaging.generate_variants, img_path)
         except Exception as e:
-            log.error(f"Could not save image to {img_path}: {e}", exc_info=True)
-            # Clean up JSON we just wrote to avoid orphan
-            char_path.unlink(missing_ok=True)
-            raise HTTPException(status_code=500, detail=f"Could not save image: {e}")
+            log.warning(f"Could not generate image variants for {char_id}: {e}")
 
-    # -------- Update Index (Non-blocking) --------
+    # -------- Update Index --------
     # Use internal snake_case names for Character model access
     summary = {
         "id": char_id,
@@ -498,7 +662,7 @@ async def save_character(req: models.SaveCharacterRequest):
         "saved": ts,
         "image": saved_image_path,  # Use the relative path if saved
     }
-    utils.write_index_record(summary)
+    await storage.run_io(storage.write_index_record, summary)
 
     # Return paths using forward slashes for web compatibility
     return models.SaveCharacterResponse(
@@ -516,74 +680,10 @@ async def delete_character(character_id: str):
     log.info(f"Received request to delete character ID: {character_id}")
     utils.ensure_dirs()  # Ensure directories exist
 
-    char_file_path = config.CHAR_DIR / f"{character_id}.json"
-    img_file_path = config.IMAGE_DIR / f"{character_id}.png"
-    index_file_path = config.CHAR_DIR / "index.json"  # Assuming index is in CHAR_DIR
-
-    deleted_something = False  # Flag to track if any file was actually deleted
-
-    # 1. Update Index
-    if index_file_path.exists():
-        try:
-            # Use a lock or more robust mechanism in a high-concurrency scenario
-            with open(index_file_path, "r", encoding="utf-8") as f:
-                # Ensure index_data is treated as a list of dicts
-                index_data: List[dict] = json.load(f)
-                if not isinstance(index_data, list):
-                    log.error(
-                        f"Index file {index_file_path} does not contain a valid JSON list. Aborting index update."
-                    )
-                    index_data = []  # Reset to empty list to avoid errors below
-
-            initial_length = len(index_data)
-            # Filter out the character to be deleted
-            updated_index_data = [
-                char
-                for char in index_data
-                if isinstance(char, dict) and char.get("id") != character_id
-            ]
-
-            if len(updated_index_data) < initial_length:
-                log.info(f"Removing character {character_id} from index.")
-                with open(index_file_path, "w", encoding="utf-8") as f:
-                    json.dump(updated_index_data, f, indent=2)
-                log.info(f"Character index updated successfully at {index_file_path}")
-                deleted_something = True  # Considered deletion if index was modified
-            else:
-                log.warning(
-                    f"Character ID {character_id} not found in index file {index_file_path}."
-                )
-
-        except (json.JSONDecodeError, IOError, Exception) as e:
-            log.error(f"Error processing character index {index_file_path}: {e}", exc_info=True)
-            # Decide if we should proceed with file deletion even if index fails
-            # For now, we proceed but log the error.
-    else:
-        log.warning(f"Character index file not found at {index_file_path}. Skipping index update.")
-
-    # 2. Delete Character JSON File
-    try:
-        if char_file_path.exists():
-            char_file_path.unlink()
-            log.info(f"Deleted character JSON file: {char_file_path}")
-            deleted_something = True
-        else:
-            log.warning(f"Character JSON file not found, cannot delete: {char_file_path}")
-    except OSError as e:
-        log.error(f"Error deleting character JSON file {char_file_path}: {e}", exc_info=True)
-        # Continue deletion process even if one file fails
-
-    # 3. Delete Character Image File
-    try:
-        if img_file_path.exists():
-            img_file_path.unlink()
-            log.info(f"Deleted character image file: {img_file_path}")
-            deleted_something = True
-        else:
-            # This is not necessarily an error, the character might not have had an image
-            log.info(f"Character image file not found, no image to delete: {img_file_path}")
-    except OSError as e:
-        log.error(f"Error deleting character image file {img_file_path}: {e}", exc_info=True)
+    # Index update and file removal run on the storage I/O pool
+    deleted_something = await storage.run_io(storage.delete_character_files, character_id)
+    await storage.run_io(imageindex.refresh_character, character_id)
+    _character_pages.discard(character_id)
 
     # If nothing was found (neither in index nor files), maybe return 404?
     # For now, redirecting anyway as the goal is to ensure it's gone.
@@ -593,15 +693,110 @@ async def delete_character(character_id: str):
         )
         # Optionally raise HTTPException(status_code=404, detail="Character not found") instead
 
-    # 4. Redirect to the browser list
+    # Redirect to the browser list
     # Use RedirectResponse with 303 See Other status code
     log.info(f"Character deletion process completed for ID {character_id}. Redirecting to browser.")
     return RedirectResponse(url="/browser", status_code=status.HTTP_303_SEE_OTHER)
 
 
+@app.get("/api/export", tags=["Character Storage"])
+async def export_library():
+    """Streams every saved character, portrait, and the index as a tar archive."""
+    log.info("Received request to export the character library.")
+    utils.ensure_dirs()
+    filename = f"gamma-world-library-{int(time.time())}.tar"
+    # Sync generator: Starlette iterates it in a worker thread, so file reads stay off the loop
+    return StreamingResponse(
+        archive.iter_library_archive(),
+        media_type="application/x-tar",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.post("/api/import", response_model=models.ImportLibraryResponse, tags=["Character Storage"])
+async def import_library(
+    request: Request,
+    on_conflict: models.ImportConflictPolicy = models.ImportConflictPolicy.SKIP,
+):
+    """Stream-ingests a library archive produced by /api/export (raw tar or tar.gz body)."""
+    log.info(f"Received request to import a character library (on_conflict={on_conflict.value}).")
+    utils.ensure_dirs()
+    reader = io.BufferedReader(
+        archive.AsyncStreamReader(request.stream(), asyncio.get_running_loop()),
+        buffer_size=archive.ARCHIVE_CHUNK_SIZE,
+    )
+    try:
+        report = await storage.run_io(archive.import_library, reader, on_conflict)
+    except tarfile.TarError as e:
+        log.warning(f"Rejected library import, not a readable tar archive: {e}")
+        raise HTTPException(status_code=400, detail=f"Invalid archive: {e}")
+    for char_id in report.imported:
+        await storage.run_io(imageindex.refresh_character, char_id)
+    return report
+
+
+@app.get("/variants/{variant}/{image_path:path}", tags=["Images"])
+async def image_variant(variant: str, image_path: str, request: Request, v: Optional[str] = None):
+    """
+    Serves a resized variant of an image in the smallest format the browser accepts
+    (from the optimizer manifest), building and caching a WebP copy if there is none.
+    With ?v=<source content hash> matching the current source, it is cacheable forever.
+    """
+    accept = request.headers.get("accept", "")
+    try:
+        result = await storage.run_io(imaging.get_variant, image_path, variant, accept)
+    except Exception as e:
+        log.error(f"Could not build {variant} variant of {image_path}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Could not build image variant")
+    if result is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    variant_file, media_type = result
+
+    versioned = v is not None and v == await storage.run_io(imaging.current_hash, image_path)
+    return await storage.run_io(
+        httpcache.cached_file_response,
+        variant_file,
+        request.headers,
+        config.IMMUTABLE_CACHE_CONTROL if versioned else config.REVALIDATE_CACHE_CONTROL,
+        media_type=media_type,
+        headers={"Vary": "Accept"},
+    )
+
+
+@app.get("/generated/{filename}", tags=["Images"])
+async def held_image(filename: str, request: Request):
+    """Preview of a generated image held until save (see imagestore.py); 404 once expired."""
+    held = await storage.run_io(imagestore.path, Path(filename).stem)
+    if held is None or held.name != filename:
+        raise HTTPException(status_code=404, detail="Generated image not found or expired")
+    # A handle's content never changes, but it is private to whoever generated it
+    return await storage.run_io(
+        httpcache.cached_file_response, held, request.headers, config.HELD_IMAGE_CACHE_CONTROL
+    )
+
+
 # --- AI Service API ---
 
 
+def _ai_busy(e: "ai_services.AIServiceBusy") -> HTTPException:
+    """503 with Retry-After for a full AI gateway queue."""
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(config.AI_BUSY_RETRY_AFTER_SECONDS)},
+    )
+
+
+def _ai_failure(result: str) -> HTTPException:
+    """Maps an AI service error message to an HTTP error (see ai_services.error_status)."""
+    return HTTPException(status_code=ai_services.error_status(result), detail=result)
+
+
+def _sse_event(event: str, data: str) -> str:
+    """One Server-Sent Event; data is JSON-encoded so newlines survive."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
 @app.post(
     "/generate_description", response_model=models.GenerateDescriptionResponse, tags=["AI Services"]
 )
@@ -611,19 +806,54 @@ async def generate_description(request_data: models.GenerateDescriptionRequest):
     if not ai_services.client:
         raise HTTPException(status_code=503, detail="AI Service is not available.")
 
-    status, result = await ai_services.generate_ai_description(request_data)
+    try:
+        status, result = await ai_services.generate_ai_description(request_data)
+    except ai_services.AIServiceBusy as e:
+        raise _ai_busy(e)
 
     if status == "success":
         return models.GenerateDescriptionResponse(status="success", description=result)
     else:
-        # Return 500 for internal AI errors, 400 or other appropriate code if it was a bad request to AI
-        # For simplicity, returning 500 for now, but could refine based on 'result' content
+        # 400 if the content was blocked, 429 if rate-limited, otherwise 500
         log.error(f"AI description generation failed: {result}")
-        # Check if it was a block reason to potentially return 400/422
-        if "blocked" in result.lower():
-            raise HTTPException(status_code=400, detail=result)  # Bad request due to content
-        else:
-            raise HTTPException(status_code=500, detail=result)  # Internal AI service error
+        raise _ai_failure(result)
+
+
+@app.post("/generate_description/stream", tags=["AI Services"])
+async def stream_description(request_data: models.GenerateDescriptionRequest):
+    """
+    Streams an AI character description as Server-Sent Events: 'chunk' events with
+    text as it is generated, then 'done' with the full text (or 'error'). Errors before
+    the first chunk are returned as plain HTTP errors, like /generate_description.
+    """
+    log.info(f"Received request to stream AI description for: {request_data.name or 'Unnamed'}")
+    if not ai_services.client:
+        raise HTTPException(status_code=503, detail="AI Service is not available.")
+
+    events = ai_services.stream_ai_description(request_data)
+    try:
+        first_event, first_data = await anext(events)  # Waits for the first text only
+    except ai_services.AIServiceBusy as e:
+        raise _ai_busy(e)
+    if first_event == "error":
+        await events.aclose()
+        log.error(f"AI description stream failed: {first_data}")
+        raise _ai_failure(first_data)
+
+    async def event_stream():
+        # A client disconnect cancels this generator, which closes the upstream stream
+        try:
+            yield _sse_event(first_event, first_data)
+            async for event, data in events:
+                yield _sse_event(event, data)
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/generate_image", response_model=models.GenerateImageResponse, tags=["AI Services"])
@@ -633,18 +863,209 @@ async def generate_image(request_data: models.GenerateImageRequest):
     if not ai_services.client:
         raise HTTPException(status_code=503, detail="AI Service is not available.")
 
-    status, result, mime_type = await ai_services.generate_ai_image(request_data)
+    try:
+        status, result, mime_type = await ai_services.generate_ai_image(request_data)
+    except ai_services.AIServiceBusy as e:
+        raise _ai_busy(e)
 
     if status == "success":
+        try:
+            handle = await storage.run_io(imagestore.put, result, mime_type)
+        except OSError as e:
+            log.error(f"Could not hold generated image: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail="Could not store the generated image.")
         return models.GenerateImageResponse(
-            status="success", image_data=result, mime_type=mime_type
+            status="success",
+            image_data=base64.b64encode(result).decode("ascii"),  # For API clients
+            mime_type=mime_type,
+            image_handle=handle,
+            image_url=imagestore.url(handle, mime_type),
         )
     else:
         log.error(f"AI image generation failed: {result}")
-        if "blocked" in result.lower():
-            raise HTTPException(status_code=400, detail=result)  # Bad request due to content
-        else:
-            raise HTTPException(status_code=500, detail=result)  # Internal AI service error
+        raise _ai_failure(result)
+
+
+@app.post("/generate_description_and_image/stream", tags=["AI Services"])
+async def stream_description_and_image(request_data: models.GenerateDescriptionRequest):
+    """
+    Generates a description and then its image in one request, as Server-Sent Events:
+    'chunk' events with description text, 'description' with the full text, 'image'
+    with the image job on each state change (it is queued the moment the description
+    is complete), then 'done' with a DescriptionImageResult. A blocked or failed image
+    still ends with 'done' (the description stands); a failed description ends with
+    'error'. Errors before the first chunk are plain HTTP errors, as for the
+    description stream.
+    """
+    log.info(
+        f"Received request to generate AI description and image for: {request_data.name or 'Unnamed'}"
+    )
+    if not ai_services.client:
+        raise HTTPException(status_code=503, detail="AI Service is not available.")
+
+    events = ai_services.stream_ai_description(request_data)
+    try:
+        first_event, first_data = await anext(events)  # Waits for the first text only
+    except ai_services.AIServiceBusy as e:
+        raise _ai_busy(e)
+    if first_event == "error":
+        await events.aclose()
+        log.error(f"AI description stream failed: {first_data}")
+        raise _ai_failure(first_data)
+
+    async def event_stream():
+        job: Optional[imagejobs.ImageJob] = None
+        deduplicated = False
+        subscription = ""
+        # A client disconnect cancels this generator: the description stream is closed
+        # and this request's subscription to its image job is withdrawn
+        try:
+            yield _sse_event(first_event, first_data)  # Always a chunk
+            description = ""
+            async for event, data in events:
+                if event == "done":
+                    description = data
+                    break
+                yield _sse_event(event, data)
+                if event == "error":
+                    return
+            yield _sse_event("description", description)
+
+            # -------- Image Stage (through the image job queue) --------
+            try:
+                job, deduplicated, subscription = imagejobs.submit(
+                    models.GenerateImageRequest(description=description)
+                )
+            except (ai_services.AIServiceBusy, ValidationError) as e:
+                log.warning(f"Pipeline image stage not started: {e}")
+                busy = isinstance(e, ai_services.AIServiceBusy)
+                result = models.DescriptionImageResult(
+                    description=description,
+                    image_error=str(e) if busy else "Description too short for an image.",
+                    image_error_status=503 if busy else 400,
+                )
+                yield f"event: done\ndata: {result.model_dump_json()}\n\n"
+                return
+            async for current in imagejobs.events(job):
+                if current is None:
+                    yield ": keep-alive\n\n"  # Comment line; stops proxies timing out
+                else:
+                    data = current.response(deduplicated=deduplicated).model_dump_json()
+                    yield f"event: image\ndata: {data}\n\n"
+            result = models.DescriptionImageResult(
+                description=description, image_job=job.response(deduplicated=deduplicated)
+            )
+            yield f"event: done\ndata: {result.model_dump_json()}\n\n"
+        finally:
+            await events.aclose()
+            if job is not None and not job.done:
+                # Cancelled only if nobody else subscribed to it
+                imagejobs.cancel(job.id, subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _get_image_job(job_id: str) -> imagejobs.ImageJob:
+    job = imagejobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Image job '{job_id}' not found or expired.")
+    return job
+
+
+@app.post(
+    "/api/image-jobs",
+    response_model=models.ImageJobResponse,
+    status_code=202,
+    tags=["AI Services"],
+)
+async def submit_image_job(request_data: models.GenerateImageRequest, response: Response):
+    """
+    Queues an image generation and returns its job at once. Poll GET /api/image-jobs/{id}
+    or follow /api/image-jobs/{id}/events; an identical pending job is returned as is.
+    """
+    if not ai_services.client:
+        raise HTTPException(status_code=503, detail="AI Service is not available.")
+    try:
+        job, deduplicated, subscription = imagejobs.submit(request_data)
+    except ai_services.AIServiceBusy as e:
+        raise _ai_busy(e)
+    response.headers["Location"] = f"/api/image-jobs/{job.id}"
+    return job.response(deduplicated=deduplicated, subscription=subscription)
+
+
+@app.get("/api/image-jobs/{job_id}", response_model=models.ImageJobResponse, tags=["AI Services"])
+async def get_image_job(job_id: str):
+    """A job's state, with the image once it has succeeded."""
+    return _get_image_job(job_id).response()
+
+
+@app.get("/api/image-jobs/{job_id}/events", tags=["AI Services"])
+async def image_job_events(job_id: str):
+    """
+    Server-Sent Events: a 'status' event (the job as JSON) now and on every state change,
+    closing after the job finishes (with its image handle and preview URL on success).
+    """
+    job = _get_image_job(job_id)
+
+    async def event_stream():
+        async for current in imagejobs.events(job):
+            if current is None:
+                yield ": keep-alive\n\n"  # Comment line; stops proxies timing out
+            else:
+                data = current.response().model_dump_json()
+                yield f"event: status\ndata: {data}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.delete(
+    "/api/image-jobs/{job_id}", response_model=models.ImageJobResponse, tags=["AI Services"]
+)
+async def cancel_image_job(job_id: str, subscription: str):
+    """
+    Withdraws the client's subscription (the token from its submission) from a queued or
+    running job, cancelling it if no other client (one deduplicated onto it) still wants
+    it. Repeating the request changes nothing; a finished job is returned unchanged.
+    """
+    job = imagejobs.cancel(job_id, subscription)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Image job '{job_id}' not found or expired.")
+    return job.response()
+
+
+# --- Admin Routes ---
+
+
+@app.get("/api/admin/ai-telemetry", response_model=models.AITelemetrySummary, tags=["Admin"])
+async def ai_telemetry():
+    """
+    Rolling summary of this worker's recent AI calls: outcomes, queue/upstream/total
+    latency percentiles, payload sizes and token usage per operation.
+    """
+    return aitelemetry.telemetry.summary()
+
+
+@app.get("/api/admin/metrics", response_class=PlainTextResponse, tags=["Admin"])
+async def metrics():
+    """This worker's AI call metrics in Prometheus text format."""
+    text = aitelemetry.telemetry.metrics_text(
+        {
+            "ai_gateway_admitted": (
+                "AI calls running or waiting for a gateway slot.",
+                ai_services.gateway.admitted,
+            ),
+            "image_jobs_pending": ("Image jobs queued or running.", imagejobs.pending_count()),
+        }
+    )
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
 
 
 # --- Misc Routes ---
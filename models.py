@@ -29,6 +29,14 @@ class MutationSelectionMethod(str, Enum):
     PLAYER_CHOICE_DEFECT_ASSIGN = "Player Choice + Referee Defect Assignment (Method 2)"
 
 
+class ImportConflictPolicy(str, Enum):
+    """What to do when an imported character ID already exists."""
+
+    SKIP = "skip"
+    RENAME = "rename"
+    OVERWRITE = "overwrite"
+
+
 class MutationType(str, Enum):
     PHYSICAL = "Physical"
     MENTAL = "Mental"
@@ -139,6 +147,151 @@ class Creature(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
 
 
+class CreatureSortField(str, Enum):
+    """Orderings offered by GET /api/creatures (numeric stats sort by their lower bound)."""
+
+    NAME = "name"
+    ARMOR_CLASS = "armor_class"
+    HIT_DICE = "hit_dice"
+    MOVEMENT = "movement"
+    NUMBER_APPEARING = "number_appearing"
+
+
+class CreatureSummary(BaseModel):
+    """A creature as listed by the creature browser and /api/creatures (see creatures.py)."""
+
+    name: str
+    slug: str
+    base_species: Optional[str] = None
+    # Stats as written in Creatures.json, e.g. '5 (8 if ridden)', '1-6'
+    armor_class: Optional[str] = None
+    hit_dice: Optional[str] = None
+    movement: Optional[str] = None
+    number_appearing: Optional[str] = None
+    # Parsed (min, max) of each stat's leading number or range; None if not numeric
+    armor_class_min: Optional[int] = None
+    armor_class_max: Optional[int] = None
+    hit_dice_min: Optional[int] = None
+    hit_dice_max: Optional[int] = None
+    movement_min: Optional[int] = None
+    movement_max: Optional[int] = None
+    number_appearing_min: Optional[int] = None
+    number_appearing_max: Optional[int] = None
+
+
+class CreatureQueryResponse(BaseModel):
+    count: int
+    creatures: List[CreatureSummary] = Field(default_factory=list)
+
+
+class EncounterRequest(BaseModel):
+    """Creatures to roll encounters for (by slug), or filters for a random pick."""
+
+    creatures: List[str] = Field(default_factory=list)  # Slugs; each encounter meets all of them
+    # Used when `creatures` is empty: each encounter meets one random matching creature
+    species: Optional[str] = None
+    ac_min: Optional[int] = None
+    ac_max: Optional[int] = None
+    hd_min: Optional[int] = None
+    hd_max: Optional[int] = None
+    count: int = Field(1, ge=1)  # Number of encounters to roll
+    seed: Optional[int] = None  # Same seed and request -> same rolls
+    include_rolls: bool = True  # False returns only the per-creature statistics
+
+
+class EncounterGroup(BaseModel):
+    """One creature's group in a rolled encounter."""
+
+    slug: str
+    name: str
+    number_appearing: int
+    hit_points: List[int] = Field(default_factory=list)  # One roll per individual
+
+
+class EncounterCreatureStats(BaseModel):
+    """Aggregate of one creature's groups across all rolled encounters."""
+
+    slug: str
+    name: str
+    encounters: int  # Encounters this creature appeared in
+    number_appearing_dice: str  # e.g. '2d6' for '2-12'
+    hit_points_dice: Optional[str] = None  # Hit dice in d6, e.g. '8d6'; None if not numeric
+    number_appearing_mean: float
+    number_appearing_min: int
+    number_appearing_max: int
+    hit_points_mean: Optional[float] = None  # Per individual
+    group_hit_points_mean: Optional[float] = None  # Per encounter, whole group
+
+
+class EncounterResponse(BaseModel):
+    seed: int  # Pass back in to reproduce these rolls
+    count: int
+    encounters: List[List[EncounterGroup]] = Field(default_factory=list)  # Empty without rolls
+    stats: List[EncounterCreatureStats] = Field(default_factory=list)
+
+
+class CombatSimulationRequest(BaseModel):
+    """A party (saved and/or generated characters) against an encounter (creature slugs)."""
+
+    character_ids: List[str] = Field(default_factory=list)
+    generate: int = Field(0, ge=0, le=20)  # Random characters added to the party
+    attribute_method: AttributeRollMethod = AttributeRollMethod.HEROIC_4D6_DROP_LOWEST
+    party_armor_class: int = Field(10, ge=1, le=10)  # Characters carry no armor data; 10 = none
+    creatures: List[str] = Field(default_factory=list)  # Slugs; list one twice to meet two groups
+    roll_number_appearing: bool = True  # False: one individual per listed slug
+    fights: int = Field(1000, ge=1)
+    max_rounds: int = Field(50, ge=1, le=500)  # Fights still undecided after this are draws
+    seed: Optional[int] = None  # Same seed and request -> same result
+
+
+class CombatantSummary(BaseModel):
+    """A fighter's simulated stats (creatures: one entry per listed slug)."""
+
+    name: str
+    armor_class: int
+    hit_points: str  # Fixed for characters, dice for creatures (rolled per fight)
+    to_hit: int
+    damage: str
+    count: str = "1"  # Creatures: group size dice
+    survival_rate: Optional[float] = None  # Characters: share of fights survived
+
+
+class HitPointDistribution(BaseModel):
+    """Share of the party's total starting HP left at the end of a fight, over all fights."""
+
+    mean: float
+    p10: float
+    p25: float
+    p50: float
+    p75: float
+    p90: float
+
+
+class CombatSimulationResponse(BaseModel):
+    seed: int  # Pass back in to reproduce this result
+    fights: int
+    party: List[CombatantSummary]
+    creatures: List[CombatantSummary]
+    party_win_rate: float
+    creature_win_rate: float
+    draw_rate: float  # Round limit reached, or both sides fell in the same round
+    mean_rounds: float
+    mean_creatures: float  # Creatures met per fight
+    creature_kill_rate: float  # Share of creatures met that were killed
+    party_hp_remaining: HitPointDistribution
+    cached: bool = False  # True if served from the simulation cache
+
+
+class ImageInfo(BaseModel):
+    """An image file known to the in-memory image index (see imageindex.py)."""
+
+    path: str  # Relative to the static root, e.g. 'images/characters/ab/<id>.png'
+    width: int
+    height: int
+    size: int
+    mtime_ns: int
+
+
 # --- API Request/Response Models ---
 
 
@@ -149,11 +302,14 @@ class CharacterSummary(BaseModel):
     hit_points: Optional[int] = None
     saved: int
     image: Optional[str] = None
+    image_width: Optional[int] = None
+    image_height: Optional[int] = None
 
 
 class SaveCharacterRequest(BaseModel):
     character: Character
-    image_data: Optional[str] = None
+    image_data: Optional[str] = None  # Base64 upload...
+    image_handle: Optional[str] = None  # ...or a generated image held server-side (preferred)
 
     @field_validator("character")
     def _validate_character(cls, v):
@@ -242,6 +398,10 @@ class GenerateDescriptionRequest(BaseModel):
     attributes: Attributes
     physical_mutations: List[Mutation]
     mental_mutations: List[Mutation]
+    # Skip the description cache (a deliberate regenerate); the new text replaces the cached one
+    bypass_cache: bool = Field(False, alias="bypassCache")
+
+    model_config = ConfigDict(populate_by_name=True)
 
 
 class GenerateDescriptionResponse(BaseModel):
@@ -258,10 +418,103 @@ class GenerateImageResponse(BaseModel):
     status: str  # 'success' or 'error'
     image_data: Optional[str] = None  # Base64 encoded image data
     mime_type: Optional[str] = None  # e.g., 'image/png'
+    image_handle: Optional[str] = None  # The same image held server-side (see imagestore.py)
+    image_url: Optional[str] = None  # Preview URL of the held image
     message: Optional[str] = None  # For error details
 
 
+class ImageJobState(str, Enum):
+    """Lifecycle of an image-generation job (see imagejobs.py)."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class ImageJobResponse(BaseModel):
+    job_id: str
+    # Only in the response to the submission: pass to DELETE /api/image-jobs/{id} to cancel
+    subscription: Optional[str] = None
+    state: ImageJobState
+    created: float  # Unix timestamps
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    deduplicated: bool = False  # True if an identical pending job was returned instead
+    error: Optional[str] = None
+    error_status: Optional[int] = None  # HTTP status /generate_image would have returned
+    image_handle: Optional[str] = None  # Once succeeded: pass to /save_character
+    image_url: Optional[str] = None  # Preview of the held image
+    mime_type: Optional[str] = None
+
+
+class DescriptionImageResult(BaseModel):
+    """Final 'done' event of /generate_description_and_image/stream."""
+
+    description: str
+    image_job: Optional[ImageJobResponse] = None  # The finished job (succeeded, failed, ...)
+    image_error: Optional[str] = None  # Why no image job could be started
+    image_error_status: Optional[int] = None  # HTTP status that error would have had
+
+
 class SaveCharacterResponse(BaseModel):
     id: str
     json_path: str
     image_path: Optional[str] = None
+
+
+class ImportLibraryResponse(BaseModel):
+    imported: List[str] = Field(default_factory=list)  # Final IDs of committed characters
+    renamed: Dict[str, str] = Field(default_factory=dict)  # Archive ID -> new ID on conflict
+    skipped: List[str] = Field(default_factory=list)  # Archive members ignored or in conflict
+    errors: List[str] = Field(default_factory=list)  # Members rejected by validation or I/O
+
+
+class LatencyStats(BaseModel):
+    """Nearest-rank percentiles of durations in seconds (0 when there were no calls)."""
+
+    p50: float = 0.0
+    p90: float = 0.0
+    p99: float = 0.0
+    max: float = 0.0
+
+
+class AIOperationSummary(BaseModel):
+    """Recent model calls of one operation (e.g. 'description', 'image')."""
+
+    calls: int
+    outcomes: Dict[str, int]  # success, blocked, rate_limited, timeout, error, busy, cancelled
+    models: Dict[str, int]
+    attempts: int  # Upstream requests, retries included
+    queue_seconds: LatencyStats  # Waiting for a gateway slot
+    upstream_seconds: LatencyStats  # Inside upstream requests
+    total_seconds: LatencyStats  # Wall time of the whole call
+    first_chunk_seconds: Optional[LatencyStats] = None  # Streams only
+    prompt_bytes: int
+    response_bytes: int
+    image_bytes: int
+    prompt_tokens: int
+    response_tokens: int
+    total_tokens: int
+    mime_types: Dict[str, int]
+
+
+class AICallFailure(BaseModel):
+    started: float
+    operation: str
+    outcome: str
+    error: Optional[str] = None  # Exception type or block reason
+    attempts: int
+    total_seconds: float
+
+
+class AITelemetrySummary(BaseModel):
+    """Rolling summary of this worker's recent AI calls (see aitelemetry.py)."""
+
+    window_seconds: int
+    since: float  # When this worker started recording
+    calls: int
+    operations: Dict[str, AIOperationSummary]
+    shared_calls: Dict[str, int]  # Callers served by an identical call in flight, since start
+    recent_failures: List[AICallFailure]  # Last 10 unsuccessful calls in the window
@@ -0,0 +1,168 @@
+# paths.py
+"""
+Path resolution for saved characters and their portraits.
+
+Character files live in hash-prefix shards so no directory grows unbounded:
+    characters/<shard>/<id>.json
+    images/characters/<shard>/<id>.png    (kept apart from creature art in images/)
+where <shard> is the first config.STORAGE_SHARD_CHARS hex digits of sha1(id).
+Files saved before sharding (flat characters/<id>.json, images/<id>.png) are still
+found by the lookup helpers; `uv run python paths.py --migrate` moves them.
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import config
+import utils
+
+log = logging.getLogger(__name__)
+
+
+def shard_for(char_id: str) -> str:
+    """Returns the shard directory name for a character ID ('' when sharding is off)."""
+    if config.STORAGE_SHARD_CHARS <= 0:
+        return ""
+    return hashlib.sha1(char_id.encode("utf-8")).hexdigest()[: config.STORAGE_SHARD_CHARS]
+
+
+def character_json_path(char_id: str) -> Path:
+    """Canonical location of a character's JSON file (where new saves are written)."""
+    return config.CHAR_DIR / shard_for(char_id) / f"{char_id}.json"
+
+
+def character_image_path(char_id: str) -> Path:
+    """Canonical location of a character's portrait."""
+    return config.CHARACTER_IMAGE_DIR / shard_for(char_id) / f"{char_id}.png"
+
+
+def legacy_character_json_path(char_id: str) -> Path:
+    return config.CHAR_DIR / f"{char_id}.json"
+
+
+def legacy_character_image_path(char_id: str) -> Path:
+    return config.IMAGE_DIR / f"{char_id}.png"
+
+
+def find_character_json(char_id: str) -> Optional[Path]:
+    """Existing JSON file for a character (canonical first, then legacy flat), or None."""
+    for path in (character_json_path(char_id), legacy_character_json_path(char_id)):
+        if path.is_file():
+            return path
+    return None
+
+
+def find_character_image(char_id: str) -> Optional[Path]:
+    """Existing portrait for a character (canonical first, then legacy flat), or None."""
+    for path in (character_image_path(char_id), legacy_character_image_path(char_id)):
+        if path.is_file():
+            return path
+    return None
+
+
+def is_character_image(path: Path) -> bool:
+    """
+    True for a character portrait or one of its variants: anything under
+    CHARACTER_IMAGE_DIR, or a legacy flat file in IMAGE_DIR named by a character ID.
+    Everything else in IMAGE_DIR is creature or site art.
+    """
+    if path.is_relative_to(config.CHARACTER_IMAGE_DIR):
+        return True
+    stem = path.name.split(".", 1)[0]  # <id>.png, <id>.thumb.webp, ...
+    return path.parent == config.IMAGE_DIR and utils.character_id_timestamp(stem) is not None
+
+
+def creature_image_path(slug: str) -> Path:
+    """Location of a creature's art (flat in images/, named by slug)."""
+    return config.IMAGE_DIR / f"{slug}.png"
+
+
+def variant_path(source: Path, variant: str, fmt: str = "webp") -> Path:
+    """Location of a resized variant, next to its source (e.g. <id>.thumb.webp)."""
+    return source.with_name(f"{source.stem}.{variant}.{fmt}")
+
+
+def variant_paths(source: Path) -> List[Path]:
+    """Every possible variant location for a source image ('full' plus each width, per format)."""
+    return [
+        variant_path(source, variant, fmt)
+        for fmt in config.IMAGE_VARIANT_FORMATS
+        for variant in ("full", *config.IMAGE_VARIANT_WIDTHS)
+    ]
+
+
+def static_url_path(path: Path) -> str:
+    """Path relative to the static mount, with forward slashes (e.g. 'images/characters/..')."""
+    return path.relative_to(config.STATIC_DIR).as_posix()
+
+
+def iter_character_files() -> Iterator[Tuple[str, Path]]:
+    """
+    Yields (char_id, json_path) for every saved character: files in shard directories
+    (of any width) plus legacy files at the top of config.CHAR_DIR. Uses scandir so a
+    large library is streamed rather than listed up front.
+    """
+    if not config.CHAR_DIR.exists():
+        return
+    with os.scandir(config.CHAR_DIR) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                with os.scandir(entry.path) as shard_entries:
+                    for shard_entry in shard_entries:
+                        if shard_entry.name.endswith(".json") and shard_entry.is_file():
+                            yield shard_entry.name[: -len(".json")], Path(shard_entry.path)
+            elif entry.name.endswith(".json") and entry.name != config.INDEX_FILE.name:
+                yield entry.name[: -len(".json")], Path(entry.path)
+
+
+# --- Migration ---
+
+
+def _move(src: Path, dst: Path) -> None:
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(src, dst)
+    log.info(f"Moved {src} -> {dst}")
+
+
+def migrate_layout() -> int:
+    """
+    Moves every character JSON and portrait to its canonical (sharded) location and
+    rebuilds the index. Creature art in images/ is not touched. Returns files moved.
+    """
+    import storage  # Local import: storage depends on this module
+
+    moved = 0
+    for char_id, json_path in list(iter_character_files()):
+        target = character_json_path(char_id)
+        if json_path != target:
+            _move(json_path, target)
+            moved += 1
+        image = find_character_image(char_id)
+        image_target = character_image_path(char_id)
+        if image is not None and image != image_target:
+            _move(image, image_target)
+            moved += 1
+            for variant in variant_paths(image):  # Cheap to rebuild, so drop rather than move
+                variant.unlink(missing_ok=True)
+    storage.rebuild_index()
+    log.info(f"Storage layout migration complete: {moved} file(s) moved.")
+    return moved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Character storage layout tools.")
+    parser.add_argument(
+        "--migrate",
+        action="store_true",
+        help="Move character files and portraits into the sharded layout.",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    if args.migrate:
+        migrate_layout()
+    else:
+        parser.print_help()
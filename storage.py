@@ -0,0 +1,410 @@
+# storage.py
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+import config
+import paths
+import utils
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# --- I/O Thread Pool ---
+# All blocking disk work for the save/delete paths runs here so the event loop never
+# waits on write()/fsync(). The pool is small on purpose: disk throughput, not CPU, is the limit.
+# Started on first use, so the app can start again after shutdown() (e.g. in tests).
+_io_pool: Optional[ThreadPoolExecutor] = None
+_io_pool_lock = threading.Lock()
+
+# --- Compute Thread Pool ---
+# CPU-bound request work (encounter rolls and the like) runs here rather than on the I/O
+# pool, so it never occupies the threads saves and deletes wait on. Lazy, like _io_pool.
+_cpu_pool: Optional[ThreadPoolExecutor] = None
+_cpu_pool_lock = threading.Lock()
+
+# Serialises read-modify-write cycles on index.json between pool threads. Other worker
+# processes are kept out by an advisory lock on config.INDEX_LOCK_FILE (see _locked_index).
+_index_lock = threading.Lock()
+
+
+async def run_io(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Runs a blocking storage function on the I/O pool and awaits its result."""
+    global _io_pool
+    if _io_pool is None:
+        with _io_pool_lock:
+            if _io_pool is None:
+                _io_pool = ThreadPoolExecutor(
+                    max_workers=config.STORAGE_IO_WORKERS, thread_name_prefix="storage-io"
+                )
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_io_pool, partial(func, *args, **kwargs))
+
+
+async def run_cpu(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Runs a CPU-bound function on the compute pool and awaits its result."""
+    global _cpu_pool
+    if _cpu_pool is None:
+        with _cpu_pool_lock:
+            if _cpu_pool is None:
+                _cpu_pool = ThreadPoolExecutor(
+                    max_workers=config.COMPUTE_WORKERS, thread_name_prefix="compute"
+                )
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_cpu_pool, partial(func, *args, **kwargs))
+
+
+def shutdown() -> None:
+    """Waits for pending writes and computations to finish and stops both pools."""
+    global _io_pool, _cpu_pool
+    with _io_pool_lock:
+        pool, _io_pool = _io_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+    with _cpu_pool_lock:
+        pool, _cpu_pool = _cpu_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+# --- Atomic File Writes ---
+
+
+def _fsync_dir(directory: Path) -> None:
+    """Flushes a directory entry so a rename survives a crash (no-op where unsupported)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # e.g. Windows, where directories cannot be opened
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_temp(target: Path, data: bytes) -> Path:
+    """Writes data to a fsynced temp file next to target and returns the temp path."""
+    return stage_file(target, [data])
+
+
+def stage_file(target: Path, chunks: Iterable[bytes]) -> Path:
+    """
+    Streams chunks into a fsynced temp file next to target and returns the temp path.
+    The temp file is not visible under target's name until passed to commit_staged().
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)  # Shard directories are created on demand
+    fd, tmp_name = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+    tmp_path = Path(tmp_name)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return tmp_path
+
+
+def link_file(source: Path, target: Path) -> Path:
+    """
+    Stages an existing file for target without copying it: a hard link next to target
+    (a copy only if the filesystem cannot link). Returns the temp path for
+    commit_staged(); the source file is left in place.
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    tmp_path.unlink()  # os.link needs a free name; mkstemp only reserved a unique one
+    try:
+        os.link(source, tmp_path)
+    except OSError as e:  # Other filesystem or no hard links: fall back to a copy
+        log.debug(f"Could not link {source} to {tmp_path} ({e}); copying instead.")
+        with open(source, "rb") as f:
+            return stage_file(target, iter(lambda: f.read(1024 * 1024), b""))
+    return tmp_path
+
+
+def atomic_write_bytes(target: Path, data: bytes) -> None:
+    """Replaces target with data atomically (temp file, fsync, rename)."""
+    commit_files([(target, data)])
+
+
+def commit_files(files: Sequence[Tuple[Path, bytes]]) -> None:
+    """
+    Atomically writes a group of files: either every file becomes visible or none do
+    (on failure, files that existed before keep their previous content).
+    Files are renamed into place in the given order, so put the file whose presence
+    marks the group as complete (e.g. the character JSON) last.
+    """
+    staged: List[Tuple[Path, Path]] = []
+    try:
+        for target, data in files:
+            staged.append((_write_temp(target, data), target))
+    except BaseException:
+        for tmp_path, _ in staged:
+            tmp_path.unlink(missing_ok=True)
+        raise
+    commit_staged(staged)
+
+
+def commit_staged(staged: Sequence[Tuple[Path, Path]]) -> None:
+    """
+    Renames (temp_path, target) pairs into place in order, rolling back on failure.
+    Targets that already exist are hard-linked to a backup first, so a rollback puts
+    the previous files back (an overwrite fails as a whole) instead of deleting them.
+    """
+    backups: Dict[Path, Path] = {}  # Target -> link to its previous content
+    committed: List[Path] = []
+    try:
+        for _, target in staged:
+            if target.exists():
+                backups[target] = link_file(target, target)
+        for tmp_path, target in staged:
+            target.parent.mkdir(parents=True, exist_ok=True)  # May differ from the temp's dir
+            os.replace(tmp_path, target)
+            committed.append(target)
+    except BaseException:
+        log.error(f"Commit of {[str(t) for _, t in staged]} failed, rolling back.")
+        for target in committed:
+            if target in backups:
+                os.replace(backups.pop(target), target)
+            else:
+                target.unlink(missing_ok=True)
+        for path in [tmp_path for tmp_path, _ in staged] + list(backups.values()):
+            path.unlink(missing_ok=True)
+        raise
+
+    for backup in backups.values():
+        backup.unlink(missing_ok=True)
+    for directory in {target.parent for _, target in staged}:
+        _fsync_dir(directory)
+
+
+# --- Character Index ---
+
+
+def _lock_file(f) -> None:
+    """Blocks until an exclusive advisory lock is held on the open file."""
+    if os.name == "nt":
+        while True:
+            try:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue  # LK_LOCK gives up after ~10s; keep waiting like flock does
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock_file(f) -> None:
+    if os.name == "nt":
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def _locked_index() -> Iterator[None]:
+    """
+    Holds the index for a read-modify-write cycle, across threads and processes.
+    Every uvicorn worker takes the same lock file, so only one of them can be
+    between reading and rewriting index.json at any time.
+    """
+    with _index_lock:
+        config.INDEX_LOCK_FILE.parent.mkdir(parents=True, exist_ok=True)
+        with open(config.INDEX_LOCK_FILE, "a+b") as f:
+            _lock_file(f)
+            try:
+                yield
+            finally:
+                _unlock_file(f)
+
+
+def _read_index() -> List[Dict[str, Any]]:
+    """Reads index.json, treating a missing or corrupted file as an empty index."""
+    if not config.INDEX_FILE.exists():
+        return []
+    try:
+        with config.INDEX_FILE.open("r", encoding="utf-8") as f:
+            idx = json.load(f)
+    except json.JSONDecodeError:
+        log.warning(f"Index file {config.INDEX_FILE} is corrupted (invalid JSON). Overwriting.")
+        return []
+    if not isinstance(idx, list):
+        log.warning(f"Index file {config.INDEX_FILE} is corrupted (not a list). Overwriting.")
+        return []
+    return idx
+
+
+def _write_index(idx: List[Dict[str, Any]]) -> None:
+    atomic_write_bytes(config.INDEX_FILE, json.dumps(idx, indent=2).encode("utf-8"))
+
+
+def write_index_record(rec: Dict[str, Any]) -> None:
+    """Append a compact summary of the character to characters/index.json."""
+    try:
+        with _locked_index():
+            idx = _read_index()
+            idx.append(rec)
+            _write_index(idx)
+        log.info(f"Appended character ID {rec.get('id')} to index.")
+    except Exception as e:
+        log.error(f"Could not update index file {config.INDEX_FILE}: {e}", exc_info=True)
+        # Non-fatal, but log as error
+
+
+def remove_index_record(char_id: str) -> bool:
+    """Removes a character from index.json. Returns True if an entry was removed."""
+    try:
+        with _locked_index():
+            idx = _read_index()
+            updated = [rec for rec in idx if isinstance(rec, dict) and rec.get("id") != char_id]
+            if len(updated) == len(idx):
+                log.warning(f"Character ID {char_id} not found in index file {config.INDEX_FILE}.")
+                return False
+            _write_index(updated)
+        log.info(f"Removed character {char_id} from index.")
+        return True
+    except Exception as e:
+        log.error(f"Error processing character index {config.INDEX_FILE}: {e}", exc_info=True)
+        return False
+
+
+def character_summary(
+    char_id: str, data: Dict[str, Any], saved: int, image_path: Optional[Path]
+) -> Dict[str, Any]:
+    """Builds the index.json record for a character from its saved JSON data."""
+    return {
+        "id": char_id,
+        "name": data.get("name") or "Unnamed",
+        "type": data.get("character_type", data.get("characterType", "Unknown")),
+        "hit_points": data.get("hit_points", data.get("hitPoints")),
+        "saved": saved,
+        "image": paths.static_url_path(image_path) if image_path else None,
+    }
+
+
+def rebuild_index(saved_hints: Optional[Dict[str, int]] = None) -> int:
+    """
+    Rewrites index.json from the character files on disk in a single write.
+    Existing index records are reused; characters missing from the index are read
+    from disk, taking their saved time from saved_hints, the ID timestamp, or mtime.
+    Returns the number of records written.
+    """
+    saved_hints = saved_hints or {}
+    with _locked_index():
+        existing = {
+            rec["id"]: rec for rec in _read_index() if isinstance(rec, dict) and rec.get("id")
+        }
+        records: List[Dict[str, Any]] = []
+        for char_id, json_path in paths.iter_character_files():
+            image_path = paths.find_character_image(char_id)
+            if char_id in existing and char_id not in saved_hints:
+                rec = dict(existing[char_id])
+                rec["image"] = paths.static_url_path(image_path) if image_path else None
+                records.append(rec)
+                continue
+            try:
+                with open(json_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                log.warning(f"Skipping unreadable character file {json_path}: {e}")
+                continue
+            saved = saved_hints.get(char_id) or utils.character_id_timestamp(char_id)
+            if saved is None:
+                saved = int(json_path.stat().st_mtime)
+            records.append(character_summary(char_id, data, saved, image_path))
+        records.sort(key=lambda rec: rec.get("saved") or 0)
+        _write_index(records)
+    log.info(f"Rebuilt character index with {len(records)} records.")
+    return len(records)
+
+
+# --- Character Files ---
+
+
+def save_character_files(
+    char_path: Path,
+    char_json: str,
+    img_path: Optional[Path] = None,
+    img_bytes: Optional[bytes] = None,
+    img_source: Optional[Path] = None,
+) -> None:
+    """
+    Commits a character's JSON and optional image together, or neither on failure.
+    The image is img_bytes, or an existing file (img_source) linked into place.
+    """
+    staged: List[Tuple[Path, Path]] = []
+    try:
+        if img_path is not None and img_source is not None:
+            staged.append((link_file(img_source, img_path), img_path))
+        elif img_path is not None and img_bytes is not None:
+            staged.append((_write_temp(img_path, img_bytes), img_path))
+        # JSON last: it marks the save complete
+        staged.append((_write_temp(char_path, char_json.encode("utf-8")), char_path))
+    except BaseException:
+        for tmp_path, _ in staged:
+            tmp_path.unlink(missing_ok=True)
+        raise
+    commit_staged(staged)
+    log.info(f"Character files committed: {[str(t) for _, t in staged]}")
+
+
+def delete_character_files(char_id: str) -> bool:
+    """
+    Removes a character from the index and deletes its JSON and image files.
+    Returns True if anything (index entry or file) was actually removed.
+    """
+    deleted_something = remove_index_record(char_id)
+
+    image_paths = [paths.character_image_path(char_id), paths.legacy_character_image_path(char_id)]
+    for path in [
+        paths.character_json_path(char_id),
+        paths.legacy_character_json_path(char_id),
+        *image_paths,
+        *[variant for image in image_paths for variant in paths.variant_paths(image)],
+    ]:
+        try:
+            path.unlink()
+            log.info(f"Deleted character file: {path}")
+            deleted_something = True
+        except FileNotFoundError:
+            # Expected: only one of each canonical/legacy pair exists, images and variants are optional
+            log.debug(f"Character file not found, nothing to delete: {path}")
+        except OSError as e:
+            log.error(f"Error deleting character file {path}: {e}", exc_info=True)
+            # Continue deletion process even if one file fails
+
+    return deleted_something
@@ -0,0 +1,83 @@
+# styleref.py
+"""
+The style reference image sent with every image-generation request.
+
+The PNG is decoded, downscaled to what the model actually looks at and encoded to
+JPEG once, then shared by all requests as a ready-made content part; it is only
+reloaded when the file's mtime or size changes. Deliberately free of project
+imports so the standalone creatures-img-gen.py script can use it too.
+"""
+
+import io
+import logging
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+from google.genai import types as genai_types
+from PIL import Image, ImageOps
+
+log = logging.getLogger(__name__)
+
+# Gemini scales images to 768 px tiles, so larger references only cost upload time
+DEFAULT_MAX_SIDE = 768
+DEFAULT_QUALITY = 90  # JPEG quality; keeps the palette and line work intact
+
+
+class StyleReference:
+    """A style image, loaded lazily and kept as an encoded genai Part until the file changes."""
+
+    def __init__(
+        self, path: Path, max_side: int = DEFAULT_MAX_SIDE, quality: int = DEFAULT_QUALITY
+    ):
+        self.path = path
+        self.max_side = max_side
+        self.quality = quality
+        self._stamp: Optional[Tuple[int, int]] = None  # (mtime_ns, size) of the loaded file
+        self._part: Optional[genai_types.Part] = None
+        self._lock = threading.Lock()  # One reload at a time
+
+    def _current_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _encode(self) -> bytes:
+        with Image.open(self.path) as img:
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((self.max_side, self.max_side), Image.Resampling.LANCZOS)
+            if img.mode != "RGB":  # JPEG has no alpha; flatten onto white
+                rgba = img.convert("RGBA")
+                img = Image.new("RGB", rgba.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.getchannel("A"))
+            buf = io.BytesIO()
+            img.save(buf, format="JPEG", quality=self.quality, optimize=True)
+        return buf.getvalue()
+
+    def part(self) -> Optional[genai_types.Part]:
+        """
+        The encoded reference as a content part, or None if the file is missing or
+        unreadable. Costs one stat() unless the file changed. Blocking on a reload.
+        """
+        stamp = self._current_stamp()
+        if stamp is not None and stamp == self._stamp:
+            return self._part
+        with self._lock:
+            if stamp is not None and stamp == self._stamp:  # Reloaded by another thread
+                return self._part
+            if stamp is None:
+                log.warning(f"Style image not found at {self.path}.")
+                self._stamp, self._part = None, None
+                return None
+            try:
+                data = self._encode()
+            except Exception as e:
+                log.warning(f"Could not load style image '{self.path}': {e}")
+                self._stamp, self._part = stamp, None  # Don't retry until the file changes
+                return None
+            self._part = genai_types.Part.from_bytes(data=data, mime_type="image/jpeg")
+            self._stamp = stamp
+            log.info(f"Loaded style image {self.path} ({len(data)} bytes as JPEG).")
+            return self._part
@@ -0,0 +1,41 @@
+# tests/conftest.py
+from pathlib import Path
+
+import pytest
+
+import config
+import imageindex
+
+
+def use_library(root: Path) -> None:
+    """Points every character/image path in config at a library under root."""
+    config.CHAR_DIR = root / "characters"
+    config.INDEX_FILE = config.CHAR_DIR / "index.json"
+    config.INDEX_LOCK_FILE = config.CHAR_DIR / ".index.lock"
+    config.STATIC_DIR = root
+    config.IMAGE_DIR = root / "images"
+    config.CHARACTER_IMAGE_DIR = config.IMAGE_DIR / "characters"
+    config.IMAGE_MANIFEST_FILE = config.IMAGE_DIR / "manifest.json"
+    config.GENERATED_IMAGE_DIR = root / "cache" / "generated"
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    """An empty character library in a temp directory (config restored afterwards)."""
+    for name in (
+        "CHAR_DIR",
+        "INDEX_FILE",
+        "INDEX_LOCK_FILE",
+        "STATIC_DIR",
+        "IMAGE_DIR",
+        "CHARACTER_IMAGE_DIR",
+        "IMAGE_MANIFEST_FILE",
+        "GENERATED_IMAGE_DIR",
+    ):
+        monkeypatch.setattr(config, name, getattr(config, name))
+    monkeypatch.setattr(imageindex, "_images", {})
+    monkeypatch.setattr(imageindex, "_manifest", {})
+    use_library(tmp_path)
+    config.CHAR_DIR.mkdir(parents=True)
+    config.CHARACTER_IMAGE_DIR.mkdir(parents=True)
+    return tmp_path
@@ -0,0 +1,264 @@
+# tests/test_ai_gateway.py
+"""
+Drives AIGateway with a fake upstream: a coroutine factory whose calls block until
+released, fail a given number of times first, and count how often they are cancelled.
+"""
+
+import asyncio
+import random
+from typing import List, Optional
+
+import pytest
+
+import aitelemetry
+from ai_services import AIGateway, AIServiceBusy
+
+
+class FakeUpstream:
+    """make_call for the gateway: blocks each call on `release`, after `failures` failures."""
+
+    def __init__(self, failures: int = 0, error: Optional[Exception] = None):
+        self.failures = failures
+        self.error = error or ConnectionError("upstream unavailable")
+        self.release = asyncio.Event()
+        self.started = 0
+        self.running = 0
+        self.peak = 0
+        self.cancelled = 0
+
+    async def __call__(self) -> str:
+        self.started += 1
+        attempt = self.started
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            if attempt <= self.failures:
+                raise self.error
+            await self.release.wait()
+            return f"response {attempt}"
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.running -= 1
+
+
+def _gateway(**overrides) -> AIGateway:
+    settings = dict(
+        max_concurrent=2,
+        max_queued=2,
+        max_retries=3,
+        retry_base_seconds=0.01,
+        retry_max_seconds=0.05,
+    )
+    settings.update(overrides)
+    return AIGateway(**settings)
+
+
+async def _settle() -> None:
+    """Lets every runnable task advance until it blocks."""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_concurrency_cap():
+    async def scenario():
+        gateway = _gateway(max_concurrent=2, max_queued=10)
+        upstream = FakeUpstream()
+        tasks = [asyncio.ensure_future(gateway.call(None, upstream)) for _ in range(5)]
+        await _settle()
+        assert (upstream.running, gateway.admitted) == (2, 5)
+
+        upstream.release.set()
+        results = await asyncio.gather(*tasks)
+        assert len(set(results)) == 5
+        assert upstream.peak == 2
+        assert gateway.admitted == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_rejects_immediately():
+    async def scenario():
+        gateway = _gateway(max_concurrent=1, max_queued=1)
+        upstream = FakeUpstream()
+        tasks = [asyncio.ensure_future(gateway.call(None, upstream)) for _ in range(2)]
+        await _settle()
+
+        rejected = aitelemetry.AICall("test", "fake")
+        with pytest.raises(AIServiceBusy):
+            await gateway.call(None, upstream, call=rejected)
+        assert rejected.outcome == "busy"
+        assert upstream.started == 1  # The second call is still queued
+
+        upstream.release.set()
+        await asyncio.gather(*tasks)
+        assert gateway.admitted == 0
+
+    asyncio.run(scenario())
+
+
+def test_identical_calls_share_one_flight():
+    async def scenario():
+        gateway = _gateway(max_concurrent=1, max_queued=0)
+        upstream = FakeUpstream()
+        calls = [aitelemetry.AICall("test", "fake") for _ in range(3)]
+        tasks = [asyncio.ensure_future(gateway.call("key", upstream, call=c)) for c in calls]
+        await _settle()
+        assert upstream.started == 1
+        assert gateway.admitted == 1  # Joiners take no queue place
+
+        upstream.release.set()
+        assert await asyncio.gather(*tasks) == ["response 1"] * 3
+        assert [c.shared for c in calls] == [False, True, True]
+        assert calls[0].attempts == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_one_waiter_keeps_the_flight():
+    async def scenario():
+        gateway = _gateway()
+        upstream = FakeUpstream()
+        first = asyncio.ensure_future(gateway.call("key", upstream))
+        second = asyncio.ensure_future(gateway.call("key", upstream))
+        await _settle()
+
+        first.cancel()
+        await _settle()
+        assert first.cancelled()
+        assert upstream.cancelled == 0
+
+        upstream.release.set()
+        assert await second == "response 1"
+        assert upstream.started == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelling_every_waiter_cancels_the_upstream_call():
+    async def scenario():
+        gateway = _gateway()
+        upstream = FakeUpstream()
+        tasks = [asyncio.ensure_future(gateway.call("key", upstream)) for _ in range(2)]
+        await _settle()
+
+        for task in tasks:
+            task.cancel()
+        await _settle()
+        assert upstream.cancelled == 1
+        assert gateway.admitted == 0
+
+        # The key is free again: a new caller starts a new upstream call
+        upstream.release.set()
+        assert await gateway.call("key", upstream) == "response 2"
+
+    asyncio.run(scenario())
+
+
+def test_retryable_failures_are_retried_with_backoff():
+    async def scenario():
+        gateway = _gateway(max_retries=3)
+        delays: List[int] = []
+        gateway.backoff = lambda attempt: delays.append(attempt) or 0.1
+        upstream = FakeUpstream(failures=2)
+        upstream.release.set()
+
+        call = aitelemetry.AICall("test", "fake")
+        assert await gateway.call(None, upstream, call=call) == "response 3"
+        assert delays == [0, 1]
+        assert call.attempts == 3
+        assert call.retry_wait_seconds == pytest.approx(0.2)
+        assert call.upstream_seconds < 0.05  # The attempts return at once; backoff excluded
+
+    asyncio.run(scenario())
+
+
+def test_retries_stop_at_max_retries():
+    async def scenario():
+        gateway = _gateway(max_retries=2)
+        gateway.backoff = lambda attempt: 0.001
+        upstream = FakeUpstream(failures=10)
+
+        with pytest.raises(ConnectionError):
+            await gateway.call(None, upstream)
+        assert upstream.started == 3
+        assert gateway.admitted == 0
+
+    asyncio.run(scenario())
+
+
+def test_non_retryable_failure_is_raised_at_once():
+    async def scenario():
+        gateway = _gateway()
+        upstream = FakeUpstream(failures=1, error=ValueError("bad request"))
+
+        with pytest.raises(ValueError):
+            await gateway.call(None, upstream)
+        assert upstream.started == 1
+
+    asyncio.run(scenario())
+
+
+def test_backoff_is_full_jitter_and_capped():
+    gateway = _gateway(retry_base_seconds=1.0, retry_max_seconds=5.0)
+    random.seed(1)
+    for attempt, cap in ((0, 1.0), (2, 4.0), (5, 5.0)):
+        delays = [gateway.backoff(attempt) for _ in range(500)]
+        assert all(0 <= delay <= cap for delay in delays)
+        assert min(delays) < cap * 0.1 and max(delays) > cap * 0.9  # Spread over [0, cap]
+
+
+@pytest.fixture
+def telemetry(monkeypatch) -> aitelemetry.Telemetry:
+    fresh = aitelemetry.Telemetry(max_calls=100, window_seconds=3600)
+    monkeypatch.setattr(aitelemetry, "telemetry", fresh)
+    return fresh
+
+
+async def _recorded_call(gateway: AIGateway, upstream: FakeUpstream) -> str:
+    with aitelemetry.record("test", "fake") as call:
+        result = await gateway.call("key", upstream, call=call)
+        call.outcome = "success"
+        return result
+
+
+def test_flight_is_recorded_when_its_first_caller_leaves(telemetry):
+    async def scenario():
+        gateway = _gateway()
+        upstream = FakeUpstream()
+        first = asyncio.ensure_future(_recorded_call(gateway, upstream))
+        second = asyncio.ensure_future(_recorded_call(gateway, upstream))
+        await _settle()
+
+        first.cancel()
+        await _settle()
+        assert telemetry.summary().calls == 0  # Still running: nothing recorded yet
+
+        await asyncio.sleep(0.02)
+        upstream.release.set()
+        assert await second == "response 1"
+        await _settle()
+
+    asyncio.run(scenario())
+    summary = telemetry.summary()
+    assert summary.calls == 1 and summary.shared_calls == {"test": 1}
+    operation = summary.operations["test"]
+    assert operation.outcomes == {"success": 1}
+    assert operation.attempts == 1
+    assert operation.upstream_seconds.max >= 0.02
+
+
+def test_flight_cancelled_by_its_only_caller_records_the_attempt(telemetry):
+    async def scenario():
+        gateway = _gateway()
+        upstream = FakeUpstream()
+        task = asyncio.ensure_future(_recorded_call(gateway, upstream))
+        await _settle()
+        task.cancel()
+        await _settle()
+
+    asyncio.run(scenario())
+    operation = telemetry.summary().operations["test"]
+    assert operation.outcomes == {"cancelled": 1}
+    assert operation.attempts == 1
@@ -0,0 +1,122 @@
+# tests/test_archive.py
+import io
+import json
+import tarfile
+
+import archive
+import charfile
+import config
+import models
+import paths
+import storage
+import utils
+
+
+def _character(name: str) -> models.Character:
+    return models.Character(
+        name=name,
+        character_type=models.CharacterType.PSH,
+        attributes={
+            "mental_strength": 10,
+            "intelligence": 11,
+            "dexterity": 12,
+            "charisma": 13,
+            "constitution": 14,
+            "physical_strength": 15,
+        },
+        hit_points=42,
+    )
+
+
+def _archive(members) -> io.BytesIO:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    buf.seek(0)
+    return buf
+
+
+def test_export_then_import_round_trip(library):
+    char_id = utils.new_character_id("Ark")
+    storage.save_character_files(
+        paths.character_json_path(char_id),
+        charfile.encode_character(_character("Ark")),
+        paths.character_image_path(char_id),
+        b"portrait",
+    )
+    exported = io.BytesIO(b"".join(archive.iter_library_archive()))
+    storage.delete_character_files(char_id)
+
+    report = archive.import_library(exported)
+
+    assert report.imported == [char_id]
+    assert paths.find_character_image(char_id).read_bytes() == b"portrait"
+    index = json.loads(config.INDEX_FILE.read_text(encoding="utf-8"))
+    assert [rec["id"] for rec in index] == [char_id]
+
+
+def test_overwrite_drops_old_variants_and_manifest_entry(library):
+    char_id = utils.new_character_id("Ark")
+    img_path = paths.character_image_path(char_id)
+    storage.save_character_files(
+        paths.character_json_path(char_id),
+        charfile.encode_character(_character("Ark")),
+        img_path,
+        b"old portrait",
+    )
+    old_variants = paths.variant_paths(img_path)
+    for variant in old_variants:
+        variant.write_bytes(b"old variant")
+    rel = img_path.relative_to(config.IMAGE_DIR).as_posix()
+    other = "other.png"
+    config.IMAGE_MANIFEST_FILE.write_text(
+        json.dumps({"version": 1, "images": {rel: {"sha256": "0" * 64}, other: {}}}),
+        encoding="utf-8",
+    )
+
+    report = archive.import_library(
+        _archive(
+            [
+                (f"images/{char_id}.png", b"new portrait"),
+                (
+                    f"characters/{char_id}.json",
+                    charfile.encode_character(_character("Ark 2")).encode(),
+                ),
+            ]
+        ),
+        models.ImportConflictPolicy.OVERWRITE,
+    )
+
+    assert report.imported == [char_id]
+    assert img_path.read_bytes() == b"new portrait"
+    assert not any(variant.exists() for variant in old_variants)
+    manifest = json.loads(config.IMAGE_MANIFEST_FILE.read_text(encoding="utf-8"))
+    assert set(manifest["images"]) == {other}
+
+
+def test_skip_keeps_existing_character(library):
+    char_id = utils.new_character_id("Ark")
+    json_path = paths.character_json_path(char_id)
+    storage.save_character_files(json_path, charfile.encode_character(_character("Ark")))
+    before = json_path.read_bytes()
+
+    report = archive.import_library(
+        _archive(
+            [(f"characters/{char_id}.json", charfile.encode_character(_character("B")).encode())]
+        )
+    )
+
+    assert report.imported == [] and report.skipped == [f"characters/{char_id}.json"]
+    assert json_path.read_bytes() == before
+
+
+def test_only_a_top_level_index_is_read(library):
+    index = json.dumps([{"id": "x", "saved": 1}]).encode()
+    report = archive.import_library(
+        _archive([("../index.json", index), ("/.index.json", index), ("./index.json", index)])
+    )
+
+    assert report.skipped == ["../index.json", "/.index.json"]
@@ -0,0 +1,105 @@
+# tests/test_combat.py
+import asyncio
+import threading
+
+import pytest
+
+import combat
+import config
+import creatures
+import models
+import storage
+import utils
+
+
+@pytest.fixture(scope="module")
+def registry() -> creatures.CreatureRegistry:
+    return creatures.CreatureRegistry(utils.load_data_file(config.CREATURES_FILE))
+
+
+@pytest.fixture(autouse=True)
+def fresh_pools(monkeypatch):
+    monkeypatch.setattr(combat, "_results", combat.OrderedDict())
+    yield
+    combat.shutdown()
+    storage.shutdown()
+
+
+def _request(**overrides) -> models.CombatSimulationRequest:
+    fields = dict(generate=3, creatures=["ark", "arn"], fights=1000, seed=7)
+    fields.update(overrides)
+    return models.CombatSimulationRequest(**fields)
+
+
+def test_same_result_in_process_and_on_the_pool(registry, monkeypatch):
+    monkeypatch.setattr(config, "SIMULATION_WORKERS", 1)
+    inline = asyncio.run(combat.simulate(registry, _request()))
+    monkeypatch.setattr(combat, "_results", combat.OrderedDict())
+    monkeypatch.setattr(config, "SIMULATION_WORKERS", 2)
+    pooled = asyncio.run(combat.simulate(registry, _request()))
+
+    assert combat._pool is not None
+    assert not inline.cached and not pooled.cached
+    assert pooled == inline
+
+
+def test_fights_stay_off_the_io_pool(registry, monkeypatch):
+    monkeypatch.setattr(config, "SIMULATION_WORKERS", 1)
+    ran_on_io = []
+    run_io = storage.run_io
+
+    async def recording_run_io(func, *args, **kwargs):
+        ran_on_io.append(func.__name__)
+        return await run_io(func, *args, **kwargs)
+
+    monkeypatch.setattr(storage, "run_io", recording_run_io)
+    asyncio.run(combat.simulate(registry, _request()))
+
+    assert ran_on_io == ["_prepare"]
+
+
+def test_repeat_is_served_from_cache(registry, monkeypatch):
+    monkeypatch.setattr(config, "SIMULATION_WORKERS", 1)
+    first = asyncio.run(combat.simulate(registry, _request()))
+    again = asyncio.run(combat.simulate(registry, _request()))
+
+    assert again.cached
+    assert again.model_copy(update={"cached": False}) == first
+
+
+def test_invalid_request_raises_value_error(registry):
+    with pytest.raises(ValueError, match="Unknown creature"):
+        asyncio.run(combat.simulate(registry, _request(creatures=["no-such-creature"])))
+
+
+def test_result_cache_is_safe_across_threads(monkeypatch):
+    monkeypatch.setattr(config, "SIMULATION_CACHE_SIZE", 8)
+    response = object()
+    errors = []
+
+    def churn(worker: int) -> None:
+        try:
+            for i in range(2000):
+                key = (worker, i % 16)
+                if combat._cached(key) is None:
+                    combat._remember(key, response)
+        except Exception as e:  # e.g. "OrderedDict mutated during iteration", KeyError
+            errors.append(e)
+
+    threads = [threading.Thread(target=churn, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(combat._results) == config.SIMULATION_CACHE_SIZE
+
+
+def test_creature_armor_class_zero_is_kept(registry):
+    summary = registry.summaries[0]
+    armored = summary.model_copy(update={"armor_class_min": 0})
+    unknown = summary.model_copy(update={"armor_class_min": None})
+
+    assert combat.creature_combatant(armored, False).armor_class == 0
+    assert combat.creature_combatant(unknown, False).armor_class == combat.UNARMORED_AC
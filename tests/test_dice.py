@@ -0,0 +1,27 @@
+# tests/test_dice.py
+from random import Random
+
+import pytest
+
+import dice
+
+
+@pytest.mark.parametrize(
+    "low, high, expression",
+    [
+        (2, 12, "2d6"),
+        (3, 18, "3d6"),
+        (1, 10, "1d10"),
+        (2, 7, "1d6+1"),
+        (5, 10, "1d6+4"),
+        (10, 100, "1d91+9"),
+        (4, 4, "4"),
+    ],
+)
+def test_range_expression(low, high, expression):
+    assert dice.range_expression(low, high) == expression
+
+
+def test_stat_sampler_stays_in_range():
+    sampler = dice.stat_sampler("5-10")
+    assert set(sampler.sample(Random(1), 2000)) == set(range(5, 11))
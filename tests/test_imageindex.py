@@ -0,0 +1,98 @@
+# tests/test_imageindex.py
+import json
+import os
+
+from PIL import Image
+
+import config
+import imageindex
+import imaging
+import paths
+
+
+def _write_manifest(images) -> None:
+    config.IMAGE_MANIFEST_FILE.write_text(
+        json.dumps({"version": imaging.MANIFEST_VERSION, "images": images}), encoding="utf-8"
+    )
+
+
+def _creature_image(slug: str):
+    path = paths.creature_image_path(slug)
+    Image.new("RGB", (40, 30)).save(path)
+    return path
+
+
+def test_build_indexes_dimensions(library):
+    _creature_image("ark")
+    assert imageindex.build() == 1
+    info = imageindex.creature_image("ark")
+    assert (info.width, info.height) == (40, 30)
+    assert imageindex.creature_image("missing") is None
+
+
+def test_manifest_lookups_do_not_stat(library, monkeypatch):
+    path = _creature_image("ark")
+    imageindex.build()
+    st = path.stat()
+    _write_manifest({"ark.png": {"sha256": "ab" * 32, "stamp": [st.st_size, st.st_mtime_ns]}})
+    imageindex.load_manifest()
+
+    calls = []
+    real_stat = os.stat
+    monkeypatch.setattr(os, "stat", lambda *a, **k: calls.append(a) or real_stat(*a, **k))
+    image_path = paths.static_url_path(path)
+    assert imaging.manifest_entry(image_path)["sha256"] == "ab" * 32
+    assert imaging.current_hash(image_path) == ("ab" * 32)[: imaging.HASH_CHARS]
+    assert imaging.variant_url(image_path, "thumb").endswith(f"?v={'ab' * 6}")
+    assert calls == []
+
+
+def test_load_manifest_keeps_unchanged_mapping(library):
+    _write_manifest({"ark.png": {"sha256": "1"}})
+    imageindex.load_manifest()
+    held = imageindex.manifest()
+
+    imageindex.load_manifest()  # Same content: same object, so page versions stay equal
+    assert imageindex.manifest() is held
+
+    _write_manifest({"ark.png": {"sha256": "2"}})
+    imageindex.load_manifest()
+    assert imageindex.manifest()["ark.png"]["sha256"] == "2"
+
+    config.IMAGE_MANIFEST_FILE.unlink()
+    assert imageindex.load_manifest() == 0
+
+
+def test_discard_variants_updates_held_manifest(library):
+    path = _creature_image("ark")
+    _write_manifest({"ark.png": {"sha256": "1"}, "other.png": {}})
+    imageindex.load_manifest()
+    variant = paths.variant_path(path, "thumb")
+    variant.write_bytes(b"old")
+
+    imaging.discard_variants(path)
+
+    assert not variant.exists()
+    assert set(imageindex.manifest()) == {"other.png"}
+
+
+def test_portraits_do_not_bump_art_generation(library):
+    legacy = config.IMAGE_DIR / "felix-1746714338-13e412.png"
+    sharded = paths.character_image_path("felix-1746714338-13e412")
+    assert paths.is_character_image(legacy) and paths.is_character_image(sharded)
+    assert not paths.is_character_image(paths.creature_image_path("ark"))
+
+    before = imageindex.art_generation
+    sharded.parent.mkdir(parents=True, exist_ok=True)
+    for path in (legacy, sharded):
+        Image.new("RGB", (8, 8)).save(path)
+        imageindex.refresh(path)
+    _write_manifest({"characters/x/felix-1746714338-13e412.png": {"sha256": "1"}})
+    imageindex.load_manifest()
+    assert imageindex.art_generation == before
+
+    imageindex.refresh(_creature_image("ark"))
+    assert imageindex.art_generation == before + 1
+    _write_manifest({"ark.png": {"sha256": "1"}})
+    imageindex.load_manifest()
+    assert imageindex.art_generation == before + 2
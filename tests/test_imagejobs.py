@@ -0,0 +1,133 @@
+# tests/test_imagejobs.py
+"""Image jobs against the fake AI backend (fakegenai), with short image latencies."""
+
+import asyncio
+
+import pytest
+
+import ai_services
+import config
+import fakegenai
+import imagejobs
+import models
+import storage
+
+
+@pytest.fixture(autouse=True)
+def fake_backend(library, monkeypatch):
+    client = fakegenai.FakeClient(
+        image_latency=fakegenai.Latency("fixed:0.2"), image_size=64, seed=1
+    )
+    monkeypatch.setattr(ai_services, "client", client)
+    monkeypatch.setattr(ai_services, "gateway", ai_services.AIGateway(4, 4, 0, 0.01, 0.05))
+    monkeypatch.setattr(imagejobs, "_jobs", imagejobs.OrderedDict())
+    monkeypatch.setattr(imagejobs, "_pending", {})
+    monkeypatch.setattr(imagejobs, "_semaphore", None)
+    monkeypatch.setattr(config, "IMAGE_JOB_CONCURRENCY", 1)
+    monkeypatch.setattr(config, "IMAGE_JOB_MAX_PENDING", 2)
+    yield client
+    storage.shutdown()
+
+
+def _request(n: int = 0) -> models.GenerateImageRequest:
+    return models.GenerateImageRequest(description=f"A wiry mutant with amber eyes, number {n}")
+
+
+async def _settle() -> None:
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+async def _finished(job: imagejobs.ImageJob) -> imagejobs.ImageJob:
+    async for current in imagejobs.events(job):
+        if current is not None and current.done:
+            return current
+
+
+def test_identical_descriptions_share_one_job():
+    async def scenario():
+        job, deduplicated, mine = imagejobs.submit(_request())
+        again, joined, theirs = imagejobs.submit(_request())
+        assert (deduplicated, joined) == (False, True)
+        assert again is job and job.subscriptions == {mine, theirs}
+        assert imagejobs.pending_count() == 1
+
+        await _finished(job)
+        assert job.state == models.ImageJobState.SUCCEEDED
+        assert job.image_handle is not None
+
+    asyncio.run(scenario())
+    assert len(list(config.GENERATED_IMAGE_DIR.iterdir())) == 1  # One generation, one image
+
+
+def test_pending_jobs_are_capped():
+    async def scenario():
+        first, _, _ = imagejobs.submit(_request(1))
+        second, _, _ = imagejobs.submit(_request(2))
+        with pytest.raises(ai_services.AIServiceBusy):
+            imagejobs.submit(_request(3))
+        assert imagejobs.submit(_request(1))[:2] == (first, True)  # Joining takes no new place
+
+        await _settle()
+        assert first.state == models.ImageJobState.RUNNING  # IMAGE_JOB_CONCURRENCY is 1
+        assert second.state == models.ImageJobState.QUEUED
+
+        await _finished(second)
+        assert first.state == second.state == models.ImageJobState.SUCCEEDED
+        assert imagejobs.pending_count() == 0
+
+    asyncio.run(scenario())
+
+
+def test_shared_job_runs_until_its_last_subscriber_cancels():
+    async def scenario():
+        job, _, mine = imagejobs.submit(_request())
+        _, _, theirs = imagejobs.submit(_request())
+        await _settle()
+
+        assert imagejobs.cancel(job.id, mine) is job
+        await _settle()
+        assert job.state == models.ImageJobState.RUNNING
+        assert not job.task.done()
+
+        imagejobs.cancel(job.id, theirs)
+        await _settle()
+        assert job.state == models.ImageJobState.CANCELLED
+        assert job.task.done()
+        assert imagejobs.pending_count() == 0
+
+        # The description is free again: a new submission starts a new job
+        fresh, deduplicated, _ = imagejobs.submit(_request())
+        assert fresh is not job and not deduplicated
+        await _finished(fresh)
+
+    asyncio.run(scenario())
+
+
+def test_cancel_of_a_finished_job_changes_nothing():
+    async def scenario():
+        job, _, mine = imagejobs.submit(_request())
+        await _finished(job)
+        assert imagejobs.cancel(job.id, mine) is job
+        assert job.state == models.ImageJobState.SUCCEEDED
+        assert imagejobs.cancel("no-such-job", mine) is None
+
+    asyncio.run(scenario())
+
+
+def test_repeated_cancel_withdraws_only_its_own_subscription():
+    async def scenario():
+        job, _, mine = imagejobs.submit(_request())
+        _, _, theirs = imagejobs.submit(_request())
+        await _settle()
+
+        for _ in range(3):  # A retried DELETE, a double click, pagehide firing twice
+            imagejobs.cancel(job.id, mine)
+        imagejobs.cancel(job.id, "someone-elses-guess")
+        await _settle()
+        assert job.state == models.ImageJobState.RUNNING
+        assert job.subscriptions == {theirs}
+
+        assert (await _finished(job)).state == models.ImageJobState.SUCCEEDED
+
+    asyncio.run(scenario())
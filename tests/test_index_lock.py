@@ -0,0 +1,76 @@
+# tests/test_index_lock.py
+"""
+Saves and deletes characters from several processes at once (as several uvicorn
+workers would) and checks that index.json ends up matching the files on disk.
+"""
+
+import json
+import multiprocessing
+from pathlib import Path
+from typing import List
+
+import config
+import paths
+import storage
+import utils
+from tests.conftest import use_library
+
+WORKERS = 6
+SAVES_PER_WORKER = 30
+
+
+def _hammer(root: str, worker: int, start: multiprocessing.Event) -> List[str]:
+    """Saves SAVES_PER_WORKER characters, deleting every third; returns the kept IDs."""
+    use_library(Path(root))
+    start.wait()  # Release every worker at the same moment
+    kept: List[str] = []
+    for i in range(SAVES_PER_WORKER):
+        char_id = utils.new_character_id(f"w{worker} c{i}")
+        data = {"name": f"W{worker} C{i}", "character_type": "Pure Strain Human"}
+        img_path = paths.character_image_path(char_id) if i % 2 else None
+        # Same order as POST /save_character: files first, then the index record
+        storage.save_character_files(
+            paths.character_json_path(char_id),
+            json.dumps(data),
+            img_path,
+            b"not really a png" if img_path else None,
+        )
+        storage.write_index_record(storage.character_summary(char_id, data, i, img_path))
+        if i % 3 == 0:
+            assert storage.delete_character_files(char_id)
+        else:
+            kept.append(char_id)
+    return kept
+
+
+def test_concurrent_saves_and_deletes_keep_every_record(library):
+    ctx = multiprocessing.get_context("spawn")
+    start = ctx.Manager().Event()
+    with ctx.Pool(WORKERS) as pool:
+        pending = [
+            pool.apply_async(_hammer, (str(library), worker, start)) for worker in range(WORKERS)
+        ]
+        start.set()
+        kept = {char_id for result in pending for char_id in result.get(timeout=120)}
+
+    index = json.loads(config.INDEX_FILE.read_text(encoding="utf-8"))
+    index_ids = [rec["id"] for rec in index]
+    on_disk = {char_id for char_id, _ in paths.iter_character_files()}
+
+    assert len(kept) == WORKERS * (SAVES_PER_WORKER - SAVES_PER_WORKER // 3)
+    assert len(index_ids) == len(set(index_ids)), "duplicate index records"
+    assert set(index_ids) == on_disk == kept
+    for rec in index:
+        image = paths.find_character_image(rec["id"])
+        assert rec["image"] == (paths.static_url_path(image) if image else None)
+
+
+def test_rebuild_index_matches_disk(library):
+    for i in range(5):
+        char_id = utils.new_character_id(f"c{i}")
+        storage.save_character_files(paths.character_json_path(char_id), json.dumps({"name": i}))
+    config.INDEX_FILE.write_text("not json", encoding="utf-8")  # Corrupted index
+
+    assert storage.rebuild_index() == 5
+    index = json.loads(config.INDEX_FILE.read_text(encoding="utf-8"))
+    assert {rec["id"] for rec in index} == {char_id for char_id, _ in paths.iter_character_files()}
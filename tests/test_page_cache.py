@@ -0,0 +1,48 @@
+# tests/test_page_cache.py
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import imageindex
+import main
+import paths
+
+
+@pytest.fixture
+def client(library, monkeypatch):
+    main._creature_pages.clear()
+    renders = []
+    render = main._render_page
+    monkeypatch.setattr(
+        main, "_render_page", lambda name, *a, **k: renders.append(name) or render(name, *a, **k)
+    )
+    with TestClient(main.app) as c:
+        c.renders = renders
+        yield c
+
+
+def test_creature_page_survives_portrait_changes(client):
+    first = client.get("/creature_browser")
+    assert first.status_code == 200 and client.renders == [main.CREATURE_TEMPLATE]
+
+    portrait = paths.character_image_path("felix-1746714338-13e412")
+    portrait.parent.mkdir(parents=True)
+    Image.new("RGB", (8, 8)).save(portrait)
+    imageindex.refresh_character("felix-1746714338-13e412")  # As save_character does
+    portrait.unlink()
+    imageindex.refresh_character("felix-1746714338-13e412")  # As delete_character does
+
+    again = client.get("/creature_browser", headers={"If-None-Match": first.headers["etag"]})
+    assert again.status_code == 304
+    assert client.renders == [main.CREATURE_TEMPLATE]
+
+
+def test_creature_page_rerenders_when_creature_art_changes(client):
+    client.get("/creature_browser")
+    slug = next(iter(main.creatures.registry.by_slug))
+    path = paths.creature_image_path(slug)
+    Image.new("RGB", (8, 8)).save(path)
+    imageindex.refresh(path)
+
+    assert client.get("/creature_browser").status_code == 200
+    assert client.renders == [main.CREATURE_TEMPLATE] * 2
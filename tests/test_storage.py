@@ -0,0 +1,51 @@
+# tests/test_storage.py
+import os
+
+import pytest
+
+import storage
+
+
+def _failing_second_replace(monkeypatch):
+    """Makes the second os.replace() in storage fail, as a full disk or a crash would."""
+    replace = os.replace
+    calls = []
+
+    def flaky_replace(src, dst):
+        calls.append(dst)
+        if len(calls) == 2:
+            raise OSError("No space left on device")
+        replace(src, dst)
+
+    monkeypatch.setattr(storage.os, "replace", flaky_replace)
+
+
+def test_commit_files_writes_every_file(tmp_path):
+    image, record = tmp_path / "a.png", tmp_path / "a.json"
+    storage.commit_files([(image, b"image"), (record, b"{}")])
+
+    assert image.read_bytes() == b"image" and record.read_bytes() == b"{}"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.json", "a.png"]
+
+
+def test_failed_overwrite_keeps_the_previous_files(tmp_path, monkeypatch):
+    image, record = tmp_path / "a.png", tmp_path / "a.json"
+    storage.commit_files([(image, b"old image"), (record, b"old")])
+    _failing_second_replace(monkeypatch)
+
+    with pytest.raises(OSError):
+        storage.commit_files([(image, b"new image"), (record, b"new")])
+
+    assert image.read_bytes() == b"old image"
+    assert record.read_bytes() == b"old"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.json", "a.png"]  # No temp files
+
+
+def test_failed_new_group_leaves_nothing(tmp_path, monkeypatch):
+    image, record = tmp_path / "a.png", tmp_path / "a.json"
+    _failing_second_replace(monkeypatch)
+
+    with pytest.raises(OSError):
+        storage.commit_files([(image, b"image"), (record, b"{}")])
+
+    assert list(tmp_path.iterdir()) == []
@@ -5,13 +5,19 @@ import logging
 import random
 import re
 import time
+import uuid
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
+
+from slugify import slugify
 
 import config
 
 # --- Constants ---
 BASE64_HEADER_RE = re.compile(r"^data:image/[^;]+;base64,")
+CHARACTER_ID_RE = re.compile(r"^[a-z0-9][a-z0-9-]{0,80}$")
+CHARACTER_ID_TS_RE = re.compile(r"-(\d{9,})-[0-9a-f]{6}$")
+STAT_RANGE_RE = re.compile(r"^\s*(\d+)(?:\s*[-/]\s*(\d+))?")  # "5", "1-6", "4/6", "12 (water)..."
 
 # --- Logging Setup ---
 logging.basicConfig(
@@ -30,36 +36,12 @@ log = logging.getLogger(__name__)
 
 def ensure_dirs() -> None:
     """Create required data directories if they don’t exist."""
-    log.debug(f"Ensuring directories exist: {config.CHAR_DIR}, {config.IMAGE_DIR}")
+    log.debug(
+        f"Ensuring directories exist: {config.CHAR_DIR}, {config.IMAGE_DIR}, {config.CHARACTER_IMAGE_DIR}"
+    )
     config.CHAR_DIR.mkdir(exist_ok=True)
     config.IMAGE_DIR.mkdir(exist_ok=True)
-
-
-def write_index_record(rec: Dict[str, Any]) -> None:
-    """Append a compact summary of the character to characters/index.json."""
-    idx = []
-    try:
-        if config.INDEX_FILE.exists():
-            with config.INDEX_FILE.open("r", encoding="utf-8") as f:
-                try:
-                    idx = json.load(f)
-                    if not isinstance(idx, list):
-                        log.warning(
-                            f"Index file {config.INDEX_FILE} is corrupted (not a list). Overwriting."
-                        )
-                        idx = []
-                except json.JSONDecodeError:
-                    log.warning(
-                        f"Index file {config.INDEX_FILE} is corrupted (invalid JSON). Overwriting."
-                    )
-                    idx = []
-        idx.append(rec)
-        with config.INDEX_FILE.open("w", encoding="utf-8") as f:
-            json.dump(idx, f, indent=2)
-        log.info(f"Appended character ID {rec.get('id')} to index.")
-    except Exception as e:
-        log.error(f"Could not update index file {config.INDEX_FILE}: {e}", exc_info=True)
-        # Non-fatal, but log as error
+    config.CHARACTER_IMAGE_DIR.mkdir(parents=True, exist_ok=True)  # Shards are created on save
 
 
 def load_data_file(filepath: Path) -> Any:
@@ -102,6 +84,24 @@ def load_mutations(filepath: Path) -> List[Dict[str, Any]]:
         raise ValueError(f"Invalid mutation file structure: {filepath}") from e
 
 
+def new_character_id(name: Optional[str], ts: Optional[int] = None) -> str:
+    """Builds a unique character ID of the form '<name-slug>-<unix-ts>-<6 hex>'."""
+    base_slug = slugify(name or "unnamed", lowercase=True)[:40] or "unnamed"
+    uid_snip = uuid.uuid4().hex[:6]
+    return f"{base_slug}-{int(time.time()) if ts is None else ts}-{uid_snip}"
+
+
+def is_valid_character_id(char_id: str) -> bool:
+    """True if char_id is safe to use as a file name (lowercase slug characters only)."""
+    return bool(CHARACTER_ID_RE.match(char_id))
+
+
+def character_id_timestamp(char_id: str) -> Optional[int]:
+    """Extracts the save timestamp embedded in a character ID, if there is one."""
+    match = CHARACTER_ID_TS_RE.search(char_id)
+    return int(match.group(1)) if match else None
+
+
 # --- Dice Rolling ---
 
 
@@ -136,6 +136,22 @@ def parse_percentage_range(percentage_str: str) -> Tuple[int, int]:
         return (0, 0)  # Return a default or raise an error
 
 
+def parse_stat_range(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    """
+    Parses the leading number or range of a stat string into (min, max):
+    '10' -> (10, 10), '1-6' -> (1, 6), '4/6' -> (4, 6), '5 (8 if ridden)' -> (5, 5).
+    Returns None for non-numeric values like 'N/A'.
+    """
+    if value is None:
+        return None
+    match = STAT_RANGE_RE.match(str(value))
+    if not match:
+        return None
+    low = int(match.group(1))
+    high = int(match.group(2)) if match.group(2) else low
+    return min(low, high), max(low, high)
+
+
 def decode_base64_image(image_data: str) -> bytes:
     """Decodes a base64 image string (stripping header if present)."""
     img_b64 = BASE64_HEADER_RE.sub("", image_data)